@@ -1,27 +1,67 @@
-from flask import Flask
+from flask import Flask, Request
+import io
 from flask_restful import Api
-from resources.user import (RegisterUser, UserLogin, TokenRefresh,
+from resources.user import (RegisterUser, UserLogin, TokenRefresh, UserLogout,
                             ResetPassword, ChangePassword, ValidateEmailAddress, ResendEmailAddressVerificationMail)
-from resources.claims_management import ClaimsList, UpdateClaims
-from resources.user_profile import UserProfile, PublicUserProfile
-from resources.upload import ProfilePictureUpload
+from resources.claims_management import ClaimsList, UpdateClaims, BulkUpdateClaims
+from resources.user_profile import UserProfile, PublicUserProfile, PublicUserProfiles
+from resources.upload import (ProfilePictureUpload, ProfilePictureUploadStatus, DirectProfilePictureUpload,
+                              DirectProfilePictureUploadConfirm)
+from resources.server_metrics import ServerMetrics
+from resources.jwks import JsonWebKeySet
 
 from marshmallow import ValidationError
-from application_error import ApplicationError
-from services.claims import ClaimsManagementService
-from services.user import UserRegistrationService
+from application_error import ApplicationError, RateLimitExceeded
+from services.claims_cache import ClaimsCacheService
+from services.profile_cache import PublicProfileCacheService
+from services.shared_cache import LocalSharedCache, RedisSharedCache
+from services.user_state import UserStateService
+from services.identity import IdentityService
+from services.token_revocation import TokenRevocationService
+from services.signing_keys import SigningKeyRing, SUPPORTED_ALGORITHMS
+from services.rate_limit import RateLimitService, parse_rate_limits
+from schemas.registry import SchemaRegistry
+from services.password_hashing import PasswordHashingService
+from services.email_outbox import EmailDispatcher
+from services.object_gc import ObjectGarbageCollector
+from services.email_transports import SendGridTransport, ConsoleTransport, FakeEmailTransport
+from services.broadcast import LocalInvalidationBroadcast, ChangeStreamInvalidationBroadcast
 
 import os
 from flask_jwt_extended import JWTManager
 from database_manager import DatabaseManager
 from services.aws_s3 import AwsS3
+from services.storage_backends import LocalStorageBackend
+from services.profile_picture import ProfilePictureService
+from services.direct_upload import DirectUploadService
 from flask_cors import CORS
-from constants import JwtClaims
+from services.security import parse_password_hash_params, DEFAULT_ARGON2_PARAMS
 
 
-def create_app(test_mode=False):
-    """Uses factory pattern to create app objects"""
+SERVING_MODES = ("sync", "async")
+
+
+class InMemoryUploadRequest(Request):
+    """Keeps uploaded files in memory, werkzeug spools uploads larger than 500KB to a temporary file.
+    Safe because uploads are limited by MAX_CONTENT_LENGTH"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+def create_app(test_mode=False, mode="sync"):
+    """Uses factory pattern to create app objects.
+    mode="async" is meant for gunicorn's gevent workers: the same resources are served, but all the
+    blocking I/O (pymongo, S3, SendGrid) yields to other requests, so one worker can keep hundreds of
+    requests in flight. Start with:
+    gunicorn -k gevent --worker-connections 500 "app:create_app(mode='async')"
+    """
+    if mode not in SERVING_MODES:
+        raise ValueError(f"Invalid serving mode {mode}, must be one of {SERVING_MODES}")
+    if mode == "async":
+        configure_async_mode()
     app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
 
     # Configure CORS
     # TODO: setup the correct origins
@@ -37,6 +77,11 @@ def create_app(test_mode=False):
     # setup maximum upload file size allowed
     # 2MB
     app.config["MAX_CONTENT_LENGTH"] = 2 * 1024 * 1024
+    # sync: pictures are processed within the upload request, async: by the image workers (scripts/image_worker.py)
+    app.config["PICTURE_UPLOAD_MODE"] = os.environ.get("PICTURE_UPLOAD_MODE", "sync")
+
+    # login & registration payloads are checked by compiled validators first, see SchemaRegistry
+    SchemaRegistry.configure(fast_validation=os.environ.get("SCHEMA_FAST_VALIDATION", "true") == "true")
 
     # test mode config overrides
     if test_mode:
@@ -45,19 +90,47 @@ def create_app(test_mode=False):
         print("Starting server in TESTING mode!")
 
     # configure database
-    configure_database(test_mode)
+    configure_database(test_mode, mode)
+    # configure the password hashing pool
+    configure_password_hashing(test_mode, mode)
+    # configure in-process caches
+    configure_caches(app, test_mode)
+    # configure the throttling of the public endpoints
+    configure_rate_limits(test_mode)
     # configure jwt
-    configure_jwt(app)
+    configure_jwt(app, test_mode)
     # configure error handlers
     configure_error_handlers(app)
+    # configure delivery of the queued mails
+    configure_email_dispatcher(test_mode)
+    if not test_mode and os.environ.get("EMAIL_DISPATCHER", "thread") == "thread":
+        EmailDispatcher.start()
     # configure aws s3 client
     configure_AWS_s3(test_mode)
+    configure_object_gc()
     # Configure api
     configure_api(app)
     return app
 
 
 def configure_AWS_s3(test_mode=False):
+    # local: objects are stored as files, for local development & benchmarks (no direct uploads)
+    if os.environ.get("STORAGE_BACKEND", "s3") == "local":
+        root_dir = os.environ.get("LOCAL_STORAGE_DIR", "local_storage")
+        AwsS3.configure_backend(LocalStorageBackend(root_dir),
+                                base_url=os.environ.get("LOCAL_STORAGE_BASE_URL", f"file://{os.path.abspath(root_dir)}"))
+    else:
+        configure_s3_backend()
+    # pictures uploaded by the clients straight to S3 are not bound by MAX_CONTENT_LENGTH
+    DirectUploadService.configure(max_bytes=int(os.environ.get("DIRECT_UPLOAD_MAX_BYTES", 10 * 1024 * 1024)),
+                                  expires_in_seconds=int(os.environ.get("DIRECT_UPLOAD_EXPIRES_IN", 600)))
+    # every profile picture is stored in several sizes, in each of these formats (jpeg is always included)
+    picture_formats = os.environ.get("PROFILE_PICTURE_FORMATS", "webp,jpeg")
+    ProfilePictureService.configure(formats=[f.strip().lower() for f in picture_formats.split(",") if f.strip()],
+                                    upload_workers=int(os.environ.get("PROFILE_PICTURE_UPLOAD_WORKERS", 6)))
+
+
+def configure_s3_backend():
     # This method is written assuming CloudCube services on Heroku.
     # Env variables might differ in case other methods are used to access S3 buckets
     # NOTE: env variable reflect the naming used by CloudCube
@@ -76,20 +149,167 @@ def configure_AWS_s3(test_mode=False):
                            aws_secret_access_key=aws_secret_access_key,
                            bucket_name=bucket_name,
                            base_url=base_url,
-                           cube_name=cube_name)
+                           cube_name=cube_name,
+                           # S3 compatible stand-in for local development & tests, e.g. MinIO
+                           endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+                           region_name=os.environ.get("AWS_DEFAULT_REGION"),
+                           # shared by the request threads & the picture upload threads of a worker
+                           max_pool_connections=int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 50)),
+                           max_attempts=int(os.environ.get("S3_MAX_ATTEMPTS", 5)),
+                           multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", 8)) * 1024 * 1024,
+                           multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNKSIZE_MB", 8)) * 1024 * 1024,
+                           max_concurrency=int(os.environ.get("S3_TRANSFER_CONCURRENCY", 4)))
 
 
-def configure_database(test_mode=False):
+def configure_async_mode():
+    # gevent is only required for the async mode
+    from gevent import monkey
+    if not monkey.is_module_patched("socket"):
+        # gunicorn's gevent worker patches the standard library before loading the app.
+        # Without it (e.g. flask dev server) every blocking call still blocks the whole process
+        print("WARNING: async mode without gevent monkey patching, use gunicorn -k gevent")
+
+
+def configure_email_dispatcher(test_mode=False):
+    if test_mode:
+        # mails stay in the outbox, tests can deliver them with EmailDispatcher.dispatch_once()
+        EmailDispatcher.configure(transport=FakeEmailTransport())
+        return
+    api_key = os.environ.get("SENDGRID_API_KEY")
+    transport = SendGridTransport(api_key) if api_key is not None else ConsoleTransport()
+    EmailDispatcher.configure(transport=transport,
+                              batch_size=int(os.environ.get("EMAIL_DISPATCHER_BATCH_SIZE", 50)),
+                              max_attempts=int(os.environ.get("EMAIL_DISPATCHER_MAX_ATTEMPTS", 8)))
+
+
+def configure_object_gc():
+    # unreferenced objects are deleted by scripts/object_gc.py after the grace period
+    ObjectGarbageCollector.configure(grace_seconds=int(os.environ.get("OBJECT_GC_GRACE_SECONDS", 3600)),
+                                     batch_size=int(os.environ.get("OBJECT_GC_BATCH_SIZE", 1000)))
+
+
+def configure_database(test_mode=False, mode="sync"):
     connection_uri = os.environ.get("MONGODB_URI")
+    # In async mode a worker has many more requests in flight, each of which may hold a connection
+    default_pool_size = 500 if mode == "async" else 100
+    max_pool_size = int(os.environ.get("MONGODB_MAX_POOL_SIZE", default_pool_size))
+    if test_mode:
+        DatabaseManager.initialize_testing_database(connection_uri, max_pool_size=max_pool_size)
+    else:
+        DatabaseManager.initialize_database(connection_uri, max_pool_size=max_pool_size)
+
+
+def configure_password_hashing(test_mode=False, mode="sync"):
     if test_mode:
-        DatabaseManager.initialize_testing_database(connection_uri)
+        # hash inline with the minimum cost, keeps the test suite fast
+        PasswordHashingService.configure(workers=0, max_pending=0, scheme="argon2",
+                                         params={"time_cost": 1, "memory_cost": 8, "parallelism": 1})
+        return
+    # every gunicorn worker has its own pool, each hash in flight holds memory_cost KiB
+    workers = int(os.environ.get("PASSWORD_HASH_WORKERS", min(2, os.cpu_count() or 1)))
+    scheme = os.environ.get("PASSWORD_HASH_SCHEME", "argon2")
+    # use scripts/calibrate_password_hash.py to find the params for the host
+    params = parse_password_hash_params(os.environ.get("PASSWORD_HASH_PARAMS"))
+    if not params and scheme == "argon2":
+        params = DEFAULT_ARGON2_PARAMS
+    if workers == 0 and mode == "async":
+        # hashing never yields to the gevent hub: every request of the worker waits for it
+        print("Warning: PASSWORD_HASH_WORKERS=0 in async mode, password hashing blocks the whole worker")
+    PasswordHashingService.configure(workers=workers,
+                                     max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", workers * 8)),
+                                     scheme=scheme,
+                                     params=params)
+
+
+def configure_caches(app, test_mode=False):
+    configure_cache_services(test_mode)
+    # max-age of the public profile responses, clients & CDNs revalidate them with the ETag afterwards
+    app.config["PUBLIC_PROFILE_MAX_AGE"] = int(os.environ.get("PUBLIC_PROFILE_MAX_AGE", 60))
+
+    # request scoped memos of the user state & of the caller identity, see UserStateService & IdentityService
+    @app.teardown_request
+    def forget_user_state(exception=None):
+        UserStateService.forget()
+        IdentityService.forget()
+
+
+def configure_cache_services(test_mode=False):
+    """Also called by the image worker processes, which invalidate the public profiles they update"""
+    # Broadcast used to invalidate cache entries on all the workers.
+    # "changestream" requires MongoDB to run as a replica set, "local" only reaches the current worker
+    broadcast_type = os.environ.get("CACHE_INVALIDATION_BROADCAST", "local")
+    if broadcast_type == "changestream" and not test_mode:
+        broadcast = ChangeStreamInvalidationBroadcast()
+    else:
+        broadcast = LocalInvalidationBroadcast()
+    ClaimsCacheService.configure(max_size=int(os.environ.get("CLAIMS_CACHE_MAX_SIZE", 10000)),
+                                 ttl_seconds=int(os.environ.get("CLAIMS_CACHE_TTL_SECONDS", 300)),
+                                 broadcast=broadcast)
+    # responses of the public profile endpoint. The shared tier is optional: redis://... or "local" (stand-in)
+    shared_cache_url = os.environ.get("PUBLIC_PROFILE_SHARED_CACHE")
+    if shared_cache_url == "local" or (shared_cache_url is not None and test_mode):
+        shared_cache = LocalSharedCache()
+    elif shared_cache_url is not None:
+        shared_cache = RedisSharedCache(shared_cache_url, key_prefix="api:")
     else:
-        DatabaseManager.initialize_database(connection_uri)
+        shared_cache = None
+    PublicProfileCacheService.configure(max_size=int(os.environ.get("PUBLIC_PROFILE_CACHE_MAX_SIZE", 10000)),
+                                        ttl_seconds=int(os.environ.get("PUBLIC_PROFILE_CACHE_TTL_SECONDS", 60)),
+                                        broadcast=broadcast,
+                                        shared_cache=shared_cache,
+                                        shared_ttl_seconds=int(os.environ.get("PUBLIC_PROFILE_SHARED_CACHE_TTL_SECONDS",
+                                                                              300)))
 
 
-def configure_jwt(app):
+def configure_rate_limits(test_mode=False):
+    # counters per worker by default, redis://... shares them between all the workers & servers
+    backend_url = os.environ.get("RATE_LIMIT_BACKEND", "local")
+    if backend_url == "local" or test_mode:
+        counters = LocalSharedCache()
+    else:
+        counters = RedisSharedCache(backend_url, key_prefix="api:")
+    RateLimitService.configure(counters=counters,
+                               limits=parse_rate_limits(os.environ.get("RATE_LIMITS")),
+                               trusted_proxies=int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", 0)),
+                               # the test suite logs in far more often than any client should
+                               enabled=not test_mode and os.environ.get("RATE_LIMIT_ENABLED", "true") == "true")
+
+
+def configure_jwt(app, test_mode=False):
     """Uses the Flask-JWT-Extended extension to setup jwt tokens for this application"""
+    # every token is checked against the revoked tokens (rotated refresh tokens & logouts)
+    app.config["JWT_BLACKLIST_ENABLED"] = True
+    app.config["JWT_BLACKLIST_TOKEN_CHECKS"] = ["access", "refresh"]
+    # revocations done by the other workers are seen after at most TOKEN_REVOCATION_SYNC_SECONDS
+    TokenRevocationService.configure(
+        capacity=int(os.environ.get("TOKEN_REVOCATION_FILTER_CAPACITY", 100000)),
+        error_rate=float(os.environ.get("TOKEN_REVOCATION_FILTER_ERROR_RATE", 0.001)),
+        sync_interval_seconds=0 if test_mode else float(os.environ.get("TOKEN_REVOCATION_SYNC_SECONDS", 5)))
+    # RS256/RS384/RS512: tokens are signed by the keys of the JWT_KEY_RING manifest (see SigningKeyRing),
+    # the other services verify them with the keys published at /.well-known/jwks.json
+    algorithm = "HS256" if test_mode else os.environ.get("JWT_ALGORITHM", "HS256")
+    app.config["JWT_ALGORITHM"] = algorithm
+    app.config["JWKS_MAX_AGE"] = int(os.environ.get("JWKS_MAX_AGE", 300))
     jwt = JWTManager(app)
+    if algorithm in SUPPORTED_ALGORITHMS:
+        SigningKeyRing.configure(os.environ.get("JWT_KEY_RING"), algorithm=algorithm,
+                                 reload_interval_seconds=int(os.environ.get("JWT_KEY_RING_RELOAD_SECONDS", 60)))
+
+        @jwt.additional_headers_loader
+        def add_key_id_to_token(identity):
+            return SigningKeyRing.select_signing_key()
+
+        @jwt.encode_key_loader
+        def load_signing_key(identity):
+            return SigningKeyRing.encode_key()
+
+        @jwt.decode_key_loader
+        def load_verification_key(claims, headers):
+            return SigningKeyRing.decode_key(headers.get("kid"))
+
+    @jwt.token_in_blacklist_loader
+    def is_token_revoked(decrypted_token):
+        return TokenRevocationService.is_revoked(decrypted_token["jti"])
 
     # Using the user_claims_loader, we can specify a method that will be
     # called when creating access tokens, and add these claims to the said
@@ -98,16 +318,7 @@ def configure_jwt(app):
     @jwt.user_claims_loader
     def add_claims_to_access_token(user_id):
         """This is the method where you add custom claims to tokens, based on the userId"""
-        claims_dict = ClaimsManagementService.get_user_claims(user_id)
-        is_admin = claims_dict["isAdmin"]
-        is_super_admin = claims_dict["isSuperAdmin"]
-        is_email_address_verified = UserRegistrationService.is_email_address_verified(user_id)
-        # Note: Add other claims as required
-        return {
-            JwtClaims.IS_EMAIL_ADDRESS_VERIFIED: is_email_address_verified,
-            JwtClaims.IS_ADMIN: is_admin,
-            JwtClaims.IS_SUPER_ADMIN: is_super_admin
-        }
+        return IdentityService.token_claims(user_id)
 
 
 def configure_api(app):
@@ -121,6 +332,9 @@ def configure_api(app):
     api.add_resource(ResetPassword, "/resetPassword/<string:email>")
     # token refresh end point
     api.add_resource(TokenRefresh, "/user/refreshToken")
+    api.add_resource(UserLogout, "/user/logout")
+    # public keys of the token signatures
+    api.add_resource(JsonWebKeySet, "/.well-known/jwks.json")
 
     api.add_resource(ResendEmailAddressVerificationMail, "/user/resendEmailVerificationMail")
 
@@ -130,11 +344,17 @@ def configure_api(app):
     # Claim management (super-admin endpoints)
     api.add_resource(ClaimsList, "/management/allClaims")
     api.add_resource(UpdateClaims, "/management/updateClaims")
+    api.add_resource(BulkUpdateClaims, "/management/updateClaims/bulk")
+    api.add_resource(ServerMetrics, "/management/metrics")
 
     # User profile
     api.add_resource(UserProfile, "/user/profile")
     api.add_resource(ProfilePictureUpload, "/user/profile/pictureUpload")
+    api.add_resource(ProfilePictureUploadStatus, "/user/profile/pictureUpload/<string:job_id>")
+    api.add_resource(DirectProfilePictureUpload, "/user/profile/pictureUpload/direct")
+    api.add_resource(DirectProfilePictureUploadConfirm, "/user/profile/pictureUpload/direct/confirm")
     api.add_resource(PublicUserProfile, "/profileById/<string:other_user_id>")
+    api.add_resource(PublicUserProfiles, "/profilesById")
 
 
 def configure_error_handlers(app):
@@ -144,20 +364,20 @@ def configure_error_handlers(app):
         """Return JSON for validation errors"""
         # Validation errors are in form key:[messages]
         # we just turn this into a simple string of format: key - message1; key - message2...
-        message = ""
-        for key in e.messages.keys():
-            value = e.messages[key]
-            message_separator = "; "
-            # if value is list, append all
-            if isinstance(value, list):
-                for entry in value:
-                    message += key.capitalize() + " - " + entry + message_separator
-            elif isinstance(value, str):
-                message += key.capitalize() + " - " + value + message_separator
-        # Remove last "; " from message
-        message = message[: len(message) - len(message_separator)]
+        parts = []
+        for key, value in e.messages.items():
+            entries = [value] if isinstance(value, str) else value
+            if isinstance(entries, list):
+                prefix = str(key).capitalize() + " - "
+                for entry in entries:
+                    parts.append(prefix + str(entry))
+        message = "; ".join(parts)
         return {"message": message}, 400
 
+    @app.errorhandler(RateLimitExceeded)
+    def handle_rate_limit_exceeded(e):
+        return e.to_dict(), e.status_code, {"Retry-After": str(e.retry_after_seconds)}
+
     # Error handler for application errors
     @app.errorhandler(ApplicationError)
     def handle_application_error(e):
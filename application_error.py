@@ -12,3 +12,11 @@ class ApplicationError(Exception):
             "message": self.message,
             "status_code": self.status_code
         }
+
+
+class RateLimitExceeded(ApplicationError):
+    status_code = 429
+
+    def __init__(self, retry_after_seconds):
+        ApplicationError.__init__(self, "Too many requests, please try again later!")
+        self.retry_after_seconds = retry_after_seconds
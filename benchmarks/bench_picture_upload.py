@@ -0,0 +1,109 @@
+"""Compares the in-memory profile picture pipeline of production (render_picture_variants: decode once, every
+size of ProfilePictureService.SIZES in every format of ProfilePictureService.formats) with the original temp file
+based one (a single 400px JPEG). Reports the latency per upload & the peak RSS of a process running only that
+pipeline, for ~2MB JPEG inputs. The S3 uploads are excluded: both pipelines end by reading the bytes boto3 would send.
+
+Usage (from the project root):
+    python -m benchmarks.bench_picture_upload --uploads 50
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image
+from services.image_processing import render_picture_variants, is_format_supported
+from services.profile_picture import ProfilePictureService
+
+MAX_SIZE = 400
+
+
+def make_input_jpeg(target_bytes=2 * 1024 * 1024):
+    """Noisy photo-like JPEG of about target_bytes"""
+    image = Image.effect_noise((2400, 2400), 24).convert("RGB")
+    quality = 95
+    while True:
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality)
+        if output.tell() <= target_bytes or quality <= 30:
+            return output.getvalue()
+        quality -= 5
+
+
+def temp_file_pipeline(data):
+    """Previous implementation: save upload to disk, decode, save resized copy to disk, read it back"""
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        full_file_path = os.path.join(tmpdirname, "upload.jpg")
+        with open(full_file_path, "wb") as upload_file:
+            upload_file.write(data)
+        resized_image_path = os.path.join(tmpdirname, "resized.jpg")
+        image = Image.open(full_file_path)
+        image.thumbnail((MAX_SIZE, MAX_SIZE))
+        if image.mode in ("RGBA", "P"):
+            image = image.convert("RGB")
+        image.save(resized_image_path, quality=95)
+        # boto3 upload_file reads the file back from disk
+        with open(resized_image_path, "rb") as resized_file:
+            return len(resized_file.read())
+
+
+def streaming_pipeline(data):
+    formats = [format for format in ProfilePictureService.formats if is_format_supported(format)]
+    variants = render_picture_variants(io.BytesIO(data), sizes=ProfilePictureService.SIZES, formats=formats)
+    return sum(len(variant.data.read()) for variant in variants)
+
+
+PIPELINES = {"tempfile": temp_file_pipeline, "streaming": streaming_pipeline}
+
+
+def run_pipeline(name, input_path, uploads):
+    """Runs in a dedicated process so that the peak RSS only reflects this pipeline"""
+    with open(input_path, "rb") as input_file:
+        data = input_file.read()
+    pipeline = PIPELINES[name]
+    latencies = []
+    for _ in range(uploads):
+        start = time.perf_counter()
+        pipeline(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    # ru_maxrss is in KB on linux
+    print(json.dumps({
+        "inputBytes": len(data),
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--run", choices=sorted(PIPELINES.keys()), help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run is not None:
+        run_pipeline(args.run, args.input, args.uploads)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        # the input is generated once, outside of the measured processes
+        input_path = os.path.join(tmpdirname, "input.jpg")
+        with open(input_path, "wb") as input_file:
+            input_file.write(make_input_jpeg())
+        print(f"{'pipeline':10} {'input KB':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS MB':>12}")
+        for name in PIPELINES.keys():
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_picture_upload", "--run", name,
+                                     "--input", input_path, "--uploads", str(args.uploads)],
+                                    check=True, capture_output=True, text=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{name:10} {result['inputBytes'] / 1024:9.0f} {result['p50']:8.1f} {result['p99']:8.1f} "
+                  f"{result['peakRssMb']:12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compares the sync & async serving modes on /login and /profileById.
+
+Start both servers against the same database, e.g.
+    gunicorn -w 2 -b 127.0.0.1:8000 "app:create_app()"
+    gunicorn -w 2 -k gevent --worker-connections 500 -b 127.0.0.1:8001 "app:create_app(mode='async')"
+and run (from the project root):
+    python -m benchmarks.bench_serving_modes --sync-url http://127.0.0.1:8000 --async-url http://127.0.0.1:8001
+
+Only the standard library is used on the client side, requests are fired from a thread pool.
+"""
+import argparse
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_EMAIL = "bench-user@example.com"
+BENCH_PASSWORD = "bench-password"
+
+
+def http_call(method, url, payload=None, headers=None):
+    data = None
+    all_headers = {"Content-Type": "application/json"}
+    all_headers.update(headers or {})
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(url, data=data, method=method, headers=all_headers)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def prepare_user(base_url):
+    """Registers the benchmark user (if required), creates its profile and returns its id"""
+    http_call("POST", f"{base_url}/register", {"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    status, body = http_call("POST", f"{base_url}/login", {"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    if status != 200:
+        raise SystemExit(f"Unable to login benchmark user: {status} {body}")
+    access_token = json.loads(body)["accessToken"]
+    http_call("PUT", f"{base_url}/user/profile", {"fullName": "Bench User"},
+              headers={"Authorization": f"Bearer {access_token}"})
+    payload = access_token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))["identity"]
+
+
+def run_load(call, total_requests, concurrency):
+    def timed_call(_):
+        start = time.perf_counter()
+        status, _ = call()
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_call, range(total_requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        "rps": total_requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync-url", required=True)
+    parser.add_argument("--async-url", required=True)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    user_id = prepare_user(args.sync_url)
+    endpoints = {
+        "/login": lambda base_url: http_call("POST", f"{base_url}/login",
+                                             {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}),
+        "/profileById": lambda base_url: http_call("GET", f"{base_url}/profileById/{user_id}")
+    }
+    print(f"{'endpoint':15} {'mode':6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint, call in endpoints.items():
+        for mode, base_url in (("sync", args.sync_url), ("async", args.async_url)):
+            result = run_load(lambda: call(base_url), args.requests, args.concurrency)
+            print(f"{endpoint:15} {mode:6} {result['rps']:9.1f} {result['p50']:9.1f} "
+                  f"{result['p99']:9.1f} {result['errors']:7}")
+
+
+if __name__ == '__main__':
+    main()
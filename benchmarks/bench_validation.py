@@ -0,0 +1,94 @@
+"""Measures the per-request validation overhead of the login & registration payloads:
+a new schema instance per request (previous implementation), the shared SchemaRegistry instance and the compiled
+fast validator, for valid & invalid payloads. Also times the formatting of the validation error message.
+No server or database is needed.
+
+Usage (from the project root):
+    python -m benchmarks.bench_validation --iterations 20000
+"""
+import argparse
+import time
+from marshmallow import ValidationError
+from schemas.registry import SchemaRegistry
+from schemas.user import UserLoginInputSchema, UserRegistrationInputSchema
+
+PAYLOADS = {
+    "login": (UserLoginInputSchema, {"email": "someone@example.com", "password": "correct horse"}),
+    "register": (UserRegistrationInputSchema, {"email": "someone@example.com", "password": "correct horse"}),
+    "register (invalid)": (UserRegistrationInputSchema, {"email": "someone", "password": "123"}),
+}
+
+
+def new_instance_load(schema_class, payload):
+    return schema_class().load(payload)
+
+
+def registry_load(schema_class, payload):
+    return SchemaRegistry.load(schema_class, payload)
+
+
+def fast_load(schema_class, payload):
+    return SchemaRegistry.load(schema_class, payload, fast=True)
+
+
+def concatenated_message(messages):
+    """Previous handle_validation_exception formatting"""
+    message = ""
+    message_separator = "; "
+    for key in messages.keys():
+        value = messages[key]
+        if isinstance(value, list):
+            for entry in value:
+                message += key.capitalize() + " - " + entry + message_separator
+        elif isinstance(value, str):
+            message += key.capitalize() + " - " + value + message_separator
+    return message[: len(message) - len(message_separator)]
+
+
+def joined_message(messages):
+    parts = []
+    for key, value in messages.items():
+        entries = [value] if isinstance(value, str) else value
+        if isinstance(entries, list):
+            prefix = str(key).capitalize() + " - "
+            for entry in entries:
+                parts.append(prefix + str(entry))
+    return "; ".join(parts)
+
+
+def time_per_call(fn, args, iterations):
+    """Microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            fn(*args)
+        except ValidationError:
+            pass
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    print(f"{'payload':20} {'new instance':>14} {'registry':>10} {'fast':>10}   (us per call)")
+    for name, (schema_class, payload) in PAYLOADS.items():
+        timings = [time_per_call(load, (schema_class, payload), args.iterations)
+                   for load in (new_instance_load, registry_load, fast_load)]
+        print(f"{name:20} {timings[0]:14.2f} {timings[1]:10.2f} {timings[2]:10.2f}")
+    try:
+        UserRegistrationInputSchema().load({"email": "someone", "password": "123", "extra": 1})
+    except ValidationError as e:
+        messages = e.messages
+    # the cost of the concatenation grows quadratically with the size of the message
+    large_messages = {f"field{i}": ["Missing data for required field.", "Not a valid string."] for i in range(200)}
+    print(f"{'error message':20} {'concatenated':>14} {'joined':>10}")
+    for name, sample in (("3 errors", messages), ("400 errors", large_messages)):
+        assert concatenated_message(sample) == joined_message(sample)
+        iterations = max(1, args.iterations // len(sample))
+        print(f"{name:20} {time_per_call(concatenated_message, (sample,), iterations):14.2f} "
+              f"{time_per_call(joined_message, (sample,), iterations):10.2f}")
+
+
+if __name__ == '__main__':
+    main()
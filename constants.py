@@ -8,6 +8,8 @@ class User:
     LAST_MODIFIED_AT = "lastModifiedAt"
     EMAIL_VERIFIED = "isVerified"
     VERIFICATION_TOKEN = "verificationToken"
+    # copy of the claimsManagement entry {isAdmin, isSuperAdmin}, kept in sync by ClaimsManagementService
+    CLAIMS = "claims"
 
 
 class PasswordResetTokens:
@@ -38,9 +40,85 @@ class UserProfile:
     OCCUPATION = "occupation"
     LAST_MODIFIED_AT = "lastModifiedAt"
     PICTURE_OBJECT_NAME = "pictureObjectName"
+    # {size: {format: object name}}, e.g. {"48": {"webp": "...", "jpeg": "..."}}
+    PICTURE_VARIANTS = "pictureVariants"
+    # {size: width (px) of the variants of this size}, e.g. {"400": 400, "128": 128, "48": 48}
+    PICTURE_WIDTHS = "pictureWidths"
     MOBILE_NUMBER = "mobileNumber"
 
 
+class EmailOutbox:
+    COLLECTION_NAME = "emailOutbox"
+    TO = "to"
+    SUBJECT = "subject"
+    BODY = "body"
+    STATUS = "status"
+    ATTEMPTS = "attempts"
+    NEXT_ATTEMPT_AT = "nextAttemptAt"
+    LOCKED_UNTIL = "lockedUntil"
+    # lease token of the claim_batch call which claimed the mail
+    LOCKED_BY = "lockedBy"
+    LAST_ERROR = "lastError"
+    CREATED_AT = "createdAt"
+    SENT_AT = "sentAt"
+    # values of STATUS
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_DEAD = "dead"
+
+
+class ImageJobs:
+    COLLECTION_NAME = "imageJobs"
+    USER_ID = "userId"
+    PAYLOAD = "payload"
+    # jobs of direct uploads (DirectUploadService) refer to the uploaded S3 object instead of a payload
+    STAGING_KEY = "stagingKey"
+    STATUS = "status"
+    ATTEMPTS = "attempts"
+    LOCKED_UNTIL = "lockedUntil"
+    OBJECT_NAME = "objectName"
+    ERROR = "error"
+    CREATED_AT = "createdAt"
+    FINISHED_AT = "finishedAt"
+    # values of STATUS
+    STATUS_QUEUED = "queued"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+
+class PictureObjects:
+    """Reference counted index of the content addressed picture objects, _id is the object name"""
+    COLLECTION_NAME = "pictureObjects"
+    REF_COUNT = "refCount"
+    # False until the first upload of the object succeeded (missing on the entries created before the flag)
+    UPLOADED = "uploaded"
+    # set while the garbage collector deletes the object, until the end of its lease
+    DELETING_UNTIL = "deletingUntil"
+    CONTENT_TYPE = "contentType"
+    SIZE = "size"
+    CREATED_AT = "createdAt"
+
+
+class OrphanedObjects:
+    """Stored objects nothing refers to anymore, deleted in batches by ObjectGarbageCollector. _id is the object name"""
+    COLLECTION_NAME = "orphanedObjects"
+    ORPHANED_AT = "orphanedAt"
+    DELETE_AFTER = "deleteAfter"
+    ATTEMPTS = "attempts"
+    LAST_ERROR = "lastError"
+
+
+class RevokedTokens:
+    """Revoked JWTs (rotated refresh tokens, logouts), _id is the jti. Removed by mongo once the token expires"""
+    COLLECTION_NAME = "revokedTokens"
+    USER_ID = "userId"
+    TOKEN_TYPE = "tokenType"
+    REVOKED_AT = "revokedAt"
+    EXPIRES_AT = "expiresAt"
+
+
 class JwtClaims:
     IS_EMAIL_ADDRESS_VERIFIED = "isEmailAddressVerified"
     IS_ADMIN = "isAdmin"
@@ -0,0 +1,148 @@
+# Declarative registry of the indexes required by the services, reconciled by DatabaseManager at startup.
+# AUDITED_QUERIES lists the shape of every hot service query, scripts/index_audit.py runs explain() on them
+# and flags the ones which are not served by an index.
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from constants import (User, PasswordResetTokens, ClaimsManagement, UserProfile, EmailOutbox, ImageJobs,
+                       OrphanedObjects, RevokedTokens)
+
+# delivered mails are kept for a week
+SENT_EMAIL_RETENTION_SECONDS = 7 * 24 * 60 * 60
+# finished image jobs are kept for a day, clients poll their status
+FINISHED_IMAGE_JOB_RETENTION_SECONDS = 24 * 60 * 60
+# reset tokens are kept for a day after expiry (useful while debugging support requests) & then removed by mongo
+PASSWORD_RESET_TOKEN_RETENTION_SECONDS = 24 * 60 * 60
+
+
+class IndexSpec:
+    def __init__(self, collection_name, keys, unique=False, expire_after_seconds=None):
+        self.collection_name = collection_name
+        self.keys = keys
+        self.unique = unique
+        self.expire_after_seconds = expire_after_seconds
+
+    @property
+    def name(self):
+        # same naming convention as pymongo, so that indexes created earlier are recognized
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def options(self):
+        options = {"name": self.name}
+        if self.unique:
+            options["unique"] = True
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        return options
+
+    def matches_keys(self, index_info):
+        """index_info is an entry of Collection.index_information()"""
+        existing_keys = [(field, int(direction)) for field, direction in index_info["key"]]
+        return existing_keys == list(self.keys) and index_info.get("unique", False) == self.unique
+
+    def matches(self, index_info):
+        return self.matches_keys(index_info) and index_info.get("expireAfterSeconds") == self.expire_after_seconds
+
+
+INDEXES = [
+    # login, registration & password reset look users up by email
+    IndexSpec(User.COLLECTION_NAME, [(User.EMAIL, ASCENDING)], unique=True),
+    # every field of the reset token lookup, equality fields first & the range on validTill last
+    IndexSpec(PasswordResetTokens.COLLECTION_NAME, [(PasswordResetTokens.USERID, ASCENDING),
+                                                    (PasswordResetTokens.TOKEN, ASCENDING),
+                                                    (PasswordResetTokens.IS_CONSUMED, ASCENDING),
+                                                    (PasswordResetTokens.VALID_TILL, ASCENDING)]),
+    # TTL index, expired reset tokens are deleted by mongo
+    IndexSpec(PasswordResetTokens.COLLECTION_NAME, [(PasswordResetTokens.VALID_TILL, ASCENDING)],
+              expire_after_seconds=PASSWORD_RESET_TOKEN_RETENTION_SECONDS),
+    IndexSpec(ClaimsManagement.COLLECTION_NAME, [(ClaimsManagement.USER_ID, ASCENDING)], unique=True),
+    IndexSpec(UserProfile.COLLECTION_NAME, [(UserProfile.USERID, ASCENDING)], unique=True),
+    # covers the freshness check of conditional profile requests (UserProfilesRepository.get_version)
+    IndexSpec(UserProfile.COLLECTION_NAME, [(UserProfile.USERID, ASCENDING), (UserProfile.LAST_MODIFIED_AT, ASCENDING),
+                                            (UserProfile.PICTURE_OBJECT_NAME, ASCENDING)]),
+    # dispatcher claims due mails (and mails with an expired lease) in nextAttemptAt order
+    IndexSpec(EmailOutbox.COLLECTION_NAME, [(EmailOutbox.STATUS, ASCENDING), (EmailOutbox.NEXT_ATTEMPT_AT, ASCENDING)]),
+    IndexSpec(EmailOutbox.COLLECTION_NAME, [(EmailOutbox.STATUS, ASCENDING), (EmailOutbox.LOCKED_UNTIL, ASCENDING)]),
+    # TTL index, only delivered mails have sentAt
+    IndexSpec(EmailOutbox.COLLECTION_NAME, [(EmailOutbox.SENT_AT, ASCENDING)],
+              expire_after_seconds=SENT_EMAIL_RETENTION_SECONDS),
+    # image workers claim the oldest queued job
+    IndexSpec(ImageJobs.COLLECTION_NAME, [(ImageJobs.STATUS, ASCENDING), (ImageJobs.CREATED_AT, ASCENDING)]),
+    # TTL index, only finished jobs have finishedAt
+    IndexSpec(ImageJobs.COLLECTION_NAME, [(ImageJobs.FINISHED_AT, ASCENDING)],
+              expire_after_seconds=FINISHED_IMAGE_JOB_RETENTION_SECONDS),
+    # garbage collector deletes the due orphans, oldest first
+    IndexSpec(OrphanedObjects.COLLECTION_NAME, [(OrphanedObjects.DELETE_AFTER, ASCENDING)]),
+    # TTL index, a revoked token is rejected anyway once it expires
+    IndexSpec(RevokedTokens.COLLECTION_NAME, [(RevokedTokens.EXPIRES_AT, ASCENDING)], expire_after_seconds=0),
+    # incremental sync of the revocation filters
+    IndexSpec(RevokedTokens.COLLECTION_NAME, [(RevokedTokens.REVOKED_AT, ASCENDING)]),
+]
+
+
+class AuditedQuery:
+    def __init__(self, description, collection_name, query, projection=None):
+        self.description = description
+        self.collection_name = collection_name
+        self.query = query
+        self.projection = projection
+
+
+AUDITED_QUERIES = [
+    AuditedQuery("user state by email (login)", User.COLLECTION_NAME, {User.EMAIL: "audit@example.com"}),
+    AuditedQuery("user state by id (token claims)", User.COLLECTION_NAME, {"_id": ObjectId()}),
+    AuditedQuery("is email used (registration)", User.COLLECTION_NAME, {User.EMAIL: "audit@example.com"},
+                 projection={"_id": 0, User.EMAIL: 1}),
+    AuditedQuery("password reset token", PasswordResetTokens.COLLECTION_NAME, {
+        PasswordResetTokens.USERID: "audit",
+        PasswordResetTokens.TOKEN: "audit",
+        PasswordResetTokens.IS_CONSUMED: False,
+        PasswordResetTokens.VALID_TILL: {"$gte": datetime.utcnow()}
+    }),
+    AuditedQuery("claims by user id", ClaimsManagement.COLLECTION_NAME, {ClaimsManagement.USER_ID: "audit"}),
+    AuditedQuery("claims page (keyset on _id)", ClaimsManagement.COLLECTION_NAME, {"_id": {"$gt": ObjectId()}}),
+    AuditedQuery("profile by user id", UserProfile.COLLECTION_NAME, {UserProfile.USERID: "audit"}),
+    AuditedQuery("profile version (conditional requests)", UserProfile.COLLECTION_NAME, {UserProfile.USERID: "audit"},
+                 projection={"_id": 0, UserProfile.LAST_MODIFIED_AT: 1, UserProfile.PICTURE_OBJECT_NAME: 1}),
+    AuditedQuery("due mails", EmailOutbox.COLLECTION_NAME, {EmailOutbox.STATUS: EmailOutbox.STATUS_PENDING,
+                                                           EmailOutbox.NEXT_ATTEMPT_AT: {"$lte": datetime.utcnow()}}),
+    AuditedQuery("queued image jobs", ImageJobs.COLLECTION_NAME, {ImageJobs.STATUS: ImageJobs.STATUS_QUEUED}),
+    AuditedQuery("due orphaned objects", OrphanedObjects.COLLECTION_NAME,
+                 {OrphanedObjects.DELETE_AFTER: {"$lte": datetime.utcnow()}}, projection={"_id": 1}),
+    AuditedQuery("revoked tokens since (revocation filter sync)", RevokedTokens.COLLECTION_NAME,
+                 {RevokedTokens.REVOKED_AT: {"$gte": datetime.utcnow()}}, projection={"_id": 1}),
+]
+
+
+def reconcile_indexes(db, index_specs=None):
+    """Creates the missing indexes & fixes the ones whose options changed.
+    Indexes which are not a part of the registry are reported but never dropped."""
+    if index_specs is None:
+        index_specs = INDEXES
+    collection_names = {spec.collection_name for spec in index_specs}
+    for collection_name in collection_names:
+        specs = [spec for spec in index_specs if spec.collection_name == collection_name]
+        existing = db[collection_name].index_information()
+        for spec in specs:
+            index_info = existing.get(spec.name)
+            if index_info is not None and spec.matches(index_info):
+                continue
+            try:
+                if index_info is not None:
+                    if spec.matches_keys(index_info) and "expireAfterSeconds" in index_info \
+                            and spec.expire_after_seconds is not None:
+                        # only the TTL changed, can be modified in place
+                        db.command("collMod", collection_name, index={"keyPattern": dict(spec.keys),
+                                                                      "expireAfterSeconds": spec.expire_after_seconds})
+                        continue
+                    print(f"Recreating index {collection_name}.{spec.name}, options changed")
+                    db[collection_name].drop_index(spec.name)
+                db[collection_name].create_index(spec.keys, **spec.options())
+            except OperationFailure as e:
+                # e.g. duplicate emails prevent the unique index. Do not stop the server, the audit reports it
+                print(f"Unable to create index {collection_name}.{spec.name}: {e}")
+        known_names = {spec.name for spec in specs} | {"_id_"}
+        for name in existing.keys():
+            if name not in known_names:
+                print(f"Index {collection_name}.{name} is not a part of the index registry")
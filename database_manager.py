@@ -1,5 +1,5 @@
 from pymongo import MongoClient, database
-from constants import ClaimsManagement, UserProfile
+from database_indexes import reconcile_indexes
 
 TEST_DATABASE_NAME = "test_mb_database"
 
@@ -8,8 +8,8 @@ class DatabaseManager:
     db: database.Database = None
 
     @classmethod
-    def initialize_database(cls, connection_uri):
-        cls.mongoClient = MongoClient(connection_uri)
+    def initialize_database(cls, connection_uri, max_pool_size=100):
+        cls.mongoClient = MongoClient(connection_uri, maxPoolSize=max_pool_size)
         # TODO: change the default db name (used in case the connection uri does not specify the database)
         cls.db = cls.mongoClient.get_default_database(default="marchingbytes")
         print(f"Connected to database: {cls.db.name}")
@@ -17,9 +17,9 @@ class DatabaseManager:
         cls.__createIndexes__()
 
     @classmethod
-    def initialize_testing_database(cls, connection_uri):
+    def initialize_testing_database(cls, connection_uri, max_pool_size=100):
         print(f"Connecting to testing database: {TEST_DATABASE_NAME} at {connection_uri}")
-        cls.mongoClient = MongoClient(connection_uri)
+        cls.mongoClient = MongoClient(connection_uri, maxPoolSize=max_pool_size)
         cls.db = cls.mongoClient[TEST_DATABASE_NAME]
         cls.__createIndexes__()
 
@@ -30,8 +30,5 @@ class DatabaseManager:
 
     @classmethod
     def __createIndexes__(cls):
-        """Creates the required indexes on the collections"""
-        # add a unique userId index to claims management collection
-        cls.db[ClaimsManagement.COLLECTION_NAME].create_index(ClaimsManagement.USER_ID, unique=True)
-        # add a unique userId index to user profile
-        cls.db[UserProfile.COLLECTION_NAME].create_index(UserProfile.USERID, unique=True)
+        """Creates the required indexes on the collections, as declared in database_indexes.INDEXES"""
+        reconcile_indexes(cls.db)
@@ -0,0 +1,59 @@
+# Process wide, in-memory metrics. Every gunicorn worker keeps its own values.
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    _lock = threading.Lock()
+    _counters = {}
+    _gauges = {}
+    _timers = {}
+
+    @classmethod
+    def increment(cls, name, value=1):
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+
+    @classmethod
+    def set_gauge(cls, name, value):
+        with cls._lock:
+            cls._gauges[name] = value
+
+    @classmethod
+    def observe(cls, name, seconds):
+        """Records the duration of one operation"""
+        with cls._lock:
+            timer = cls._timers.setdefault(name, {"count": 0, "totalMs": 0.0, "maxMs": 0.0})
+            milliseconds = seconds * 1000
+            timer["count"] += 1
+            timer["totalMs"] += milliseconds
+            timer["maxMs"] = max(timer["maxMs"], milliseconds)
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - start)
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            timers = {}
+            for name, timer in cls._timers.items():
+                timers[name] = dict(timer, avgMs=timer["totalMs"] / timer["count"])
+            return {
+                "counters": dict(cls._counters),
+                "gauges": dict(cls._gauges),
+                "timers": timers
+            }
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._counters.clear()
+            cls._gauges.clear()
+            cls._timers.clear()
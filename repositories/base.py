@@ -0,0 +1,56 @@
+from database_manager import DatabaseManager as DM
+
+
+class Record:
+    """Read-only view over the fields of a mongo document needed by one access path.
+    Subclasses declare FIELDS as {attribute: (document key, default)} and list the same attributes
+    in __slots__. The projection sent to mongo is derived from FIELDS, so only those fields travel
+    over the wire and get decoded."""
+    __slots__ = ()
+    FIELDS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        assert set(cls.__slots__) == set(cls.FIELDS.keys()), f"{cls.__name__}: __slots__ must match FIELDS"
+        document_keys = [key for key, _ in cls.FIELDS.values()]
+        projection = {key: 1 for key in document_keys}
+        if "_id" not in document_keys:
+            # _id is returned unless excluded explicitly
+            projection["_id"] = 0
+        cls.PROJECTION = projection
+
+    @classmethod
+    def from_document(cls, doc):
+        record = cls.__new__(cls)
+        for attribute, (key, default) in cls.FIELDS.items():
+            setattr(record, attribute, doc.get(key, default))
+        return record
+
+    def to_dict(self):
+        return {attribute: getattr(self, attribute) for attribute in self.FIELDS.keys()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class Repository:
+    """Base class for the collection specific repositories. Every query goes through
+    find_one / find with the record type describing the fields required by the caller."""
+    COLLECTION_NAME = None
+
+    @classmethod
+    def collection(cls):
+        return DM.db[cls.COLLECTION_NAME]
+
+    @classmethod
+    def find_one(cls, record_type, query):
+        doc = cls.collection().find_one(query, projection=record_type.PROJECTION)
+        if doc is None:
+            return None
+        return record_type.from_document(doc)
+
+    @classmethod
+    def find(cls, record_type, query, sort=None, limit=0):
+        cursor = cls.collection().find(query, projection=record_type.PROJECTION, sort=sort, limit=limit)
+        for doc in cursor:
+            yield record_type.from_document(doc)
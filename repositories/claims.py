@@ -0,0 +1,34 @@
+from pymongo import ASCENDING
+from repositories.base import Record, Repository
+from constants import ClaimsManagement
+
+
+class ClaimsEntry(Record):
+    __slots__ = ("id", "user_id", "is_admin", "is_super_admin", "last_modified_by", "last_modified_at")
+    FIELDS = {
+        "id": ("_id", None),
+        "user_id": (ClaimsManagement.USER_ID, None),
+        "is_admin": (ClaimsManagement.IS_ADMIN, False),
+        "is_super_admin": (ClaimsManagement.IS_SUPER_ADMIN, False),
+        "last_modified_by": (ClaimsManagement.LAST_MODIFIED_BY, None),
+        "last_modified_at": (ClaimsManagement.LAST_MODIFIED_AT, None)
+    }
+
+
+class ClaimsRepository(Repository):
+    COLLECTION_NAME = ClaimsManagement.COLLECTION_NAME
+
+    @classmethod
+    def list_entries(cls, is_admin=None, is_super_admin=None, modified_since=None, after_id=None, limit=0):
+        """Yields the entries matching the filters (None: not filtered) in _id order, starting after after_id.
+        Keyset pagination: every page is an index range scan, however deep the page"""
+        query = {}
+        if is_admin is not None:
+            query[ClaimsManagement.IS_ADMIN] = is_admin
+        if is_super_admin is not None:
+            query[ClaimsManagement.IS_SUPER_ADMIN] = is_super_admin
+        if modified_since is not None:
+            query[ClaimsManagement.LAST_MODIFIED_AT] = {"$gte": modified_since}
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        return cls.find(ClaimsEntry, query, sort=[("_id", ASCENDING)], limit=limit)
@@ -0,0 +1,89 @@
+from repositories.base import Record, Repository
+from constants import UserProfile
+
+
+class FullProfile(Record):
+    """Profile as seen by its owner"""
+    __slots__ = ("user_id", "full_name", "age", "country", "city", "gender", "occupation", "mobile_number",
+                 "picture_object_name", "picture_variants", "picture_widths", "last_modified_at")
+    FIELDS = {
+        "user_id": (UserProfile.USERID, ""),
+        "full_name": (UserProfile.FULL_NAME, ""),
+        "age": (UserProfile.AGE, 99),
+        "country": (UserProfile.COUNTRY, ""),
+        "city": (UserProfile.CITY, ""),
+        "gender": (UserProfile.GENDER, "undecided"),
+        "occupation": (UserProfile.OCCUPATION, ""),
+        "mobile_number": (UserProfile.MOBILE_NUMBER, 0),
+        "picture_object_name": (UserProfile.PICTURE_OBJECT_NAME, None),
+        "picture_variants": (UserProfile.PICTURE_VARIANTS, None),
+        "picture_widths": (UserProfile.PICTURE_WIDTHS, None),
+        "last_modified_at": (UserProfile.LAST_MODIFIED_AT, None)
+    }
+
+
+class PublicProfile(Record):
+    """Subset of the profile visible to other users"""
+    __slots__ = ("user_id", "full_name", "country", "city", "picture_object_name", "picture_variants",
+                 "picture_widths", "last_modified_at")
+    FIELDS = {
+        "user_id": (UserProfile.USERID, ""),
+        "full_name": (UserProfile.FULL_NAME, ""),
+        "country": (UserProfile.COUNTRY, ""),
+        "city": (UserProfile.CITY, ""),
+        "picture_object_name": (UserProfile.PICTURE_OBJECT_NAME, None),
+        "picture_variants": (UserProfile.PICTURE_VARIANTS, None),
+        "picture_widths": (UserProfile.PICTURE_WIDTHS, None),
+        "last_modified_at": (UserProfile.LAST_MODIFIED_AT, None)
+    }
+
+
+class ProfileVersion(Record):
+    """Freshness check of conditional requests, covered by the (userId, lastModifiedAt, pictureObjectName) index"""
+    __slots__ = ("last_modified_at", "picture_object_name")
+    FIELDS = {
+        "last_modified_at": (UserProfile.LAST_MODIFIED_AT, None),
+        "picture_object_name": (UserProfile.PICTURE_OBJECT_NAME, None)
+    }
+
+
+class ProfilePicture(Record):
+    __slots__ = ("picture_object_name", "picture_variants")
+    FIELDS = {
+        "picture_object_name": (UserProfile.PICTURE_OBJECT_NAME, None),
+        "picture_variants": (UserProfile.PICTURE_VARIANTS, None)
+    }
+
+    def object_names(self):
+        """The stored objects of the picture, one entry per reference held (identical variants share an object).
+        The default picture is one of the variants, unless the picture predates them"""
+        if self.picture_variants:
+            return [object_name for formats in self.picture_variants.values() for object_name in formats.values()]
+        if self.picture_object_name:
+            return [self.picture_object_name]
+        return []
+
+
+class UserProfilesRepository(Repository):
+    COLLECTION_NAME = UserProfile.COLLECTION_NAME
+
+    @classmethod
+    def get_full_profile(cls, user_id):
+        return cls.find_one(FullProfile, {UserProfile.USERID: user_id})
+
+    @classmethod
+    def get_public_profile(cls, user_id):
+        return cls.find_one(PublicProfile, {UserProfile.USERID: user_id})
+
+    @classmethod
+    def get_public_profiles(cls, user_ids):
+        """Single query for all the user ids, yields the existing profiles (in no particular order)"""
+        return cls.find(PublicProfile, {UserProfile.USERID: {"$in": list(user_ids)}})
+
+    @classmethod
+    def get_picture(cls, user_id):
+        return cls.find_one(ProfilePicture, {UserProfile.USERID: user_id})
+
+    @classmethod
+    def get_version(cls, user_id):
+        return cls.find_one(ProfileVersion, {UserProfile.USERID: user_id})
@@ -0,0 +1,65 @@
+from repositories.base import Record, Repository
+from constants import User, ClaimsManagement
+from bson.objectid import ObjectId
+
+
+class UserState(Record):
+    """Everything required to issue tokens"""
+    __slots__ = ("id", "email", "password_hash", "is_verified", "claims")
+    FIELDS = {
+        "id": ("_id", None),
+        "email": (User.EMAIL, None),
+        "password_hash": (User.PASSWORD_HASH, None),
+        "is_verified": (User.EMAIL_VERIFIED, False),
+        "claims": (User.CLAIMS, None)
+    }
+
+    @property
+    def user_id(self):
+        return str(self.id)
+
+    @property
+    def is_admin(self):
+        return (self.claims or {}).get(ClaimsManagement.IS_ADMIN, False)
+
+    @property
+    def is_super_admin(self):
+        return (self.claims or {}).get(ClaimsManagement.IS_SUPER_ADMIN, False)
+
+
+class UserVerification(Record):
+    __slots__ = ("id", "email", "is_verified", "verification_token")
+    FIELDS = {
+        "id": ("_id", None),
+        "email": (User.EMAIL, None),
+        "is_verified": (User.EMAIL_VERIFIED, False),
+        "verification_token": (User.VERIFICATION_TOKEN, None)
+    }
+
+
+class UserId(Record):
+    __slots__ = ("id",)
+    FIELDS = {"id": ("_id", None)}
+
+
+class UsersRepository(Repository):
+    COLLECTION_NAME = User.COLLECTION_NAME
+
+    @classmethod
+    def get_state(cls, query):
+        return cls.find_one(UserState, query)
+
+    @classmethod
+    def get_verification_by_id(cls, user_id):
+        return cls.find_one(UserVerification, {"_id": ObjectId(user_id)})
+
+    @classmethod
+    def get_verification_by_email(cls, email):
+        return cls.find_one(UserVerification, {User.EMAIL: email})
+
+    @classmethod
+    def get_id_by_email(cls, email):
+        record = cls.find_one(UserId, {User.EMAIL: email})
+        if record is None:
+            return None
+        return str(record.id)
@@ -1,28 +1,66 @@
+import json
+from datetime import datetime
+from flask import Response
 from flask_restful import Resource, request
+from marshmallow import ValidationError
 from application_error import ApplicationError
 from services.security import super_admin_required, admin_required
 from services.claims import ClaimsManagementService
-from flask_jwt_extended import (
-    get_jwt_identity,
-    jwt_required
-)
-from schemas.claims import UserClaimsUpdateSchema
+from services.identity import IdentityService
+from schemas.claims import UserClaimsUpdateSchema, ClaimsListQuerySchema, MAX_CLAIMS_UPDATES_PER_REQUEST
+from schemas.registry import SchemaRegistry
+from date_utils import pymongo_naive_utc_datetime_to_ms
+
+
+def __claims_entry_dict__(entry):
+    return {
+        "userId": entry.user_id,
+        "isAdmin": entry.is_admin,
+        "isSuperAdmin": entry.is_super_admin,
+        "lastModifiedBy": entry.last_modified_by,
+        "lastModifiedAt": pymongo_naive_utc_datetime_to_ms(entry.last_modified_at)
+        if entry.last_modified_at is not None else None
+    }
+
+
+def __stream_ndjson__(entries):
+    for entry in entries:
+        yield json.dumps(__claims_entry_dict__(entry)) + "\n"
 
 
 class ClaimsList(Resource):
     # Only super admin can get a list of claims saved for the users
     @super_admin_required
     def get(self):
-        """Gets list of all claims registered in the application"""
-        return ClaimsManagementService.get_all_entries()
+        """
+        Pages of the claims registered in the application, filtered by the query string (ClaimsListQuerySchema).
+        Response: {"items": [...], "nextCursor": ...}, pass nextCursor as cursor to get the next page (null on the
+        last page). format=ndjson streams every matching entry instead
+        """
+        args = SchemaRegistry.load(ClaimsListQuerySchema, request.args)
+        filters = {
+            "is_admin": args.get("isAdmin"),
+            "is_super_admin": args.get("isSuperAdmin"),
+            "modified_since": datetime.utcfromtimestamp(args["modifiedSince"] / 1000)
+            if "modifiedSince" in args else None
+        }
+        if args["format"] == "ndjson":
+            return Response(__stream_ndjson__(ClaimsManagementService.export_entries(**filters)),
+                            mimetype="application/x-ndjson")
+        entries, next_cursor = ClaimsManagementService.list_entries(limit=args["limit"], cursor=args.get("cursor"),
+                                                                    **filters)
+        return {
+            "items": [__claims_entry_dict__(entry) for entry in entries],
+            "nextCursor": next_cursor
+        }
 
 
 class UpdateClaims(Resource):
     # Only super admin can update the claims list
     @super_admin_required
     def put(self):
-        current_user_id = get_jwt_identity()
-        data = UserClaimsUpdateSchema().load(request.json)
+        current_user_id = IdentityService.current().user_id
+        data = SchemaRegistry.load(UserClaimsUpdateSchema, request.json)
         user_id = data["userId"]
         is_admin = data["isAdmin"]
         is_super_admin = data["isSuperAdmin"]
@@ -32,3 +70,33 @@ class UpdateClaims(Resource):
                                               updated_by_user_id=current_user_id)
         return {}, 200
 
+
+class BulkUpdateClaims(Resource):
+    # Only super admin can update the claims list
+    @super_admin_required
+    def put(self):
+        """
+        Body: JSON array of UserClaimsUpdateSchema objects (up to MAX_CLAIMS_UPDATES_PER_REQUEST, one per user).
+        Nothing is written if any item is invalid. Otherwise returns {"results": [...]}, one
+        {"userId", "status": "ok"|"error", "message"} per item, in the same order
+        """
+        current_user_id = IdentityService.current().user_id
+        payload = request.json
+        if not isinstance(payload, list) or not 1 <= len(payload) <= MAX_CLAIMS_UPDATES_PER_REQUEST:
+            raise ApplicationError(f"Expected a list of 1 to {MAX_CLAIMS_UPDATES_PER_REQUEST} claims updates!")
+        try:
+            items = SchemaRegistry.load(UserClaimsUpdateSchema, payload, many=True)
+        except ValidationError as e:
+            # {index: {field: [messages]}}, the generic handler only formats flat messages
+            return {"message": "Invalid claims updates, nothing was updated", "errors": e.messages}, 400
+        user_ids = [item["userId"] for item in items]
+        if len(set(user_ids)) != len(user_ids):
+            # the order of an unordered bulk write is undefined, the last update of a user would not always win
+            raise ApplicationError("Each user can only be updated once per request!")
+        errors = ClaimsManagementService.bulk_update_claims(
+            [(item["userId"], item["isAdmin"], item["isSuperAdmin"]) for item in items],
+            updated_by_user_id=current_user_id)
+        return {
+            "results": [{"userId": user_id, "status": "ok" if error is None else "error", "message": error}
+                        for user_id, error in zip(user_ids, errors)]
+        }, 200
@@ -0,0 +1,18 @@
+from flask import current_app, Response
+from flask_restful import Resource, request
+from application_error import ApplicationError
+from services.signing_keys import SigningKeyRing, SUPPORTED_ALGORITHMS
+
+
+class JsonWebKeySet(Resource):
+    def get(self):
+        """Public keys verifying the tokens issued by this API, for the other services (selected by the kid header
+        of the tokens). Keys are published before they start signing, caching the set for max-age is safe"""
+        if current_app.config["JWT_ALGORITHM"] not in SUPPORTED_ALGORITHMS:
+            raise ApplicationError("Tokens are not signed with public keys!", 404)
+        jwks, etag = SigningKeyRing.jwks()
+        headers = {"ETag": f'"{etag}"',
+                   "Cache-Control": f"public, max-age={current_app.config['JWKS_MAX_AGE']}"}
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        return jwks, 200, headers
@@ -0,0 +1,11 @@
+from flask_restful import Resource
+from services.security import super_admin_required
+from metrics import Metrics
+
+
+class ServerMetrics(Resource):
+    # Only super admin can read the metrics
+    @super_admin_required
+    def get(self):
+        """Metrics of the worker process which served this request"""
+        return Metrics.snapshot()
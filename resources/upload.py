@@ -1,17 +1,15 @@
+from flask import current_app
 from flask_restful import Resource, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from application_error import ApplicationError
-from werkzeug.utils import secure_filename
-import tempfile
-import os
 from services.aws_s3 import AwsS3
+from services.profile_picture import ProfilePictureService
+from services.image_jobs import ImageJobService
+from services.direct_upload import DirectUploadService
+from schemas.upload import DirectUploadConfirmSchema
+from schemas.registry import SchemaRegistry
+from constants import ImageJobs
 from PIL import Image, UnidentifiedImageError
-from datetime import datetime
-from services.user_profile import UserProfileService
-import uuid
-
-__PROFILE_PIC_MAX_WIDTH__ = 400
-__PROFILE_PIC_MAX_HEIGHT__ = 400
 
 
 def __allowed_file__(filename, allowed_extensions=None):
@@ -21,19 +19,7 @@ def __allowed_file__(filename, allowed_extensions=None):
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
-def __resize_picture__(full_file_path, resized_image_path, max_w=400, max_h=400):
-    try:
-        image = Image.open(full_file_path)
-        image.thumbnail((max_w, max_h))
-        # remove the alpha channel, otherwise we cannot save as jpg
-        if image.mode in ("RGBA", "P"):
-            image = image.convert("RGB")
-        image.save(resized_image_path, quality=95)
-    except UnidentifiedImageError as e:
-        raise ApplicationError("Invalid image file!")
-
-
-def __upload_image__(file, s3_object_name, max_w, max_h):
+def __validate_file__(file):
     if file is None:
         raise ApplicationError("Invalid file!")
     if file.filename == '':
@@ -41,42 +27,90 @@ def __upload_image__(file, s3_object_name, max_w, max_h):
     if __allowed_file__(file.filename) is False:
         raise ApplicationError("Invalid file type!")
 
-    # Save to temp directory and then upload to s3
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        print('created temporary directory', tmpdirname)
-        # Since user provided file names are inherently insecure, use the secure_filename() method
-        filename = secure_filename(file.filename)
-        full_file_path = os.path.join(tmpdirname, filename)
-        # save to location
-        file.save(full_file_path)
-        # resize image
-        resized_image_path = os.path.join(tmpdirname, f"{uuid.uuid4()}.jpg")
-        __resize_picture__(full_file_path, resized_image_path, max_w, max_h)
-        # upload to s3
-        AwsS3.upload_file(resized_image_path, s3_object_name)
+
+def __validate_image_header__(stream):
+    """Cheap check, only the image header is parsed. The image is decoded later by the worker"""
+    try:
+        Image.open(stream)
+    except UnidentifiedImageError:
+        raise ApplicationError("Invalid image file!")
+    stream.seek(0)
 
 
 class ProfilePictureUpload(Resource):
     @jwt_required
     def post(self):
         """
-        All pictures are resized & uploaded to public directory
+        All pictures are resized & uploaded to public directory.
+        In async mode (PICTURE_UPLOAD_MODE=async) the picture is processed by the image workers,
+        the response is 202 with the job id to be polled via ProfilePictureUploadStatus
         """
         user_id = get_jwt_identity()
         # check if the post request has the file part
         if 'file' not in request.files:
             raise ApplicationError("Key 'file' not a part of request!")
         file = request.files['file']
-        # generate profile pic name with timestamp
-        current_timestamp = datetime.timestamp(datetime.now())
-        # NOTE: the object name is based on convention :
-        # Any object name starting with "public" is publicly visible via S3
-        s3_object_name = f"public/profile/{user_id}-{current_timestamp}.jpg"
-        __upload_image__(file, s3_object_name, __PROFILE_PIC_MAX_WIDTH__, __PROFILE_PIC_MAX_HEIGHT__)
-        # Make entry
-        UserProfileService.update_profile_picture(user_id, new_pic_object_name=s3_object_name)
+        __validate_file__(file)
+        if current_app.config["PICTURE_UPLOAD_MODE"] == "async":
+            __validate_image_header__(file.stream)
+            job_id = ImageJobService.enqueue(user_id, file.stream.read())
+            return {
+                "jobId": job_id,
+                "statusUrl": f"/user/profile/pictureUpload/{job_id}"
+            }, 202
+        s3_object_name = ProfilePictureService.store_picture(user_id, file.stream)
         return {
             "filename": s3_object_name,
             "userId": user_id,
             "url": AwsS3.get_object_url(s3_object_name)
         }
+
+
+class DirectProfilePictureUpload(Resource):
+    @jwt_required
+    def post(self):
+        """
+        Issues a presigned POST: the client uploads the picture straight to S3 (multipart/form-data with the
+        returned fields & the file as the last field), then confirms it via DirectProfilePictureUploadConfirm
+        """
+        user_id = get_jwt_identity()
+        return DirectUploadService.create_upload(user_id), 201
+
+
+class DirectProfilePictureUploadConfirm(Resource):
+    @jwt_required
+    def post(self):
+        """
+        Queues a direct upload whatever the PICTURE_UPLOAD_MODE: direct uploads are larger than the ones
+        ProfilePictureUpload accepts & are never downloaded by the web workers. The picture is processed by the
+        image workers, the response is 202 with the job id to be polled via ProfilePictureUploadStatus
+        """
+        user_id = get_jwt_identity()
+        data = SchemaRegistry.load(DirectUploadConfirmSchema, request.json)
+        staging_key = data["stagingKey"]
+        DirectUploadService.validate_staging_key(user_id, staging_key)
+        job_id = ImageJobService.enqueue(user_id, staging_key=staging_key)
+        return {
+            "jobId": job_id,
+            "statusUrl": f"/user/profile/pictureUpload/{job_id}"
+        }, 202
+
+
+class ProfilePictureUploadStatus(Resource):
+    @jwt_required
+    def get(self, job_id):
+        """Status of a picture upload made in async mode or of a direct upload: queued, processing, done or failed"""
+        user_id = get_jwt_identity()
+        job = ImageJobService.get_status(job_id, user_id)
+        if job is None:
+            raise ApplicationError("Invalid job id!", 404)
+        response_dict = {
+            "jobId": job_id,
+            "status": job[ImageJobs.STATUS]
+        }
+        if job[ImageJobs.STATUS] == ImageJobs.STATUS_DONE:
+            response_dict["filename"] = job[ImageJobs.OBJECT_NAME]
+            response_dict["url"] = AwsS3.get_object_url(job[ImageJobs.OBJECT_NAME])
+        elif job[ImageJobs.STATUS] == ImageJobs.STATUS_FAILED:
+            response_dict["message"] = job.get(ImageJobs.ERROR, "")
+        return response_dict
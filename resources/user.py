@@ -1,25 +1,29 @@
 from flask_restful import Resource, request
 from services.user import UserRegistrationService, UserLoginService
+from services.identity import IdentityService
+from services.rate_limit import rate_limited, account_from_json, account_from_view_arg
 from application_error import ApplicationError
 from schemas.user import (UserRegistrationInputSchema,
                           UserLoginInputSchema, ResetPasswordInputSchema,
-                          ChangePasswordInputSchema, EmailAddressValidationSchema)
+                          ChangePasswordInputSchema, EmailAddressValidationSchema, LogoutInputSchema)
+from schemas.registry import SchemaRegistry
 
 from flask_jwt_extended import (
-    create_access_token,
     get_jwt_identity,
+    get_raw_jwt,
     jwt_refresh_token_required,
     jwt_required
 )
 
 
 class RegisterUser(Resource):
+    @rate_limited(account=account_from_json("email"))
     def post(self):
         """Creates an email based user:
         email, password
         :returns: {created}
         """
-        data = UserRegistrationInputSchema().load(request.json)
+        data = SchemaRegistry.load(UserRegistrationInputSchema, request.json, fast=True)
         email_lowercase = data["email"].lower()
         UserRegistrationService.create_local_user(email=email_lowercase,
                                                   password=data["password"])
@@ -27,9 +31,10 @@ class RegisterUser(Resource):
 
 
 class ValidateEmailAddress(Resource):
+    @rate_limited(account=account_from_json("email"))
     def post(self):
         """Validates the user's email address, given the verification token"""
-        data = EmailAddressValidationSchema().load(request.json)
+        data = SchemaRegistry.load(EmailAddressValidationSchema, request.json, fast=True)
         email_lowercase = data["email"].lower()
         verification_token = data["verificationToken"]
         UserRegistrationService.validate_email_address_verification_token(email_lowercase, verification_token)
@@ -38,19 +43,22 @@ class ValidateEmailAddress(Resource):
 class ResendEmailAddressVerificationMail(Resource):
     @jwt_required
     def get(self):
-        user_id = get_jwt_identity()
-        UserRegistrationService.resend_email_address_verification_email(user_id)
+        identity = IdentityService.current()
+        # a verified address never becomes unverified, the token is enough to know there is nothing to send
+        if not identity.is_verified:
+            UserRegistrationService.resend_email_address_verification_email(identity.user_id)
         return {}, 200
 
 
 class UserLogin(Resource):
+    @rate_limited(account=account_from_json("email"))
     def post(self):
         """
         email
         password
         :return: {access_token, refresh_token}
         """
-        data = UserLoginInputSchema().load(request.json)
+        data = SchemaRegistry.load(UserLoginInputSchema, request.json, fast=True)
         email_lowercase = data["email"].lower()
         token_response = UserLoginService.get_login_tokens(email_lowercase, data["password"])
         return token_response
@@ -59,25 +67,32 @@ class UserLogin(Resource):
 class TokenRefresh(Resource):
     @jwt_refresh_token_required
     def post(self):
-        """Authorization header should be Bearer <refreshToken>"""
-        current_user = get_jwt_identity()
-        return {
-            # Mark the token as un-fresh since we used the refresh token to regenerate this
-            "accessToken": create_access_token(identity=current_user, fresh=False),
-            "userId": current_user
-        }
+        """Authorization header should be Bearer <refreshToken>.
+        :return: {accessToken, refreshToken, userId}, the refresh token used for the call is revoked"""
+        return UserLoginService.rotate_refresh_token(get_jwt_identity(), get_raw_jwt())
+
+
+class UserLogout(Resource):
+    @jwt_required
+    def post(self):
+        """Revokes the access token of the call & the refreshToken of the body, if any"""
+        data = SchemaRegistry.load(LogoutInputSchema, request.get_json(silent=True) or {})
+        UserLoginService.logout(get_jwt_identity(), get_raw_jwt(), data.get("refreshToken"))
+        return {}, 200
 
 
 class ResetPassword(Resource):
+    @rate_limited(account=account_from_view_arg("email"))
     def get(self, email):
         """Sends password reset email (containing reset token) to the registered address"""
         UserLoginService.send_password_reset_email(email=email.lower())
         return {}, 200
 
+    @rate_limited(account=account_from_view_arg("email"))
     def post(self, email):
         """Given a password reset token, allows to reset the password for the given user:
         token, newPassword"""
-        data = ResetPasswordInputSchema().load(request.json)
+        data = SchemaRegistry.load(ResetPasswordInputSchema, request.json)
         # userId is expected to be supplied as query param
         user_id = request.args.get("userId")
         if user_id is None:
@@ -94,10 +109,10 @@ class ChangePassword(Resource):
         """Given existing password, changes the logged-in user's password.
         existingPassword, newPassword
         """
-        # userId is retrieved from jwt identity
-        userId = get_jwt_identity()
-        data = ChangePasswordInputSchema().load(request.json)
-        UserLoginService.change_password(userId,
+        # sensitive operation: the identity is revalidated
+        identity = IdentityService.current(strict=True)
+        data = SchemaRegistry.load(ChangePasswordInputSchema, request.json)
+        UserLoginService.change_password(identity.user_id,
                                          existing_password=data["existingPassword"],
                                          new_password=data["newPassword"])
         return {}, 200
@@ -1,50 +1,93 @@
+from flask import current_app, Response
 from flask_restful import Resource, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from services.user_profile import UserProfileService
-from constants import UserProfile as UserProfileConstants
-from schemas.user_profile import UserProfileInputSchema
+from schemas.user_profile import UserProfileInputSchema, PublicProfilesQuerySchema
+from schemas.registry import SchemaRegistry
 from datetime import datetime
 from services.aws_s3 import AwsS3
+from services.profile_picture import ProfilePictureService
+from services.profile_cache import PublicProfileCacheService
 from application_error import ApplicationError
 from date_utils import pymongo_naive_utc_datetime_to_ms
+from werkzeug.http import http_date
+from datetime import timezone
+
+# the owner's profile may only be reused after revalidation
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def __is_not_modified__(etag, last_modified_at):
+    """Evaluates the conditional request headers against the current version of the profile"""
+    # If-None-Match takes precedence
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if_modified_since = request.if_modified_since
+    if if_modified_since is None or last_modified_at is None:
+        return False
+    if if_modified_since.tzinfo is not None:
+        if_modified_since = if_modified_since.astimezone(timezone.utc).replace(tzinfo=None)
+    # http dates have a precision of one second
+    return last_modified_at.replace(microsecond=0) <= if_modified_since
+
+
+def __validator_headers__(etag, last_modified_at, cache_control):
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+    if last_modified_at is not None:
+        headers["Last-Modified"] = http_date(last_modified_at.replace(tzinfo=timezone.utc))
+    return headers
+
 
 class UserProfile(Resource):
     @jwt_required
     def get(self):
-        """Gets the user's profile"""
+        """Gets the user's profile. Supports conditional requests (If-None-Match / If-Modified-Since)"""
         user_id = get_jwt_identity()
-        profile_doc = UserProfileService.get_user_profile(user_id)
-        if profile_doc is None:
+        if request.if_none_match or request.if_modified_since is not None:
+            # polling clients: only the version of the profile is fetched (covered query)
+            version = UserProfileService.get_profile_version(user_id)
+            if version is not None:
+                etag = UserProfileService.etag(version.last_modified_at, version.picture_object_name)
+                if __is_not_modified__(etag, version.last_modified_at):
+                    return Response(status=304, headers=__validator_headers__(etag, version.last_modified_at,
+                                                                              PRIVATE_CACHE_CONTROL))
+        profile = UserProfileService.get_user_profile(user_id)
+        if profile is None:
             return None, 404
         else:
             # Never return database object as-is, it might fuck up the clients.
             # Especially true when using mongodb and there might be fields missing in document
+            # (defaults for the missing fields are declared in repositories.user_profiles.FullProfile)
             response_dict = {
-                "userId": profile_doc.get(UserProfileConstants.USERID, ""),
-                "fullName": profile_doc.get(UserProfileConstants.FULL_NAME, ""),
-                "age": profile_doc.get(UserProfileConstants.AGE, 99),
-                "country": profile_doc.get(UserProfileConstants.COUNTRY, ""),
-                "city": profile_doc.get(UserProfileConstants.CITY, ""),
-                "gender": profile_doc.get(UserProfileConstants.GENDER, "undecided"),
-                "occupation": profile_doc.get(UserProfileConstants.OCCUPATION, ""),
-                "mobileNumber": profile_doc.get(UserProfileConstants.MOBILE_NUMBER, 0)
+                "userId": profile.user_id,
+                "fullName": profile.full_name,
+                "age": profile.age,
+                "country": profile.country,
+                "city": profile.city,
+                "gender": profile.gender,
+                "occupation": profile.occupation,
+                "mobileNumber": profile.mobile_number
             }
             # Add display pic field
-            picture_object_name = profile_doc.get(UserProfileConstants.PICTURE_OBJECT_NAME)
+            picture_object_name = profile.picture_object_name
             if picture_object_name is not None:
                 response_dict["displayPicUrl"] = AwsS3.get_object_url(picture_object_name)
             else:
                 response_dict["displayPicUrl"] = ""
+            # {format: srcset} of the resized variants, e.g. {"webp": "<url> 48w, <url> 128w, <url> 400w"}
+            response_dict["displayPicSrcset"] = ProfilePictureService.srcset(profile.picture_variants,
+                                                                             profile.picture_widths)
             # Convert the datetime field into a timestamp
-            last_modified_at = profile_doc.get(UserProfileConstants.LAST_MODIFIED_AT, datetime.utcnow())
+            last_modified_at = profile.last_modified_at or datetime.utcnow()
             response_dict["lastModifiedAt"] = pymongo_naive_utc_datetime_to_ms(last_modified_at)
 
-            return response_dict
+            etag = UserProfileService.etag(profile.last_modified_at, picture_object_name)
+            return response_dict, 200, __validator_headers__(etag, profile.last_modified_at, PRIVATE_CACHE_CONTROL)
 
     def __upsert_profile__(self):
         """Creates the user's profile"""
         user_id = get_jwt_identity()
-        data = UserProfileInputSchema().load(request.json)
+        data = SchemaRegistry.load(UserProfileInputSchema, request.json)
         UserProfileService.upsert_user_profile(user_id, full_name=data.get("fullName"),
                                                city=data.get("city"),
                                                country=data.get("country"),
@@ -63,23 +106,71 @@ class UserProfile(Resource):
         return self.__upsert_profile__()
 
 
+def __public_profile_entry__(profile):
+    """Cache entry of the public profile endpoints: {"profile": response dict, "etag": ..., "lastModifiedAt": ms}.
+    The profile is None if the user has no profile"""
+    if profile is None:
+        return {"profile": None}
+    # return selected fields when another user requests this id
+    response_dict = {
+        "userId": profile.user_id,
+        "fullName": profile.full_name,
+        "country": profile.country,
+        "city": profile.city
+    }
+    # Add display pic field
+    picture_object_name = profile.picture_object_name
+    if picture_object_name is not None:
+        response_dict["displayPicUrl"] = AwsS3.get_object_url(picture_object_name)
+    else:
+        response_dict["displayPicUrl"] = ""
+    response_dict["displayPicSrcset"] = ProfilePictureService.srcset(profile.picture_variants,
+                                                                     profile.picture_widths)
+    return {
+        "profile": response_dict,
+        # distinct from the owner's representation
+        "etag": "p" + UserProfileService.etag(profile.last_modified_at, picture_object_name),
+        "lastModifiedAt": pymongo_naive_utc_datetime_to_ms(profile.last_modified_at)
+        if profile.last_modified_at is not None else None
+    }
+
+
 class PublicUserProfile(Resource):
     def get(self, other_user_id):
-        profile_doc = UserProfileService.get_user_profile(other_user_id)
-        if profile_doc is None:
+        # served from PublicProfileCacheService, only the public fields are fetched from the db on a miss
+        entry = PublicProfileCacheService.get(
+            other_user_id,
+            lambda: __public_profile_entry__(UserProfileService.get_public_profile(other_user_id)))
+        if entry["profile"] is None:
             raise ApplicationError("User profile unavailable", 404)
-        else:
-            # return selected fields when another user requests this id
-            response_dict = {
-                "userId": profile_doc.get(UserProfileConstants.USERID, ""),
-                "fullName": profile_doc.get(UserProfileConstants.FULL_NAME, ""),
-                "country": profile_doc.get(UserProfileConstants.COUNTRY, ""),
-                "city": profile_doc.get(UserProfileConstants.CITY, "")
-            }
-            # Add display pic field
-            picture_object_name = profile_doc.get(UserProfileConstants.PICTURE_OBJECT_NAME)
-            if picture_object_name is not None:
-                response_dict["displayPicUrl"] = AwsS3.get_object_url(picture_object_name)
-            else:
-                response_dict["displayPicUrl"] = ""
-            return response_dict
+        last_modified_at = None
+        # entries written to the shared tier before lastModifiedAt was added have no such key
+        if entry.get("lastModifiedAt") is not None:
+            last_modified_at = datetime.utcfromtimestamp(entry["lastModifiedAt"] / 1000)
+        headers = __validator_headers__(entry["etag"], last_modified_at,
+                                        f"public, max-age={current_app.config['PUBLIC_PROFILE_MAX_AGE']}")
+        # revalidation by a client or CDN holding the current version
+        if __is_not_modified__(entry["etag"], last_modified_at):
+            return Response(status=304, headers=headers)
+        return entry["profile"], 200, headers
+
+
+class PublicUserProfiles(Resource):
+    def post(self):
+        """
+        Batch version of PublicUserProfile, for clients rendering many users at once.
+        Body: {"userIds": [...]} (up to MAX_PUBLIC_PROFILES_PER_REQUEST ids). Returns a JSON array of the
+        public profiles, in the order of the request. Users without a profile are left out.
+        """
+        data = SchemaRegistry.load(PublicProfilesQuerySchema, request.json)
+        # duplicates removed, order kept
+        user_ids = list(dict.fromkeys(data["userIds"]))
+        # cache misses are fetched with a single $in query
+        entries = PublicProfileCacheService.get_many(user_ids, __load_public_profile_entries__)
+        profiles = [entries[user_id]["profile"] for user_id in user_ids if entries[user_id]["profile"] is not None]
+        return profiles
+
+
+def __load_public_profile_entries__(user_ids):
+    profiles = UserProfileService.get_public_profiles(user_ids)
+    return {user_id: __public_profile_entry__(profiles.get(user_id)) for user_id in user_ids}
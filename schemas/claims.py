@@ -1,6 +1,22 @@
 from marshmallow import Schema, fields, validate
 
+# upper bound of the entries updated by one bulk request
+MAX_CLAIMS_UPDATES_PER_REQUEST = 500
+
+
 class UserClaimsUpdateSchema(Schema):
     userId = fields.Str(required=True)
     isAdmin = fields.Bool(required=True)
     isSuperAdmin = fields.Bool(required=True)
+
+
+class ClaimsListQuerySchema(Schema):
+    """Query string of the claims listing"""
+    limit = fields.Int(load_default=100, validate=validate.Range(min=1, max=1000))
+    cursor = fields.Str(validate=validate.Length(max=64))
+    isAdmin = fields.Bool()
+    isSuperAdmin = fields.Bool()
+    # milliseconds since the epoch
+    modifiedSince = fields.Int(validate=validate.Range(min=0))
+    # ndjson: every matching entry, one json object per line (limit & cursor are ignored)
+    format = fields.Str(load_default="json", validate=validate.OneOf(["json", "ndjson"]))
@@ -0,0 +1,91 @@
+import threading
+from marshmallow import EXCLUDE, INCLUDE, ValidationError, fields, missing
+
+
+class CompiledValidator:
+    """Validates the payloads of a flat schema of string fields (e.g. login & registration) without going through
+    marshmallow's generic machinery. Only the accept path is fast: anything it cannot accept as is (missing or
+    unknown field, non string value, failing validator) is handed over to the schema itself, which produces the
+    usual errors. Raises ValueError for schemas it cannot compile."""
+
+    def __init__(self, schema):
+        if any(schema._hooks.values()) or schema.unknown in (EXCLUDE, INCLUDE):
+            raise ValueError(f"{type(schema).__name__} has hooks or accepts unknown fields")
+        self.fields = {}
+        self.required = []
+        for name, field in schema.load_fields.items():
+            if type(field)._deserialize is not fields.String._deserialize \
+                    or field.data_key is not None or field.attribute is not None \
+                    or field.load_default is not missing or field.allow_none:
+                raise ValueError(f"{type(schema).__name__}.{name} is not a plain string field")
+            self.fields[name] = tuple(field.validators)
+            if field.required:
+                self.required.append(name)
+
+    def accepts(self, data):
+        """True if the schema would load data unchanged"""
+        if type(data) is not dict:
+            return False
+        for name in self.required:
+            if name not in data:
+                return False
+        for name, value in data.items():
+            validators = self.fields.get(name)
+            if validators is None or type(value) is not str:
+                return False
+            for validator in validators:
+                try:
+                    if validator(value) is False:
+                        return False
+                except ValidationError:
+                    return False
+        return True
+
+
+class SchemaRegistry:
+    """One instance of every schema per process. Loading does not modify a marshmallow schema, the instances are
+    shared by all the requests & threads instead of binding the fields again on every request.
+    load(..., fast=True) first tries the compiled validator of the schema (see CompiledValidator)."""
+    fast_validation = True
+    _schemas = {}
+    _compiled = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, fast_validation=True):
+        cls.fast_validation = fast_validation
+
+    @classmethod
+    def get(cls, schema_class, many=False):
+        key = (schema_class, many)
+        schema = cls._schemas.get(key)
+        if schema is None:
+            with cls._lock:
+                schema = cls._schemas.get(key)
+                if schema is None:
+                    schema = schema_class(many=many)
+                    cls._schemas[key] = schema
+        return schema
+
+    @classmethod
+    def load(cls, schema_class, data, many=False, fast=False):
+        """Same result as schema_class(many=many).load(data)"""
+        schema = cls.get(schema_class, many)
+        if fast and cls.fast_validation and not many:
+            validator = cls.__compiled__(schema_class, schema)
+            if validator is not None and validator.accepts(data):
+                return dict(data)
+        return schema.load(data)
+
+    @classmethod
+    def __compiled__(cls, schema_class, schema):
+        """CompiledValidator of the schema, None if it cannot be compiled"""
+        if schema_class not in cls._compiled:
+            try:
+                validator = CompiledValidator(schema)
+            except ValueError as e:
+                print(f"Schema not compiled: {e}")
+                validator = None
+            with cls._lock:
+                cls._compiled[schema_class] = validator
+        return cls._compiled[schema_class]
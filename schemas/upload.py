@@ -0,0 +1,5 @@
+from marshmallow import Schema, fields, validate
+
+
+class DirectUploadConfirmSchema(Schema):
+    stagingKey = fields.Str(required=True, validate=validate.Length(min=1, max=200))
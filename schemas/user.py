@@ -19,6 +19,11 @@ class ResetPasswordInputSchema(Schema):
     newPassword = fields.Str(required=True, validate=validate.Length(min=4))
 
 
+class LogoutInputSchema(Schema):
+    # revoked along with the access token
+    refreshToken = fields.Str()
+
+
 class ChangePasswordInputSchema(Schema):
     existingPassword = fields.Str(required=True)
     newPassword = fields.Str(required=True, validate=validate.Length(min=4))
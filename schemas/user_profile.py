@@ -9,3 +9,12 @@ class UserProfileInputSchema(Schema):
     age = fields.Int(validate=validate.Range(min=16,max=80))
     occupation = fields.Str(validate=validate.Length(max=20))
     mobileNumber = fields.Int(validate=validate.Range(min=7000000000, max=9999999999))
+
+
+# upper bound of the ids resolved by one batch request
+MAX_PUBLIC_PROFILES_PER_REQUEST = 300
+
+
+class PublicProfilesQuerySchema(Schema):
+    userIds = fields.List(fields.Str(validate=validate.Length(min=1, max=100)), required=True,
+                          validate=validate.Length(min=1, max=MAX_PUBLIC_PROFILES_PER_REQUEST))
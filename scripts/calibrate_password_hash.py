@@ -0,0 +1,74 @@
+"""Benchmarks candidate password hash params on this host & recommends the strongest setting whose p99
+verification time stays under the target. Run it on the same instance type as the production workers.
+
+Usage (from the project root):
+    python -m scripts.calibrate_password_hash --target-ms 250
+    python -m scripts.calibrate_password_hash --scheme bcrypt --target-ms 150 --samples 30
+"""
+import argparse
+import itertools
+import time
+from services.security import build_password_context
+
+# ordered from the weakest to the strongest candidate
+CANDIDATES = {
+    "argon2": [{"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism}
+               for memory_cost, time_cost, parallelism in itertools.product([19456, 32768, 65536, 131072],
+                                                                             [1, 2, 3, 4, 6],
+                                                                             [1, 2])],
+    "bcrypt": [{"rounds": rounds} for rounds in range(10, 16)],
+    "sha256_crypt": [{"default_rounds": rounds} for rounds in (100000, 200000, 400000, 800000, 1600000)],
+}
+
+
+def strength(scheme, params):
+    """Rough relative cost an attacker pays per guess"""
+    if scheme == "argon2":
+        return params["memory_cost"] * params["time_cost"]
+    if scheme == "bcrypt":
+        return 2 ** params["rounds"]
+    return params["default_rounds"]
+
+
+def measure_verify_p99(scheme, params, samples):
+    context = build_password_context(scheme, params)
+    password_hash = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.verify("calibration-password", password_hash)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", default="argon2", choices=sorted(CANDIDATES.keys()))
+    parser.add_argument("--target-ms", type=float, required=True, help="p99 verification budget per login")
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    recommended = None
+    candidates = sorted(CANDIDATES[args.scheme], key=lambda params: strength(args.scheme, params))
+    for params in candidates:
+        p99 = measure_verify_p99(args.scheme, params, args.samples)
+        within_budget = p99 <= args.target_ms
+        print(f"{params} p99={p99:.1f}ms {'ok' if within_budget else 'over budget'}")
+        if within_budget:
+            recommended = params
+        elif p99 > args.target_ms * 4:
+            # all the remaining candidates are stronger, no point waiting for them
+            break
+
+    if recommended is None:
+        print(f"No {args.scheme} setting verifies within {args.target_ms}ms on this host")
+        return
+    params_value = ",".join(f"{key}={value}" for key, value in recommended.items())
+    print("Recommended environment:")
+    print(f"PASSWORD_HASH_SCHEME={args.scheme}")
+    print(f"PASSWORD_HASH_PARAMS={params_value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+"""Delivers the mails queued in the email outbox. Use it when the web workers are started with
+EMAIL_DISPATCHER=off, e.g. as a separate Heroku worker dyno.
+
+Usage (from the project root, MONGODB_URI & SENDGRID_API_KEY must be set):
+    python -m scripts.email_dispatcher
+"""
+import os
+from database_manager import DatabaseManager
+from app import configure_email_dispatcher
+from services.email_outbox import EmailDispatcher
+
+
+def main():
+    DatabaseManager.initialize_database(os.environ.get("MONGODB_URI"))
+    configure_email_dispatcher()
+    print("Email dispatcher started")
+    EmailDispatcher.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Sets the claims of a user from the command line, e.g. to bootstrap the first super-admin: registration creates
+users without any role & only super-admins can change the claims through the API.
+The user logs in again (or refreshes the tokens) to get the new claims in the access token.
+
+Usage (from the project root, MONGODB_URI must be set):
+    python -m scripts.grant_claims --email admin@example.com --super-admin
+    python -m scripts.grant_claims --email someone@example.com --admin
+    python -m scripts.grant_claims --email someone@example.com             # revokes both roles
+"""
+import argparse
+import os
+import sys
+from database_manager import DatabaseManager
+from repositories.users import UsersRepository
+from services.claims import ClaimsManagementService
+
+# recorded as the author of the change (lastModifiedBy), instead of a user id
+UPDATED_BY = "scripts.grant_claims"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--admin", action="store_true")
+    parser.add_argument("--super-admin", action="store_true")
+    args = parser.parse_args()
+    DatabaseManager.initialize_database(os.environ.get("MONGODB_URI"))
+    user_id = UsersRepository.get_id_by_email(args.email)
+    if user_id is None:
+        sys.exit(f"No user registered with {args.email}")
+    ClaimsManagementService.update_claims(user_id=user_id, is_admin=args.admin, is_super_admin=args.super_admin,
+                                          updated_by_user_id=UPDATED_BY)
+    print(f"Claims of {args.email} ({user_id}): isAdmin={args.admin}, isSuperAdmin={args.super_admin}")
+
+
+if __name__ == '__main__':
+    main()
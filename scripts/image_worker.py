@@ -0,0 +1,36 @@
+"""Processes the profile pictures uploaded in async mode (PICTURE_UPLOAD_MODE=async) & the direct uploads.
+Resizing is CPU bound, so every worker is a separate process.
+
+Usage (from the project root, same env variables as the web app):
+    python -m scripts.image_worker --processes 4
+"""
+import argparse
+import os
+from multiprocessing import Process
+from app import configure_database, configure_AWS_s3, configure_cache_services
+from services.image_jobs import ImageJobWorker
+
+
+def run_worker():
+    # each process needs its own connections, pymongo & boto3 clients are not fork safe
+    configure_database()
+    configure_AWS_s3()
+    # the processed pictures invalidate the public profiles, in the shared tier too
+    configure_cache_services()
+    ImageJobWorker.run_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    processes = [Process(target=run_worker, name=f"image-worker-{i}") for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    print(f"Started {len(processes)} image workers")
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Runs explain() on every query listed in database_indexes.AUDITED_QUERIES & reports the ones doing a
+collection scan. Exits with status 1 if any query is not served by an index.
+
+Usage (from the project root, MONGODB_URI must be set):
+    python -m scripts.index_audit
+"""
+import os
+import sys
+from database_manager import DatabaseManager
+from database_indexes import AUDITED_QUERIES
+
+
+def plan_stages(plan):
+    """Yields all the stage names of an explain() winning plan"""
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from plan_stages(plan["inputStage"])
+    for input_stage in plan.get("inputStages", []):
+        yield from plan_stages(input_stage)
+
+
+def audit_query(db, audited_query):
+    explanation = db[audited_query.collection_name].find(audited_query.query,
+                                                          projection=audited_query.projection).explain()
+    stages = set(plan_stages(explanation["queryPlanner"]["winningPlan"]))
+    uses_index = "COLLSCAN" not in stages
+    # a covered query is answered from the index alone, without fetching documents
+    covered = uses_index and "FETCH" not in stages and "IDHACK" not in stages
+    return uses_index, covered, stages
+
+
+def main():
+    DatabaseManager.initialize_database(os.environ.get("MONGODB_URI"))
+    failures = 0
+    for audited_query in AUDITED_QUERIES:
+        uses_index, covered, stages = audit_query(DatabaseManager.db, audited_query)
+        if not uses_index:
+            failures += 1
+            status = "COLLSCAN"
+        elif covered:
+            status = "COVERED"
+        else:
+            status = "IXSCAN"
+        print(f"{status:10} {audited_query.collection_name}: {audited_query.description} {sorted(stages)}")
+    if failures > 0:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} not using an index!")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
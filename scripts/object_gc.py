@@ -0,0 +1,44 @@
+"""Deletes the orphaned objects (replaced profile pictures, processed direct uploads...) in batches.
+Run it periodically, e.g. as a Heroku worker dyno or from the scheduler with --once.
+
+Usage (from the project root, MONGODB_URI & the storage env variables must be set):
+    python -m scripts.object_gc              # runs forever
+    python -m scripts.object_gc --once       # deletes every due orphan & exits
+    python -m scripts.object_gc --reconcile  # lists the bucket & records the leaked objects (add --dry-run to only print them)
+"""
+import argparse
+import os
+from database_manager import DatabaseManager
+from app import configure_AWS_s3, configure_object_gc
+from services.object_gc import ObjectGarbageCollector
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true")
+    parser.add_argument("--reconcile", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    DatabaseManager.initialize_database(os.environ.get("MONGODB_URI"))
+    configure_AWS_s3()
+    configure_object_gc()
+    if args.reconcile:
+        leaked = ObjectGarbageCollector.reconcile(dry_run=args.dry_run)
+        for object_name in leaked:
+            print(object_name)
+        print(f"{len(leaked)} leaked objects " + ("found" if args.dry_run else "recorded"))
+    elif args.once:
+        total = 0
+        while True:
+            processed = ObjectGarbageCollector.collect_once()
+            total += processed
+            if processed < ObjectGarbageCollector.batch_size:
+                break
+        print(f"{total} orphaned objects processed")
+    else:
+        print("Object garbage collector started")
+        ObjectGarbageCollector.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Schedules the rotation of the JWT signing keys (JWT_ALGORITHM=RS256, see services/signing_keys.py).
+Generates a new RSA key next to the manifest & adds it to the manifest: it is published in the JWKS right away and
+starts signing after --activate-in-hours, so that the other services have fetched it by then. The keys which are
+signing now retire --retire-after-hours after the activation (their tokens must have expired by then, i.e. at least
+the refresh token lifetime). Retired keys are dropped from the manifest on the next run.
+Creates the manifest if it does not exist.
+
+Usage (from the project root):
+    python -m scripts.rotate_signing_key --manifest keys/keyring.json
+    python -m scripts.rotate_signing_key --manifest keys/keyring.json --activate-in-hours 0   # first key
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from services.signing_keys import parse_manifest_time
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def generate_private_key_pem(key_size):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return private_key.private_bytes(encoding=serialization.Encoding.PEM,
+                                     format=serialization.PrivateFormat.PKCS8,
+                                     encryption_algorithm=serialization.NoEncryption())
+
+
+def rotate(manifest_path, activate_in_hours, retire_after_hours, key_size=2048, now=None):
+    """Returns the updated manifest"""
+    now = now or datetime.utcnow()
+    manifest = {"keys": []}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    activates_at = now + timedelta(hours=activate_in_hours)
+    retires_at = activates_at + timedelta(hours=retire_after_hours)
+    keys = []
+    for entry in manifest["keys"]:
+        entry_retires_at = parse_manifest_time(entry.get("retiresAt"))
+        if entry_retires_at is not None and entry_retires_at <= now:
+            continue
+        if entry_retires_at is None or entry_retires_at > retires_at:
+            entry["retiresAt"] = retires_at.strftime(TIME_FORMAT)
+        keys.append(entry)
+    kid = now.strftime("%Y%m%d%H%M%S")
+    key_file_name = f"{kid}.pem"
+    key_path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), key_file_name)
+    # readable by the owner only
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(generate_private_key_pem(key_size))
+    keys.append({"kid": kid, "privateKey": key_file_name, "activatesAt": activates_at.strftime(TIME_FORMAT)})
+    manifest["keys"] = keys
+    # written atomically, the workers may reload the manifest at any time
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--activate-in-hours", type=float, default=24)
+    parser.add_argument("--retire-after-hours", type=float, default=30 * 24)
+    parser.add_argument("--key-size", type=int, default=2048)
+    args = parser.parse_args()
+    manifest = rotate(args.manifest, args.activate_in_hours, args.retire_after_hours, key_size=args.key_size)
+    for entry in manifest["keys"]:
+        print(f"{entry['kid']}: activates at {entry['activatesAt']}, retires at {entry.get('retiresAt', '-')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,51 @@
-import boto3
 from application_error import ApplicationError
-from botocore.exceptions import ClientError
-from boto3.exceptions import S3UploadFailedError
+from services.storage_backends import S3StorageBackend
+from metrics import Metrics
+
 
 class AwsS3:
-    """It is important to note that this class follows conventions as designed by the CloudCube Heroku provider"""
-    bucket_name = None
-    cube_name = None
-    s3_client = None
+    """It is important to note that this class follows conventions as designed by the CloudCube Heroku provider.
+    The objects are stored by a backend from services.storage_backends (S3 or, for tests, the local filesystem).
+    Every operation is timed under storage.<operation> in the metrics."""
+    backend = None
     base_url = None
 
     @classmethod
-    def configure_client(cls, aws_access_key_id, aws_secret_access_key, bucket_name, base_url, cube_name):
-        """Must be called before invoking any other method"""
-        cls.bucket_name = bucket_name
-        cls.cube_name = cube_name
-        cls.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
+    def configure_client(cls, aws_access_key_id, aws_secret_access_key, bucket_name, base_url, cube_name,
+                         endpoint_url=None, region_name=None, **backend_options):
+        """Must be called before invoking any other method (or configure_backend).
+        endpoint_url: S3 compatible stand-in (e.g. MinIO), None for AWS.
+        backend_options: connection pool, retries & transfer settings, see S3StorageBackend"""
+        cls.configure_backend(S3StorageBackend(aws_access_key_id=aws_access_key_id,
+                                               aws_secret_access_key=aws_secret_access_key,
+                                               bucket_name=bucket_name,
+                                               cube_name=cube_name,
+                                               endpoint_url=endpoint_url,
+                                               region_name=region_name,
+                                               **backend_options),
+                              base_url=base_url)
+
+    @classmethod
+    def configure_backend(cls, backend, base_url):
+        cls.backend = backend
         cls.base_url = base_url
 
+    @classmethod
+    def __get_backend__(cls):
+        if cls.backend is None:
+            raise ApplicationError("S3 client not configured!", 500)
+        return cls.backend
+
+    @classmethod
+    def __run__(cls, operation, *args, **kwargs):
+        backend = cls.__get_backend__()
+        try:
+            with Metrics.timer(f"storage.{operation}"):
+                return getattr(backend, operation)(*args, **kwargs)
+        except Exception:
+            Metrics.increment(f"storage.{operation}.errors")
+            raise
+
     @classmethod
     def get_object_url(cls,object_name):
         if object_name is None or len(object_name) == 0:
@@ -29,44 +53,61 @@ class AwsS3:
         return f"{cls.base_url}/{object_name}"
 
     @classmethod
-    def upload_file(cls, source_file_path, s3_object_name):
+    def upload_file(cls, source_file_path, s3_object_name, content_type=None, cache_control=None):
         """Upload a file to a S3 bucket
 
         :param source_file_path: File to upload
-        :param bucket: Bucket to upload to
         :param s3_object_name: S3 object name
-        :return: True if file was uploaded, else False
+        :return: True if file was uploaded, else raises ApplicationError
         """
-        if cls.s3_client is None:
-            raise ApplicationError("S3 client not configured!", 500)
-
         # If S3 object_name was not specified, raise error
         if s3_object_name is None:
             raise ApplicationError("Invalid object name for uploading file!", 500)
+        cls.__run__("upload_file", source_file_path, s3_object_name, content_type=content_type,
+                    cache_control=cache_control)
+        return True
 
-        # Upload the file
-        try:
-            print(cls.bucket_name)
-            print(source_file_path)
-            print(s3_object_name)
-            # Cloudcube requires that we add <cubename> before objectname as a path else ops will fail
-            response = cls.s3_client.upload_file(source_file_path, cls.bucket_name, f"{cls.cube_name}/{s3_object_name}")
-            print(f"Upload response {response}")
-        except ClientError as e:
-            print(e)
-            raise ApplicationError("Unable to upload file. Please try again!")
-        except S3UploadFailedError as se3:
-            print(se3)
-            raise ApplicationError("Unable to upload file. Please try again!")
+    @classmethod
+    def upload_fileobj(cls, fileobj, s3_object_name, content_type=None, cache_control=None):
+        """Upload a file-like object (e.g. an in-memory buffer) to the S3 bucket"""
+        if s3_object_name is None:
+            raise ApplicationError("Invalid object name for uploading file!", 500)
+        cls.__run__("upload_fileobj", fileobj, s3_object_name, content_type=content_type,
+                    cache_control=cache_control)
         return True
 
+    @classmethod
+    def generate_presigned_post(cls, s3_object_name, max_bytes, expires_in=600):
+        """Lets a client upload (HTTP POST, multipart/form-data) at most max_bytes directly to s3_object_name.
+        Returns {"url": ..., "fields": {...}}, the fields must be sent along with the file"""
+        return cls.__run__("generate_presigned_post", s3_object_name, max_bytes=max_bytes, expires_in=expires_in)
+
+    @classmethod
+    def download_fileobj(cls, s3_object_name, max_bytes):
+        """Downloads an object into memory, returns a BytesIO positioned at 0.
+        Raises a 404 ApplicationError if the object does not exist & a 400 if it is larger than max_bytes"""
+        return cls.__run__("download_fileobj", s3_object_name, max_bytes=max_bytes)
+
     @classmethod
     def delete_object(cls, object_name):
         if object_name is None:
             return
         if len(object_name) == 0:
             return
-        # cloud cube wants us to add cubename before objectname to correctly identify and delete object
-        final_object_name = f"{cls.cube_name}/{object_name}"
-        print(f"Deleting object: {final_object_name}")
-        cls.s3_client.delete_object(Bucket=cls.bucket_name, Key=final_object_name)
+        cls.__run__("delete_object", object_name)
+
+    @classmethod
+    def delete_objects(cls, object_names):
+        """Deletes the objects in batches (S3 accepts up to 1000 keys per request).
+        Returns {object name: error} of the objects which could not be deleted"""
+        object_names = list(object_names)
+        batch_size = cls.__get_backend__().DELETE_BATCH_SIZE
+        errors = {}
+        for start in range(0, len(object_names), batch_size):
+            errors.update(cls.__run__("delete_objects", object_names[start:start + batch_size]))
+        return errors
+
+    @classmethod
+    def list_objects(cls, prefix):
+        """Yields (object name, last modified as naive UTC datetime) of every object under prefix"""
+        return cls.__get_backend__().list_objects(prefix)
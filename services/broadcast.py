@@ -0,0 +1,74 @@
+import threading
+from collections import defaultdict
+from database_manager import DatabaseManager as DM
+
+
+class LocalInvalidationBroadcast:
+    """Delivers cache invalidation messages to the subscribers within this process only.
+    Used in tests, local development and single worker deployments."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, channel, callback):
+        """callback is invoked with the invalidated key"""
+        self._subscribers[channel].append(callback)
+
+    def publish(self, channel, key):
+        for callback in self._subscribers[channel]:
+            callback(key)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class ChangeStreamInvalidationBroadcast(LocalInvalidationBroadcast):
+    """Fans invalidations out to every gunicorn worker by tailing MongoDB change streams.
+    Local writes are delivered immediately via publish(), writes done by other workers (or processes)
+    are picked up from the change stream of the watched collections.
+    NOTE: change streams require MongoDB to run as a replica set (Atlas clusters always do)."""
+
+    def __init__(self):
+        super().__init__()
+        # channel -> list of (collection name, function mapping a change event to the invalidated key)
+        self._watches = defaultdict(list)
+        self._threads = []
+        self._stop_event = threading.Event()
+
+    def watch(self, channel, collection_name, key_from_change):
+        """Publishes key_from_change(change_event) on channel for every write to collection_name"""
+        self._watches[collection_name].append((channel, key_from_change))
+
+    def start(self):
+        for collection_name in self._watches.keys():
+            thread = threading.Thread(target=self.__tail__, args=(collection_name,), daemon=True,
+                                      name=f"invalidation-{collection_name}")
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def __tail__(self, collection_name):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        resume_token = None
+        while not self._stop_event.is_set():
+            try:
+                with DM.db[collection_name].watch(pipeline, full_document="updateLookup",
+                                                  resume_after=resume_token) as stream:
+                    while not self._stop_event.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        for channel, key_from_change in self._watches[collection_name]:
+                            key = key_from_change(change)
+                            if key is not None:
+                                self.publish(channel, key)
+            except Exception as e:
+                # stream broke (failover, network). Entries expire via TTL meanwhile, reconnect
+                print(f"Change stream on {collection_name} interrupted: {e}")
+                self._stop_event.wait(1)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marker used to tell a cached None apart from a cache miss
+__MISSING__ = object()
+
+
+class TTLCache:
+    """Thread-safe in-process cache with a per-entry time to live and LRU eviction.
+    Every gunicorn worker holds its own instance, so entries must be invalidated on all workers
+    (see services/broadcast.py) whenever the underlying data changes."""
+
+    def __init__(self, max_size=1024, ttl_seconds=60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # incremented on every invalidation, used by get_or_load to detect races with writers
+        self._generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, __MISSING__)
+            if entry is __MISSING__:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            # mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        """ttl_seconds overrides the ttl of the cache for this entry"""
+        with self._lock:
+            self.__store__(key, value, ttl_seconds)
+
+    def set_if_absent(self, key, value, ttl_seconds=None):
+        """Stores the value only if key has no live entry. Returns True if it was stored"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                return False
+            self.__store__(key, value, ttl_seconds)
+            return True
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for key, calling loader() on a miss.
+        The loaded value is not cached if the key was invalidated while loading, so a slow
+        reader can never overwrite a fresher invalidation with stale data."""
+        value = self.get(key, __MISSING__)
+        if value is not __MISSING__:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self.__store__(key, value)
+        return value
+
+    @property
+    def generation(self):
+        """Read before loading values from the source, then pass it to set_if_unchanged"""
+        with self._lock:
+            return self._generation
+
+    def set_if_unchanged(self, key, value, generation):
+        """Stores the value unless an invalidation happened since generation was read (see get_or_load)"""
+        with self._lock:
+            if generation == self._generation:
+                self.__store__(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __store__(self, key, value, ttl_seconds=None):
+        """Must be called with the lock held"""
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (value, time.monotonic() + ttl_seconds)
+        self._entries.move_to_end(key)
+        # evict least recently used entries
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
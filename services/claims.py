@@ -1,6 +1,15 @@
+import base64
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from database_manager import DatabaseManager as DM
 from constants import ClaimsManagement
 from datetime import datetime
+from services.claims_cache import ClaimsCacheService
+from services.user_state import UserStateService
+from repositories.claims import ClaimsRepository
+from application_error import ApplicationError
 
 
 class ClaimsManagementService:
@@ -17,6 +26,38 @@ class ClaimsManagementService:
             }},
             upsert=True
         )
+        # token issuance reads the claims from the user document
+        UserStateService.set_denormalized_claims(user_id, is_admin=is_admin, is_super_admin=is_super_admin)
+        ClaimsCacheService.invalidate(user_id)
+
+    @classmethod
+    def bulk_update_claims(cls, updates, updated_by_user_id=None):
+        """update_claims for many users at once: updates is a list of (user id, is_admin, is_super_admin) with
+        distinct user ids. The entries are written with one unordered bulk write, a failed entry does not stop
+        the others. Returns one error message (None on success) per update, in the same order"""
+        assert updated_by_user_id is not None
+        now = datetime.utcnow()
+        operations = [UpdateOne(filter={ClaimsManagement.USER_ID: user_id},
+                                update={"$set": {
+                                    ClaimsManagement.IS_ADMIN: is_admin,
+                                    ClaimsManagement.IS_SUPER_ADMIN: is_super_admin,
+                                    ClaimsManagement.LAST_MODIFIED_BY: updated_by_user_id,
+                                    ClaimsManagement.LAST_MODIFIED_AT: now
+                                }},
+                                upsert=True)
+                      for user_id, is_admin, is_super_admin in updates]
+        errors = [None] * len(updates)
+        try:
+            DM.db[ClaimsManagement.COLLECTION_NAME].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                errors[write_error["index"]] = write_error.get("errmsg", "Write failed")
+        applied = [update for update, error in zip(updates, errors) if error is None]
+        # token issuance reads the claims from the user documents
+        UserStateService.set_denormalized_claims_many({user_id: (is_admin, is_super_admin)
+                                                       for user_id, is_admin, is_super_admin in applied})
+        ClaimsCacheService.invalidate_many([user_id for user_id, _, _ in applied])
+        return errors
 
     @classmethod
     def get_user_claims(cls, user_id):
@@ -39,22 +80,33 @@ class ClaimsManagementService:
         }
 
     @classmethod
-    def get_all_entries(cls):
-        cursor = DM.db[ClaimsManagement.COLLECTION_NAME].find()
-        result = []
-        for doc in cursor:
-            user_id = doc.get(ClaimsManagement.USER_ID)
-            is_admin = doc.get(ClaimsManagement.IS_ADMIN, False)
-            is_super_admin = doc.get(ClaimsManagement.IS_SUPER_ADMIN, False)
-            last_modified_by = doc.get(ClaimsManagement.LAST_MODIFIED_BY)
-            last_modified_at = doc.get(ClaimsManagement.LAST_MODIFIED_AT)
+    def list_entries(cls, limit, cursor=None, is_admin=None, is_super_admin=None, modified_since=None):
+        """One page of the claims entries: (list of repositories.claims.ClaimsEntry, next cursor).
+        The next cursor is None on the last page"""
+        after_id = cls.__decode_cursor__(cursor) if cursor is not None else None
+        # one extra entry tells whether there is a next page
+        entries = list(ClaimsRepository.list_entries(is_admin=is_admin, is_super_admin=is_super_admin,
+                                                     modified_since=modified_since, after_id=after_id,
+                                                     limit=limit + 1))
+        if len(entries) <= limit:
+            return entries, None
+        entries = entries[:limit]
+        return entries, cls.__encode_cursor__(entries[-1].id)
 
-            result.append({
-                "userId": user_id,
-                "isAdmin": is_admin,
-                "isSuperAdmin": is_super_admin,
-                "lastModifiedBy": last_modified_by,
-                "lastModifiedAt": last_modified_at
-            })
-        return result
+    @classmethod
+    def export_entries(cls, is_admin=None, is_super_admin=None, modified_since=None):
+        """Generator over every matching entry, the documents are fetched in batches while iterating"""
+        return ClaimsRepository.list_entries(is_admin=is_admin, is_super_admin=is_super_admin,
+                                             modified_since=modified_since)
 
+    @classmethod
+    def __encode_cursor__(cls, last_id):
+        # opaque to the clients
+        return base64.urlsafe_b64encode(last_id.binary).decode("ascii").rstrip("=")
+
+    @classmethod
+    def __decode_cursor__(cls, cursor):
+        try:
+            return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (ValueError, InvalidId, TypeError):
+            raise ApplicationError("Invalid cursor!")
@@ -0,0 +1,51 @@
+from services.cache import TTLCache
+from services.broadcast import LocalInvalidationBroadcast, ChangeStreamInvalidationBroadcast
+from constants import User, ClaimsManagement
+
+
+class ClaimsCacheService:
+    """Caches the claims added to access tokens so that logins & token refreshes do not hit the db.
+    Entries are invalidated on every worker through the configured broadcast."""
+    CHANNEL = "tokenClaims"
+    cache = TTLCache()
+    broadcast = LocalInvalidationBroadcast()
+
+    @classmethod
+    def configure(cls, max_size, ttl_seconds, broadcast):
+        """Must be called once per worker before serving requests"""
+        cls.broadcast.stop()
+        cls.cache = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        cls.broadcast = broadcast
+        cls.broadcast.subscribe(cls.CHANNEL, cls.cache.invalidate)
+        # ChangeStreamInvalidationBroadcast: writes by other workers to the collections holding
+        # the token claims also evict the local entry
+        if isinstance(broadcast, ChangeStreamInvalidationBroadcast):
+            broadcast.watch(cls.CHANNEL, User.COLLECTION_NAME, cls.__user_id_from_users_change__)
+            broadcast.watch(cls.CHANNEL, ClaimsManagement.COLLECTION_NAME, cls.__user_id_from_claims_change__)
+        cls.broadcast.start()
+
+    @classmethod
+    def get_token_claims(cls, user_id, loader):
+        """Returns the cached claims for user_id, loader() is used to fetch them on a miss"""
+        return cls.cache.get_or_load(user_id, loader)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        cls.broadcast.publish(cls.CHANNEL, str(user_id))
+
+    @classmethod
+    def invalidate_many(cls, user_ids):
+        for user_id in user_ids:
+            cls.invalidate(user_id)
+
+    @classmethod
+    def __user_id_from_users_change__(cls, change):
+        return str(change["documentKey"]["_id"])
+
+    @classmethod
+    def __user_id_from_claims_change__(cls, change):
+        full_document = change.get("fullDocument")
+        if full_document is None:
+            # deleted document, we cannot know the user. TTL expiry takes care of it
+            return None
+        return full_document.get(ClaimsManagement.USER_ID)
@@ -0,0 +1,61 @@
+import uuid
+from application_error import ApplicationError
+from services.aws_s3 import AwsS3
+from services.profile_picture import ProfilePictureService
+from services.object_gc import ObjectGarbageCollector
+
+
+class DirectUploadService:
+    """Profile pictures uploaded by the clients straight to S3 (presigned POST), the bytes never pass through
+    the web workers. The upload lands on a private staging key & is processed by the image workers (ImageJobWorker)
+    once the client confirms it."""
+    # not public (see AwsS3 conventions). Configure an S3 lifecycle rule to expire unconfirmed uploads
+    STAGING_PREFIX = "staging/profile/"
+    max_bytes = 10 * 1024 * 1024
+    expires_in_seconds = 600
+
+    @classmethod
+    def configure(cls, max_bytes, expires_in_seconds=600):
+        cls.max_bytes = max_bytes
+        cls.expires_in_seconds = expires_in_seconds
+
+    @classmethod
+    def create_upload(cls, user_id):
+        """Returns the staging key & the presigned POST (url & form fields) the client uploads the file with"""
+        staging_key = f"{cls.STAGING_PREFIX}{user_id}/{uuid.uuid4().hex}"
+        presigned_post = AwsS3.generate_presigned_post(staging_key, max_bytes=cls.max_bytes,
+                                                       expires_in=cls.expires_in_seconds)
+        return {
+            "stagingKey": staging_key,
+            "url": presigned_post["url"],
+            "fields": presigned_post["fields"],
+            "expiresIn": cls.expires_in_seconds
+        }
+
+    @classmethod
+    def validate_staging_key(cls, user_id, staging_key):
+        """Users can only confirm their own uploads"""
+        prefix = f"{cls.STAGING_PREFIX}{user_id}/"
+        if not staging_key.startswith(prefix) or "/" in staging_key[len(prefix):]:
+            raise ApplicationError("Invalid staging key!")
+
+    @classmethod
+    def process_upload(cls, user_id, staging_key):
+        """Resizes & stores the uploaded picture as the user's profile picture, then deletes the staging object.
+        Returns the object name of the picture"""
+        stream = AwsS3.download_fileobj(staging_key, max_bytes=cls.max_bytes)
+        try:
+            object_name = ProfilePictureService.store_picture(user_id, stream)
+        except ApplicationError:
+            # invalid image, retrying would not help. Other errors (S3/database unavailable) keep the upload
+            cls.discard_upload(staging_key)
+            raise
+        finally:
+            stream.close()
+        cls.discard_upload(staging_key)
+        return object_name
+
+    @classmethod
+    def discard_upload(cls, staging_key):
+        # no grace period, nothing refers to staging objects
+        ObjectGarbageCollector.record_orphans([staging_key], delay_seconds=0)
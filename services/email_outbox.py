@@ -0,0 +1,140 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+from database_manager import DatabaseManager as DM
+from constants import EmailOutbox
+from services.email_transports import EmailDeliveryError, ConsoleTransport
+from metrics import Metrics
+
+
+class EmailOutboxService:
+    """Durable queue of mails to be delivered. Requests only enqueue, EmailDispatcher delivers."""
+    # a claimed mail is handed to another dispatcher if it is not marked sent/failed within this time
+    LEASE_SECONDS = 60
+
+    @classmethod
+    def enqueue(cls, to, subject, body):
+        current_timestamp = datetime.utcnow()
+        DM.db[EmailOutbox.COLLECTION_NAME].insert_one({
+            EmailOutbox.TO: to,
+            EmailOutbox.SUBJECT: subject,
+            EmailOutbox.BODY: body,
+            EmailOutbox.STATUS: EmailOutbox.STATUS_PENDING,
+            EmailOutbox.ATTEMPTS: 0,
+            EmailOutbox.NEXT_ATTEMPT_AT: current_timestamp,
+            EmailOutbox.CREATED_AT: current_timestamp
+        })
+        Metrics.increment("emailOutbox.enqueued")
+
+    @classmethod
+    def claim_batch(cls, batch_size):
+        """Atomically claims up to batch_size mails which are due, including the ones whose lease expired
+        (dispatcher crashed while sending). Safe to call from several dispatchers concurrently.
+        Three queries whatever the batch size: the due ids, one update_many marking them with a lease token
+        (the due filter is checked again, a mail claimed by another dispatcher meanwhile is skipped) & the claimed
+        mails. A mail is never claimed twice, a batch may be smaller than batch_size under contention"""
+        now = datetime.utcnow()
+        due = {"$or": [
+            {EmailOutbox.STATUS: EmailOutbox.STATUS_PENDING, EmailOutbox.NEXT_ATTEMPT_AT: {"$lte": now}},
+            {EmailOutbox.STATUS: EmailOutbox.STATUS_SENDING, EmailOutbox.LOCKED_UNTIL: {"$lte": now}}
+        ]}
+        mail_ids = [doc["_id"] for doc in DM.db[EmailOutbox.COLLECTION_NAME].find(due, projection={"_id": 1})
+                    .sort(EmailOutbox.NEXT_ATTEMPT_AT, 1).limit(batch_size)]
+        if not mail_ids:
+            return []
+        lease_token = uuid.uuid4().hex
+        DM.db[EmailOutbox.COLLECTION_NAME].update_many(
+            filter={"_id": {"$in": mail_ids}, **due},
+            update={"$set": {EmailOutbox.STATUS: EmailOutbox.STATUS_SENDING,
+                             EmailOutbox.LOCKED_UNTIL: now + timedelta(seconds=cls.LEASE_SECONDS),
+                             EmailOutbox.LOCKED_BY: lease_token},
+                    "$inc": {EmailOutbox.ATTEMPTS: 1}})
+        return list(DM.db[EmailOutbox.COLLECTION_NAME].find({"_id": {"$in": mail_ids},
+                                                             EmailOutbox.LOCKED_BY: lease_token})
+                    .sort(EmailOutbox.NEXT_ATTEMPT_AT, 1))
+
+    @classmethod
+    def mark_sent(cls, mail_id):
+        # the body contains tokens, no need to keep it once delivered
+        DM.db[EmailOutbox.COLLECTION_NAME].update_one(
+            filter={"_id": mail_id},
+            update={"$set": {EmailOutbox.STATUS: EmailOutbox.STATUS_SENT, EmailOutbox.SENT_AT: datetime.utcnow()},
+                    "$unset": {EmailOutbox.LOCKED_UNTIL: "", EmailOutbox.LOCKED_BY: "", EmailOutbox.BODY: ""}})
+
+    @classmethod
+    def mark_failed(cls, mail_doc, error, max_attempts, base_backoff_seconds):
+        """Schedules a retry with exponential backoff, or moves the mail to the dead state"""
+        attempts = mail_doc[EmailOutbox.ATTEMPTS]
+        update = {EmailOutbox.LAST_ERROR: error}
+        if attempts >= max_attempts:
+            update[EmailOutbox.STATUS] = EmailOutbox.STATUS_DEAD
+            Metrics.increment("emailOutbox.dead")
+        else:
+            update[EmailOutbox.STATUS] = EmailOutbox.STATUS_PENDING
+            backoff_seconds = min(base_backoff_seconds * (2 ** (attempts - 1)), 3600)
+            update[EmailOutbox.NEXT_ATTEMPT_AT] = datetime.utcnow() + timedelta(seconds=backoff_seconds)
+        DM.db[EmailOutbox.COLLECTION_NAME].update_one(filter={"_id": mail_doc["_id"]},
+                                                      update={"$set": update,
+                                                              "$unset": {EmailOutbox.LOCKED_UNTIL: "",
+                                                                         EmailOutbox.LOCKED_BY: ""}})
+
+
+class EmailDispatcher:
+    """Delivers the mails from the outbox in batches, on a background thread (or via scripts/email_dispatcher.py)"""
+    transport = ConsoleTransport()
+    batch_size = 50
+    max_attempts = 8
+    base_backoff_seconds = 30
+    poll_interval_seconds = 2
+    _thread = None
+    _stop_event = threading.Event()
+
+    @classmethod
+    def configure(cls, transport, batch_size=50, max_attempts=8, base_backoff_seconds=30, poll_interval_seconds=2):
+        cls.transport = transport
+        cls.batch_size = batch_size
+        cls.max_attempts = max_attempts
+        cls.base_backoff_seconds = base_backoff_seconds
+        cls.poll_interval_seconds = poll_interval_seconds
+
+    @classmethod
+    def dispatch_once(cls):
+        """Delivers one batch, returns the number of mails processed"""
+        batch = EmailOutboxService.claim_batch(cls.batch_size)
+        for mail_doc in batch:
+            try:
+                with Metrics.timer("emailOutbox.send"):
+                    cls.transport.send(to=mail_doc[EmailOutbox.TO],
+                                       subject=mail_doc[EmailOutbox.SUBJECT],
+                                       body=mail_doc[EmailOutbox.BODY])
+                EmailOutboxService.mark_sent(mail_doc["_id"])
+                Metrics.increment("emailOutbox.sent")
+            except EmailDeliveryError as e:
+                Metrics.increment("emailOutbox.failed")
+                EmailOutboxService.mark_failed(mail_doc, str(e), cls.max_attempts, cls.base_backoff_seconds)
+        return len(batch)
+
+    @classmethod
+    def run_forever(cls):
+        while not cls._stop_event.is_set():
+            try:
+                processed = cls.dispatch_once()
+            except Exception as e:
+                # database unavailable etc. The claimed mails are retried once their lease expires
+                print(f"Email dispatcher error: {e}")
+                processed = 0
+            if processed < cls.batch_size:
+                # outbox drained, wait for new mails
+                cls._stop_event.wait(cls.poll_interval_seconds)
+
+    @classmethod
+    def start(cls):
+        if cls._thread is not None and cls._thread.is_alive():
+            return
+        cls._stop_event.clear()
+        cls._thread = threading.Thread(target=cls.run_forever, daemon=True, name="email-dispatcher")
+        cls._thread.start()
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
@@ -0,0 +1,51 @@
+import sendgrid
+from sendgrid.helpers.mail import Email, Mail
+
+# TODO: change from address and names
+from_address = "no-reply@marchingbytes.com"
+from_name = "MarchingBytes Automated"
+
+
+class EmailDeliveryError(Exception):
+    pass
+
+
+class SendGridTransport:
+    """Delivers mails via SendGrid, the API client (and its connection) is reused across mails"""
+
+    def __init__(self, api_key):
+        self.client = sendgrid.SendGridAPIClient(api_key)
+        self.from_sender = Email(email=from_address, name=from_name)
+
+    def send(self, to, subject, body):
+        my_mail = Mail(from_email=self.from_sender, to_emails=to, subject=subject, html_content=body)
+        try:
+            response = self.client.send(my_mail)
+        except Exception as e:
+            # python_http_client raises HTTPError subclasses for 4xx/5xx responses
+            raise EmailDeliveryError(str(e))
+        if response.status_code >= 300:
+            raise EmailDeliveryError(f"SendGrid responded with {response.status_code}")
+
+
+class ConsoleTransport:
+    """Used when SendGrid is not configured"""
+
+    def send(self, to, subject, body):
+        print("Sendgrid not configured!")
+        print(f"to {to}, subject {subject}, body {body}")
+
+
+class FakeEmailTransport:
+    """Keeps the delivered mails in memory, used by tests & benchmarks.
+    Set fail_next to make the next n deliveries fail."""
+
+    def __init__(self):
+        self.sent = []
+        self.fail_next = 0
+
+    def send(self, to, subject, body):
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise EmailDeliveryError("Fake delivery failure")
+        self.sent.append({"to": to, "subject": subject, "body": body})
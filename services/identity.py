@@ -0,0 +1,68 @@
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt_identity, get_jwt_claims
+from application_error import ApplicationError
+from constants import JwtClaims
+from services.claims_cache import ClaimsCacheService
+from services.user_state import UserStateService
+
+
+class Identity:
+    """The caller of a request: user id, verified flag & roles"""
+    __slots__ = ("user_id", "is_verified", "is_admin", "is_super_admin", "is_revalidated")
+
+    def __init__(self, user_id, claims, is_revalidated=False):
+        self.user_id = user_id
+        self.is_verified = claims.get(JwtClaims.IS_EMAIL_ADDRESS_VERIFIED, False)
+        self.is_admin = claims.get(JwtClaims.IS_ADMIN, False)
+        self.is_super_admin = claims.get(JwtClaims.IS_SUPER_ADMIN, False)
+        self.is_revalidated = is_revalidated
+
+
+class IdentityService:
+    """Builds the identity of the caller from the verified access token, once per request (memoized on flask.g).
+    The token claims are trusted as is, so the authenticated reads never query the database. Sensitive operations
+    ask for a strict identity: the claims are revalidated against the cached token claims (see ClaimsCacheService),
+    so that a role change applies before the token expires."""
+
+    @classmethod
+    def current(cls, strict=False):
+        """Identity of the caller, the access token must have been verified (jwt_required & co)"""
+        identity = g.get("identity") if has_request_context() else None
+        if identity is None:
+            user_id = get_jwt_identity()
+            if user_id is None:
+                raise ApplicationError("Missing access token!", 401)
+            identity = Identity(user_id, get_jwt_claims())
+            g.identity = identity
+        if strict and not identity.is_revalidated:
+            identity = Identity(identity.user_id, cls.token_claims(identity.user_id), is_revalidated=True)
+            g.identity = identity
+        return identity
+
+    @classmethod
+    def forget(cls):
+        """Drops the identity of the request"""
+        if has_request_context():
+            g.pop("identity", None)
+
+    @classmethod
+    def token_claims(cls, user_id):
+        """Claims added to the access tokens of user_id, cached"""
+        return ClaimsCacheService.get_token_claims(user_id, lambda: cls.__load_token_claims__(user_id))
+
+    @classmethod
+    def __load_token_claims__(cls, user_id):
+        # single query, already memoized if the user was just looked up during login
+        user_state = UserStateService.get_by_id(user_id)
+        if user_state is None:
+            return {
+                JwtClaims.IS_EMAIL_ADDRESS_VERIFIED: False,
+                JwtClaims.IS_ADMIN: False,
+                JwtClaims.IS_SUPER_ADMIN: False
+            }
+        # Note: Add other claims as required
+        return {
+            JwtClaims.IS_EMAIL_ADDRESS_VERIFIED: user_state.is_verified,
+            JwtClaims.IS_ADMIN: user_state.is_admin,
+            JwtClaims.IS_SUPER_ADMIN: user_state.is_super_admin
+        }
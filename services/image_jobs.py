@@ -0,0 +1,135 @@
+import io
+import threading
+from datetime import datetime, timedelta
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from database_manager import DatabaseManager as DM
+from constants import ImageJobs
+from application_error import ApplicationError
+from services.profile_picture import ProfilePictureService
+from services.direct_upload import DirectUploadService
+from metrics import Metrics
+
+
+class ImageJobService:
+    """Mongo backed queue of profile picture uploads, processed by ImageJobWorker (scripts/image_worker.py)"""
+    # a claimed job is handed to another worker if it is not finished within this time
+    LEASE_SECONDS = 120
+    MAX_ATTEMPTS = 3
+
+    @classmethod
+    def enqueue(cls, user_id, data=None, staging_key=None):
+        """data is the raw uploaded file, or staging_key the S3 object of a direct upload. Returns the job id"""
+        job = {
+            ImageJobs.USER_ID: user_id,
+            ImageJobs.STATUS: ImageJobs.STATUS_QUEUED,
+            ImageJobs.ATTEMPTS: 0,
+            ImageJobs.CREATED_AT: datetime.utcnow()
+        }
+        if staging_key is not None:
+            job[ImageJobs.STAGING_KEY] = staging_key
+        else:
+            job[ImageJobs.PAYLOAD] = Binary(data)
+        job_id = DM.db[ImageJobs.COLLECTION_NAME].insert_one(job).inserted_id
+        Metrics.increment("imageJobs.enqueued")
+        return str(job_id)
+
+    @classmethod
+    def get_status(cls, job_id, user_id):
+        """Returns None if the job does not exist or belongs to another user"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        return DM.db[ImageJobs.COLLECTION_NAME].find_one(
+            {"_id": ObjectId(job_id), ImageJobs.USER_ID: user_id},
+            projection={ImageJobs.STATUS: 1, ImageJobs.OBJECT_NAME: 1, ImageJobs.ERROR: 1})
+
+    @classmethod
+    def claim(cls):
+        """Atomically claims the oldest queued job (or a job whose worker died), None if there is nothing to do"""
+        now = datetime.utcnow()
+        return DM.db[ImageJobs.COLLECTION_NAME].find_one_and_update(
+            filter={"$or": [
+                {ImageJobs.STATUS: ImageJobs.STATUS_QUEUED},
+                {ImageJobs.STATUS: ImageJobs.STATUS_PROCESSING, ImageJobs.LOCKED_UNTIL: {"$lte": now}}
+            ]},
+            update={"$set": {ImageJobs.STATUS: ImageJobs.STATUS_PROCESSING,
+                             ImageJobs.LOCKED_UNTIL: now + timedelta(seconds=cls.LEASE_SECONDS)},
+                    "$inc": {ImageJobs.ATTEMPTS: 1}},
+            sort=[(ImageJobs.CREATED_AT, 1)],
+            return_document=ReturnDocument.AFTER)
+
+    @classmethod
+    def complete(cls, job_id, object_name):
+        # the payload is not required anymore
+        DM.db[ImageJobs.COLLECTION_NAME].update_one(
+            filter={"_id": job_id},
+            update={"$set": {ImageJobs.STATUS: ImageJobs.STATUS_DONE,
+                             ImageJobs.OBJECT_NAME: object_name,
+                             ImageJobs.FINISHED_AT: datetime.utcnow()},
+                    "$unset": {ImageJobs.PAYLOAD: "", ImageJobs.LOCKED_UNTIL: ""}})
+
+    @classmethod
+    def fail(cls, job, error, retry):
+        """Queues the job again if retry is set & attempts are left, else marks it as failed"""
+        if retry and job[ImageJobs.ATTEMPTS] < cls.MAX_ATTEMPTS:
+            update = {"$set": {ImageJobs.STATUS: ImageJobs.STATUS_QUEUED, ImageJobs.ERROR: error},
+                      "$unset": {ImageJobs.LOCKED_UNTIL: ""}}
+        else:
+            update = {"$set": {ImageJobs.STATUS: ImageJobs.STATUS_FAILED,
+                               ImageJobs.ERROR: error,
+                               ImageJobs.FINISHED_AT: datetime.utcnow()},
+                      "$unset": {ImageJobs.PAYLOAD: "", ImageJobs.LOCKED_UNTIL: ""}}
+            Metrics.increment("imageJobs.failed")
+        DM.db[ImageJobs.COLLECTION_NAME].update_one(filter={"_id": job["_id"]}, update=update)
+
+
+class ImageJobWorker:
+    """Processes the queued picture uploads, one job at a time. Run one per process (scripts/image_worker.py)"""
+    poll_interval_seconds = 1
+    _stop_event = threading.Event()
+
+    @classmethod
+    def process_next(cls):
+        """Processes one job, returns False if the queue was empty"""
+        job = ImageJobService.claim()
+        if job is None:
+            return False
+        if job[ImageJobs.ATTEMPTS] > ImageJobService.MAX_ATTEMPTS:
+            # the workers processing it kept dying (lease expired)
+            ImageJobService.fail(job, "Unable to process the picture. Please try again!", retry=False)
+            return True
+        try:
+            with Metrics.timer("imageJobs.process"):
+                if ImageJobs.STAGING_KEY in job:
+                    object_name = DirectUploadService.process_upload(job[ImageJobs.USER_ID],
+                                                                     job[ImageJobs.STAGING_KEY])
+                else:
+                    object_name = ProfilePictureService.store_picture(job[ImageJobs.USER_ID],
+                                                                      io.BytesIO(job[ImageJobs.PAYLOAD]))
+            ImageJobService.complete(job["_id"], object_name)
+            Metrics.increment("imageJobs.done")
+        except ApplicationError as e:
+            # invalid image, retrying would not help
+            ImageJobService.fail(job, e.message, retry=False)
+        except Exception as e:
+            # S3 or database unavailable
+            print(f"Image job {job['_id']} failed: {e}")
+            ImageJobService.fail(job, "Unable to process the picture. Please try again!", retry=True)
+        return True
+
+    @classmethod
+    def run_forever(cls):
+        while not cls._stop_event.is_set():
+            try:
+                processed = cls.process_next()
+            except Exception as e:
+                # database unavailable, the claimed job is retried once its lease expires
+                print(f"Image worker error: {e}")
+                processed = False
+            if not processed:
+                cls._stop_event.wait(cls.poll_interval_seconds)
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
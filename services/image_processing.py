@@ -0,0 +1,74 @@
+import io
+from PIL import Image, UnidentifiedImageError, features
+from application_error import ApplicationError
+
+# encoder settings of the supported output formats, tuned for small photos
+OUTPUT_FORMATS = {
+    "jpeg": {"content_type": "image/jpeg", "extension": "jpg",
+             "options": {"format": "JPEG", "quality": 85, "progressive": True, "optimize": True}},
+    "webp": {"content_type": "image/webp", "extension": "webp",
+             "options": {"format": "WEBP", "quality": 80, "method": 4}},
+    "avif": {"content_type": "image/avif", "extension": "avif",
+             "options": {"format": "AVIF", "quality": 60}},
+}
+
+
+class PictureVariant:
+    __slots__ = ("size", "format", "data", "width")
+
+    def __init__(self, size, format, data, width):
+        # bounding box
+        self.size = size
+        self.format = format
+        # BytesIO positioned at 0
+        self.data = data
+        # of the encoded picture, at most size
+        self.width = width
+
+    @property
+    def content_type(self):
+        return OUTPUT_FORMATS[self.format]["content_type"]
+
+    @property
+    def extension(self):
+        return OUTPUT_FORMATS[self.format]["extension"]
+
+
+def is_format_supported(format):
+    """avif & webp depend on the codecs Pillow was built with"""
+    if format == "jpeg":
+        return True
+    return format in OUTPUT_FORMATS and features.check(format)
+
+
+def __decode__(stream, max_w, max_h):
+    try:
+        image = Image.open(stream)
+        # JPEG only (no-op for other formats): let the decoder downscale by 1/2, 1/4 or 1/8 while decoding,
+        # instead of decoding the full resolution image & throwing most of it away
+        image.draft("RGB", (max_w, max_h))
+        image.thumbnail((max_w, max_h))
+    except (UnidentifiedImageError, OSError):
+        # OSError: truncated or corrupt image data
+        raise ApplicationError("Invalid image file!")
+    # remove the alpha channel (& palette), otherwise we cannot save as jpg
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def render_picture_variants(stream, sizes, formats):
+    """Decodes the image once & encodes every size (square bounding box, largest first) in every format.
+    Smaller sizes are downscaled from the previous (larger) one, which is much cheaper than the original."""
+    sizes = sorted(sizes, reverse=True)
+    image = __decode__(stream, sizes[0], sizes[0])
+    variants = []
+    for size in sizes:
+        image.thumbnail((size, size), Image.LANCZOS)
+        for format in formats:
+            output = io.BytesIO()
+            image.save(output, **OUTPUT_FORMATS[format]["options"])
+            output.seek(0)
+            variants.append(PictureVariant(size, format, output, image.width))
+    return variants
+
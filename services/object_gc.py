@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database_manager import DatabaseManager as DM
+from constants import OrphanedObjects, PictureObjects, UserProfile
+from repositories.user_profiles import ProfilePicture
+from services.aws_s3 import AwsS3
+from metrics import Metrics
+
+
+class ObjectGarbageCollector:
+    """Deferred deletion of the stored objects. Requests only record the objects they orphan, the collector
+    deletes them in batches once the grace period is over (scripts/object_gc.py). Failed deletes stay recorded
+    & are retried, the reconciliation scan finds the objects which leaked anyway."""
+    grace_seconds = 3600
+    batch_size = 1000
+    retry_seconds = 600
+    poll_interval_seconds = 60
+    # longer than deleting a batch can take: the claims of a collector which died are taken over afterwards
+    claim_lease_seconds = 300
+    # object names under these prefixes are checked by reconcile
+    RECONCILED_PREFIXES = ("public/",)
+    _stop_event = threading.Event()
+
+    @classmethod
+    def configure(cls, grace_seconds=3600, batch_size=1000, retry_seconds=600, poll_interval_seconds=60):
+        cls.grace_seconds = grace_seconds
+        cls.batch_size = batch_size
+        cls.retry_seconds = retry_seconds
+        cls.poll_interval_seconds = poll_interval_seconds
+
+    @classmethod
+    def record_orphans(cls, object_names, delay_seconds=None):
+        """Schedules the deletion of the objects, after the grace period by default"""
+        now = datetime.utcnow()
+        delete_after = now + timedelta(seconds=cls.grace_seconds if delay_seconds is None else delay_seconds)
+        operations = [UpdateOne({"_id": object_name},
+                                {"$setOnInsert": {OrphanedObjects.ORPHANED_AT: now,
+                                                  OrphanedObjects.DELETE_AFTER: delete_after,
+                                                  OrphanedObjects.ATTEMPTS: 0}},
+                                upsert=True)
+                      for object_name in set(object_names) if object_name]
+        if operations:
+            DM.db[OrphanedObjects.COLLECTION_NAME].bulk_write(operations, ordered=False)
+            Metrics.increment("objectGc.recorded", len(operations))
+
+    @classmethod
+    def collect_once(cls):
+        """Deletes one batch of due orphans, returns the number of orphans processed"""
+        orphans = list(DM.db[OrphanedObjects.COLLECTION_NAME].find(
+            {OrphanedObjects.DELETE_AFTER: {"$lte": datetime.utcnow()}},
+            projection={"_id": 1}).sort(OrphanedObjects.DELETE_AFTER, 1).limit(cls.batch_size))
+        object_names = [orphan["_id"] for orphan in orphans]
+        to_delete = [object_name for object_name in object_names if cls.__claim__(object_name)]
+        errors = AwsS3.delete_objects(to_delete) if to_delete else {}
+        cls.__release_claims__(to_delete, errors)
+        done = [object_name for object_name in object_names if object_name not in errors]
+        DM.db[OrphanedObjects.COLLECTION_NAME].delete_many({"_id": {"$in": done}})
+        for object_name, error in errors.items():
+            DM.db[OrphanedObjects.COLLECTION_NAME].update_one(
+                {"_id": object_name},
+                {"$set": {OrphanedObjects.LAST_ERROR: error,
+                          OrphanedObjects.DELETE_AFTER: datetime.utcnow() + timedelta(seconds=cls.retry_seconds)},
+                 "$inc": {OrphanedObjects.ATTEMPTS: 1}})
+        Metrics.increment("objectGc.deleted", len(to_delete) - len(errors))
+        Metrics.increment("objectGc.failed", len(errors))
+        return len(object_names)
+
+    @classmethod
+    def __claim__(cls, object_name):
+        """False if the object is referenced again (identical picture uploaded during the grace period).
+        Otherwise marks its pictureObjects entry as being deleted (for claim_lease_seconds): PictureStoreService.store
+        stores the same bytes under another name meanwhile"""
+        picture_objects = DM.db[PictureObjects.COLLECTION_NAME]
+        now = datetime.utcnow()
+        lease = {"$set": {PictureObjects.DELETING_UNTIL: now + timedelta(seconds=cls.claim_lease_seconds)}}
+        if picture_objects.update_one({"_id": object_name, PictureObjects.REF_COUNT: {"$lte": 0},
+                                       "$or": [{PictureObjects.DELETING_UNTIL: None},
+                                               {PictureObjects.DELETING_UNTIL: {"$lt": now}}]},
+                                      lease).matched_count:
+            return True
+        # not reference counted (e.g. staging upload, picture stored before the content addressed naming):
+        # claimed with a placeholder entry, unless the entry exists (referenced or claimed by another collector)
+        try:
+            picture_objects.insert_one({"_id": object_name, PictureObjects.REF_COUNT: 0, **lease["$set"]})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    @classmethod
+    def __release_claims__(cls, object_names, errors):
+        """Removes the entries of the deleted objects. The objects referenced again while they were being deleted
+        (lease expired, or a store call not done giving its reference back) are marked as not uploaded, the next
+        PictureStoreService.store call uploads them again"""
+        picture_objects = DM.db[PictureObjects.COLLECTION_NAME]
+        for object_name in object_names:
+            if object_name in errors:
+                # not deleted
+                picture_objects.update_one({"_id": object_name}, {"$unset": {PictureObjects.DELETING_UNTIL: ""}})
+            elif not picture_objects.delete_one({"_id": object_name,
+                                                 PictureObjects.REF_COUNT: {"$lte": 0}}).deleted_count:
+                picture_objects.update_one({"_id": object_name}, {"$set": {PictureObjects.UPLOADED: False},
+                                                                  "$unset": {PictureObjects.DELETING_UNTIL: ""}})
+
+    @classmethod
+    def reconcile(cls, dry_run=False):
+        """Lists the bucket & records the objects which no profile refers to (older than the grace period, so that
+        uploads in progress are not affected). Returns the object names found"""
+        referenced = set()
+        for doc in DM.db[UserProfile.COLLECTION_NAME].find({}, projection=ProfilePicture.PROJECTION):
+            referenced.update(ProfilePicture.from_document(doc).object_names())
+        for doc in DM.db[PictureObjects.COLLECTION_NAME].find({PictureObjects.REF_COUNT: {"$gt": 0}},
+                                                              projection={"_id": 1}):
+            referenced.add(doc["_id"])
+        already_recorded = {doc["_id"] for doc in DM.db[OrphanedObjects.COLLECTION_NAME].find({}, {"_id": 1})}
+        modified_before = datetime.utcnow() - timedelta(seconds=cls.grace_seconds)
+        leaked = []
+        for prefix in cls.RECONCILED_PREFIXES:
+            for object_name, last_modified in AwsS3.list_objects(prefix):
+                if object_name in referenced or object_name in already_recorded or last_modified > modified_before:
+                    continue
+                leaked.append(object_name)
+        if not dry_run:
+            cls.record_orphans(leaked)
+        Metrics.increment("objectGc.leaked", len(leaked))
+        return leaked
+
+    @classmethod
+    def run_forever(cls):
+        while not cls._stop_event.is_set():
+            try:
+                processed = cls.collect_once()
+            except Exception as e:
+                # database or S3 unavailable, the orphans are still recorded
+                print(f"Object garbage collector error: {e}")
+                processed = 0
+            if processed < cls.batch_size:
+                cls._stop_event.wait(cls.poll_interval_seconds)
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from services.security import build_password_context
+from application_error import ApplicationError
+from metrics import Metrics
+
+# context of the pool worker processes, created by __initialize_worker__
+__worker_context__ = None
+
+
+def __initialize_worker__(scheme, params):
+    global __worker_context__
+    __worker_context__ = build_password_context(scheme, params)
+
+
+def __hash_in_worker__(password):
+    return __worker_context__.hash(password)
+
+
+def __verify_in_worker__(password, password_hash):
+    return __worker_context__.verify(password, password_hash)
+
+
+def __verify_and_update_in_worker__(password, password_hash):
+    return __worker_context__.verify_and_update(password, password_hash)
+
+
+class PasswordHashingService:
+    """Password hashing is CPU bound & slow by design. Running it on the request thread starves the other
+    requests of the worker during login spikes, so it runs on a bounded process pool instead.
+    When more than max_pending operations are waiting, requests fail fast with a 503."""
+    executor = None
+    max_pending = 0
+    context = build_password_context()
+    _pending = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, workers, max_pending, scheme="argon2", params=None):
+        """workers=0 hashes inline on the request thread (used by the tests).
+        params=None uses the passlib defaults of the scheme, cheaper params make tests fast"""
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False)
+            cls.executor = None
+        cls.context = build_password_context(scheme, params)
+        cls.max_pending = max_pending
+        if workers > 0:
+            cls.executor = ProcessPoolExecutor(max_workers=workers, initializer=__initialize_worker__,
+                                               initargs=(scheme, params))
+
+    @classmethod
+    def hash(cls, password):
+        with Metrics.timer("passwordHashing.hash"):
+            if cls.executor is None:
+                return cls.context.hash(password)
+            return cls.__run_in_pool__(__hash_in_worker__, password)
+
+    @classmethod
+    def verify(cls, password, password_hash):
+        with Metrics.timer("passwordHashing.verify"):
+            if cls.executor is None:
+                return cls.context.verify(password, password_hash)
+            return cls.__run_in_pool__(__verify_in_worker__, password, password_hash)
+
+    @classmethod
+    def verify_and_update(cls, password, password_hash):
+        """Returns (is_valid, new_hash). new_hash is None unless the stored hash uses a deprecated scheme
+        or outdated params, in which case the caller should replace the stored hash with it"""
+        with Metrics.timer("passwordHashing.verify"):
+            if cls.executor is None:
+                return cls.context.verify_and_update(password, password_hash)
+            return cls.__run_in_pool__(__verify_and_update_in_worker__, password, password_hash)
+
+    @classmethod
+    def __run_in_pool__(cls, fn, *args):
+        with cls._lock:
+            if cls._pending >= cls.max_pending:
+                Metrics.increment("passwordHashing.rejected")
+                raise ApplicationError("Server busy, please try again!", 503)
+            cls._pending += 1
+            Metrics.set_gauge("passwordHashing.pending", cls._pending)
+        Metrics.increment("passwordHashing.submitted")
+        try:
+            return cls.executor.submit(fn, *args).result()
+        finally:
+            with cls._lock:
+                cls._pending -= 1
+                Metrics.set_gauge("passwordHashing.pending", cls._pending)
@@ -0,0 +1,96 @@
+import hashlib
+from datetime import datetime
+from pymongo import ReturnDocument
+from database_manager import DatabaseManager as DM
+from constants import PictureObjects
+from services.aws_s3 import AwsS3
+from services.object_gc import ObjectGarbageCollector
+from metrics import Metrics
+
+
+class PictureStoreService:
+    """Content addressed storage of the encoded pictures.
+    The object name is derived from the sha256 of the bytes, so identical outputs (e.g. a retried upload) share one
+    S3 object & the object behind a name never changes. The pictureObjects collection counts the references
+    to every object, the object is garbage collected once nothing refers to it anymore."""
+    # Any object name starting with "public" is publicly visible via S3
+    OBJECT_PREFIX = "public/pictures/"
+    # names are immutable, clients & CDNs can cache them forever
+    CACHE_CONTROL = "public, max-age=31536000, immutable"
+    ENTRY_PROJECTION = {PictureObjects.REF_COUNT: 1, PictureObjects.UPLOADED: 1, PictureObjects.DELETING_UNTIL: 1}
+
+    @classmethod
+    def object_name(cls, data, extension, generation=0):
+        """generation: the same bytes under another name, while the garbage collector deletes the previous ones"""
+        suffix = f"-{generation}" if generation else ""
+        return f"{cls.OBJECT_PREFIX}{hashlib.sha256(data).hexdigest()}{suffix}.{extension}"
+
+    @classmethod
+    def is_content_addressed(cls, object_name):
+        """False for the pictures stored before the content addressed naming (not reference counted)"""
+        return object_name.startswith(cls.OBJECT_PREFIX)
+
+    @classmethod
+    def store(cls, fileobj, extension, content_type):
+        """Adds a reference to the object holding these bytes, uploads them unless the object is known to exist
+        (uploaded by a previous call). Returns the object name"""
+        data = fileobj.getvalue()
+        generation = 0
+        while True:
+            object_name = cls.object_name(data, extension, generation)
+            entry = DM.db[PictureObjects.COLLECTION_NAME].find_one_and_update(
+                filter={"_id": object_name},
+                update={"$inc": {PictureObjects.REF_COUNT: 1},
+                        "$setOnInsert": {PictureObjects.UPLOADED: False,
+                                         PictureObjects.CONTENT_TYPE: content_type,
+                                         PictureObjects.SIZE: len(data),
+                                         PictureObjects.CREATED_AT: datetime.utcnow()}},
+                projection=cls.ENTRY_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER)
+            deleting_until = entry.get(PictureObjects.DELETING_UNTIL)
+            if deleting_until is None or deleting_until <= datetime.utcnow():
+                break
+            # the garbage collector is deleting this object: gives the reference back & stores the bytes under
+            # the next name instead of waiting for the collector (up to its lease) on the request thread
+            cls.release([object_name])
+            Metrics.increment("pictureStore.nextGeneration")
+            generation += 1
+        # refCount 1: new or orphaned entry, the object may be deleted by the garbage collector at any time.
+        # Not uploaded: the first upload is in progress & may still fail, the same bytes are uploaded again.
+        # Still being deleted: the lease of the collector expired, the object may or may not exist
+        if entry[PictureObjects.REF_COUNT] > 1 and entry.get(PictureObjects.UPLOADED, True) \
+                and entry.get(PictureObjects.DELETING_UNTIL) is None:
+            Metrics.increment("pictureStore.deduplicated")
+            return object_name
+        try:
+            fileobj.seek(0)
+            AwsS3.upload_fileobj(fileobj, object_name, content_type=content_type, cache_control=cls.CACHE_CONTROL)
+        except BaseException:
+            # give the reference back, the object may not exist
+            cls.release([object_name])
+            raise
+        DM.db[PictureObjects.COLLECTION_NAME].update_one({"_id": object_name},
+                                                         {"$set": {PictureObjects.UPLOADED: True},
+                                                          "$unset": {PictureObjects.DELETING_UNTIL: ""}})
+        Metrics.increment("pictureStore.uploaded")
+        return object_name
+
+    @classmethod
+    def release(cls, object_names):
+        """Removes a reference to each object. The objects which are not referenced anymore are deleted later,
+        by the ObjectGarbageCollector"""
+        orphans = []
+        for object_name in object_names:
+            if cls.is_content_addressed(object_name):
+                after = DM.db[PictureObjects.COLLECTION_NAME].find_one_and_update(
+                    filter={"_id": object_name},
+                    update={"$inc": {PictureObjects.REF_COUNT: -1}},
+                    projection={PictureObjects.REF_COUNT: 1},
+                    return_document=ReturnDocument.AFTER)
+                if after is None or after[PictureObjects.REF_COUNT] > 0:
+                    continue
+                # the entry is kept with refCount 0 until the object is collected,
+                # store() uploads the object again if it is referenced in the meantime
+            orphans.append(object_name)
+        ObjectGarbageCollector.record_orphans(orphans)
@@ -0,0 +1,108 @@
+from services.cache import TTLCache
+from services.broadcast import LocalInvalidationBroadcast, ChangeStreamInvalidationBroadcast
+from constants import UserProfile
+
+
+class PublicProfileCacheService:
+    """Read-through cache of the public profile responses (GET /profileById/<id>), keyed by user id.
+    Two tiers: an in-process LRU (invalidated on every worker through the broadcast) in front of an optional
+    shared cache (services.shared_cache) filled by all the workers.
+    Cached entries are json serializable dicts, e.g. {"profile": response dict or None (no profile), "etag": ...}
+    An invalidation replaces the shared entry with a tombstone for tombstone_ttl_seconds and the shared tier is only
+    filled when the key is not set (SET NX): a reader which loaded the profile before the write cannot store its
+    stale entry after the invalidation."""
+    CHANNEL = "publicProfiles"
+    SHARED_KEY_PREFIX = "publicProfile:"
+    TOMBSTONE = "invalidated"
+    cache = TTLCache()
+    shared_cache = None
+    shared_ttl_seconds = 300
+    # longer than loading an entry can take
+    tombstone_ttl_seconds = 10
+    broadcast = LocalInvalidationBroadcast()
+
+    @classmethod
+    def configure(cls, max_size, ttl_seconds, broadcast, shared_cache=None, shared_ttl_seconds=300,
+                  tombstone_ttl_seconds=10):
+        """Must be called once per worker (and per image worker process) before serving requests"""
+        cls.broadcast.stop()
+        cls.cache = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        cls.shared_cache = shared_cache
+        cls.shared_ttl_seconds = shared_ttl_seconds
+        cls.tombstone_ttl_seconds = tombstone_ttl_seconds
+        cls.broadcast = broadcast
+        cls.broadcast.subscribe(cls.CHANNEL, cls.cache.invalidate)
+        if isinstance(broadcast, ChangeStreamInvalidationBroadcast):
+            broadcast.watch(cls.CHANNEL, UserProfile.COLLECTION_NAME, cls.__user_id_from_profiles_change__)
+        cls.broadcast.start()
+
+    @classmethod
+    def get(cls, user_id, loader):
+        """Returns the cached entry of user_id. On a miss of both tiers, loader() builds the entry"""
+        return cls.cache.get_or_load(user_id, lambda: cls.__load_shared__(user_id, loader))
+
+    @classmethod
+    def get_many(cls, user_ids, loader):
+        """{user id: entry} of every user id. The misses of both tiers are built with a single
+        loader(missing user ids) call, which must return {user id: entry} for all of them"""
+        entries = {}
+        missing = []
+        for user_id in user_ids:
+            entry = cls.cache.get(user_id)
+            if entry is None:
+                missing.append(user_id)
+            else:
+                entries[user_id] = entry
+        if not missing:
+            return entries
+        generation = cls.cache.generation
+        invalidated = set()
+        if cls.shared_cache is not None:
+            shared_entries = cls.shared_cache.get_many([cls.SHARED_KEY_PREFIX + user_id for user_id in missing])
+            for user_id in missing:
+                entry = shared_entries.get(cls.SHARED_KEY_PREFIX + user_id)
+                if entry == cls.TOMBSTONE:
+                    invalidated.add(user_id)
+                elif entry is not None:
+                    entries[user_id] = entry
+                    cls.cache.set_if_unchanged(user_id, entry, generation)
+            missing = [user_id for user_id in missing if user_id not in entries]
+        if not missing:
+            return entries
+        loaded = loader(missing)
+        for user_id in missing:
+            entry = loaded[user_id]
+            entries[user_id] = entry
+            cls.cache.set_if_unchanged(user_id, entry, generation)
+            if cls.shared_cache is not None and user_id not in invalidated:
+                cls.shared_cache.add(cls.SHARED_KEY_PREFIX + user_id, entry, cls.shared_ttl_seconds)
+        return entries
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Must be called after every write to the public fields of the profile"""
+        if cls.shared_cache is not None:
+            cls.shared_cache.set(cls.SHARED_KEY_PREFIX + user_id, cls.TOMBSTONE, cls.tombstone_ttl_seconds)
+        cls.broadcast.publish(cls.CHANNEL, user_id)
+
+    @classmethod
+    def __load_shared__(cls, user_id, loader):
+        if cls.shared_cache is None:
+            return loader()
+        entry = cls.shared_cache.get(cls.SHARED_KEY_PREFIX + user_id)
+        if entry is None:
+            entry = loader()
+            # fails if the key was invalidated (tombstone) or filled while loading
+            cls.shared_cache.add(cls.SHARED_KEY_PREFIX + user_id, entry, cls.shared_ttl_seconds)
+        elif entry == cls.TOMBSTONE:
+            # recently invalidated, the entry loaded now cannot be told apart from a stale one
+            entry = loader()
+        return entry
+
+    @classmethod
+    def __user_id_from_profiles_change__(cls, change):
+        full_document = change.get("fullDocument")
+        if full_document is None:
+            # deleted document, we cannot know the user. TTL expiry takes care of it
+            return None
+        return full_document.get(UserProfile.USERID)
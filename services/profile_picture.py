@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from services.aws_s3 import AwsS3
+from services.picture_store import PictureStoreService
+from services.image_processing import render_picture_variants, is_format_supported
+from services.user_profile import UserProfileService
+
+
+class ProfilePictureService:
+    # square bounding boxes (px) of the stored variants, the largest one is the default picture
+    SIZES = (400, 128, 48)
+    DEFAULT_FORMAT = "jpeg"
+    # served to the clients supporting them (in this order of preference), jpeg is always stored
+    formats = ("webp", "jpeg")
+    # variants are stored in parallel, boto3 clients are thread safe
+    upload_workers = 6
+    _executor = None
+    _executor_lock = Lock()
+
+    @classmethod
+    def configure(cls, formats, upload_workers=6):
+        """formats: e.g. ["avif", "webp", "jpeg"]. Formats unsupported by the installed Pillow are skipped"""
+        supported_formats = [f for f in formats if is_format_supported(f)]
+        for skipped_format in set(formats) - set(supported_formats):
+            print(f"Picture format {skipped_format} is not supported by Pillow, skipping")
+        if cls.DEFAULT_FORMAT not in supported_formats:
+            supported_formats.append(cls.DEFAULT_FORMAT)
+        cls.formats = tuple(supported_formats)
+        cls.upload_workers = upload_workers
+
+    @classmethod
+    def __get_executor__(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.upload_workers,
+                                                   thread_name_prefix="picture-upload")
+            return cls._executor
+
+    @classmethod
+    def store_picture(cls, user_id, stream):
+        """Renders the picture read from stream in every size & format, stores them &
+        sets them as the user's profile picture. Returns the object name of the default variant"""
+        variants = render_picture_variants(stream, cls.SIZES, cls.formats)
+        # objects are named after their content, identical variants are only uploaded once
+        uploads = [(variant, cls.__get_executor__().submit(PictureStoreService.store, variant.data,
+                                                           variant.extension, variant.content_type))
+                   for variant in variants]
+        picture_variants = {}
+        picture_widths = {}
+        errors = []
+        for variant, upload in uploads:
+            picture_widths[str(variant.size)] = variant.width
+            try:
+                picture_variants.setdefault(str(variant.size), {})[variant.format] = upload.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            # drop the references taken by the successful uploads
+            PictureStoreService.release(object_name for formats in picture_variants.values()
+                                        for object_name in formats.values())
+            raise errors[0]
+        default_object_name = picture_variants[str(max(cls.SIZES))][cls.DEFAULT_FORMAT]
+        # Make entry
+        UserProfileService.update_profile_picture(user_id, new_pic_object_name=default_object_name,
+                                                  new_picture_variants=picture_variants,
+                                                  new_picture_widths=picture_widths)
+        return default_object_name
+
+    @classmethod
+    def srcset(cls, picture_variants, picture_widths=None):
+        """{format: srcset} for <picture>/<img srcset>, e.g. {"webp": "<url> 48w, <url> 128w, <url> 400w"}, the
+        descriptors are the widths of the variants (picture_widths, the bounding box for older pictures).
+        Empty for the pictures uploaded before the variants were introduced"""
+        srcset = {}
+        widths = {}
+        for size in sorted((picture_variants or {}).keys(), key=int):
+            width = (picture_widths or {}).get(size, int(size))
+            for format, object_name in picture_variants[size].items():
+                # a picture smaller than several bounding boxes is not upscaled, its variants have the same width
+                if width in widths.setdefault(format, set()):
+                    continue
+                widths[format].add(width)
+                srcset.setdefault(format, []).append(f"{AwsS3.get_object_url(object_name)} {width}w")
+        return {format: ", ".join(candidates) for format, candidates in srcset.items()}
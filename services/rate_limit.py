@@ -0,0 +1,123 @@
+import math
+import time
+from functools import wraps
+from flask import request
+from application_error import RateLimitExceeded
+from services.shared_cache import LocalSharedCache
+from metrics import Metrics
+
+
+class RateLimit:
+    """At most limit requests per window_seconds"""
+    __slots__ = ("limit", "window_seconds")
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+
+def parse_rate_limits(value):
+    """Parses "UserLogin.ip=20/60,UserLogin.account=10/300" into
+    {("UserLogin", "ip"): RateLimit(20, 60), ("UserLogin", "account"): RateLimit(10, 300)}"""
+    limits = {}
+    if value is None or len(value.strip()) == 0:
+        return limits
+    for entry in value.split(","):
+        name, limit = entry.split("=")
+        resource_name, scope = name.strip().split(".")
+        count, window_seconds = limit.split("/")
+        limits[(resource_name, scope)] = RateLimit(int(count), int(window_seconds))
+    return limits
+
+
+class RateLimitService:
+    """Throttles the public endpoints doing expensive work (password hashing, mails) per client ip & per account.
+    Sliding window counters: the count of the previous fixed window, weighted by how much of it still overlaps the
+    sliding window, plus the count of the current fixed window. Two counters per key, stored in a shared cache
+    (services.shared_cache, i.e. redis for limits across all the workers or the in-process stand-in)."""
+    # (resource class name, "ip" | "account") -> RateLimit
+    DEFAULT_LIMITS = {
+        ("UserLogin", "ip"): RateLimit(30, 60),
+        ("UserLogin", "account"): RateLimit(10, 300),
+        ("RegisterUser", "ip"): RateLimit(10, 3600),
+        ("RegisterUser", "account"): RateLimit(3, 3600),
+        ("ResetPassword", "ip"): RateLimit(10, 3600),
+        ("ResetPassword", "account"): RateLimit(5, 3600),
+        ("ValidateEmailAddress", "ip"): RateLimit(30, 3600),
+        ("ValidateEmailAddress", "account"): RateLimit(10, 3600),
+    }
+    KEY_PREFIX = "rateLimit:"
+    enabled = True
+    limits = dict(DEFAULT_LIMITS)
+    counters = LocalSharedCache()
+    # number of proxies in front of the app (Heroku router: 1), each of them appends an X-Forwarded-For entry
+    trusted_proxies = 0
+
+    @classmethod
+    def configure(cls, counters, limits=None, trusted_proxies=0, enabled=True):
+        """limits override DEFAULT_LIMITS"""
+        cls.counters = counters
+        cls.limits = {**cls.DEFAULT_LIMITS, **(limits or {})}
+        cls.trusted_proxies = trusted_proxies
+        cls.enabled = enabled
+
+    @classmethod
+    def check(cls, resource_name, scope, value):
+        """Counts one request of value (ip address or account) & raises RateLimitExceeded over the limit"""
+        rate_limit = cls.limits.get((resource_name, scope))
+        if not cls.enabled or rate_limit is None or value is None:
+            return
+        window_seconds = rate_limit.window_seconds
+        now = time.time()
+        window = int(now // window_seconds)
+        key = f"{cls.KEY_PREFIX}{resource_name}:{scope}:{value}:"
+        count, previous_count = cls.counters.increment(key + str(window), 2 * window_seconds,
+                                                       previous_key=key + str(window - 1))
+        elapsed = now - window * window_seconds
+        estimated = previous_count * (window_seconds - elapsed) / window_seconds + count
+        if estimated > rate_limit.limit:
+            Metrics.increment(f"rateLimit.rejected.{resource_name}.{scope}")
+            # the estimate is below the limit again once the current window is over, at the latest
+            raise RateLimitExceeded(retry_after_seconds=max(1, math.ceil(window_seconds - elapsed)))
+
+    @classmethod
+    def client_ip(cls):
+        if cls.trusted_proxies == 0:
+            return request.remote_addr
+        # X-Forwarded-For entries, the ones appended by the trusted proxies can't be spoofed by the client
+        route = request.access_route
+        return route[-cls.trusted_proxies] if len(route) >= cls.trusted_proxies else route[0]
+
+
+def account_from_json(field):
+    """Account of a rate_limited request, taken from a field of the json body"""
+    def get_account(kwargs):
+        body = request.get_json(silent=True)
+        value = body.get(field) if isinstance(body, dict) else None
+        return value.lower() if isinstance(value, str) else None
+    return get_account
+
+
+def account_from_view_arg(name):
+    """Account of a rate_limited request, taken from the url"""
+    def get_account(kwargs):
+        value = kwargs.get(name)
+        return value.lower() if isinstance(value, str) else None
+    return get_account
+
+
+def rate_limited(account=None):
+    """Applies the limits of the resource class to the decorated method, per client ip & per account
+    (account(view kwargs) returns it, see account_from_json). Runs before any other work of the request,
+    requests over a limit get a 429 with a Retry-After header"""
+    def decorator(fn):
+        resource_name = fn.__qualname__.split(".")[0]
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            RateLimitService.check(resource_name, "ip", RateLimitService.client_ip())
+            if account is not None:
+                RateLimitService.check(resource_name, "account", account(kwargs))
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
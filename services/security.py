@@ -1,11 +1,36 @@
 from passlib.context import CryptContext
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_claims
+from flask_jwt_extended import verify_jwt_in_request
 from functools import wraps
 from application_error import ApplicationError
-from constants import JwtClaims
+from services.identity import IdentityService
 
-# Used for password operations
-password_context = CryptContext(schemes=["sha256_crypt"])
+# argon2 params used when PASSWORD_HASH_PARAMS is not set (OWASP minimum: 19 MiB, 2 iterations). The passlib
+# defaults need ~100 MB per hash, times the pool processes of every web worker
+DEFAULT_ARGON2_PARAMS = {"time_cost": 2, "memory_cost": 19456, "parallelism": 1}
+
+# All the schemes which can verify stored hashes. Only the configured scheme is used for new hashes.
+SUPPORTED_PASSWORD_SCHEMES = ["argon2", "bcrypt", "sha256_crypt"]
+
+
+def build_password_context(scheme="argon2", params=None):
+    """Context used for password operations, see services/password_hashing.py.
+    params are the passlib settings of the scheme, e.g. {"time_cost": 3, "memory_cost": 65536} for argon2
+    (None uses the passlib defaults). Hashes created with any other scheme or with other params are
+    reported by needs_update() and get upgraded on the next successful login."""
+    settings = {f"{scheme}__{key}": value for key, value in (params or {}).items()}
+    deprecated = [other_scheme for other_scheme in SUPPORTED_PASSWORD_SCHEMES if other_scheme != scheme]
+    return CryptContext(schemes=SUPPORTED_PASSWORD_SCHEMES, default=scheme, deprecated=deprecated, **settings)
+
+
+def parse_password_hash_params(value):
+    """Parses "time_cost=3,memory_cost=65536" into {"time_cost": 3, "memory_cost": 65536}"""
+    params = {}
+    if value is None or len(value.strip()) == 0:
+        return params
+    for entry in value.split(","):
+        key, param_value = entry.split("=")
+        params[key.strip()] = int(param_value)
+    return params
 
 
 # Custom decorator that verifies the JWT is present in
@@ -14,22 +39,20 @@ def admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
-        claims = get_jwt_claims()
-        is_admin = claims.get(JwtClaims.IS_ADMIN, False)
-        if not is_admin:
+        if not IdentityService.current().is_admin:
             raise ApplicationError("Admin only endpoint!", 403)
         else:
             return fn(*args, **kwargs)
     return wrapper
 
 
+# Super admin endpoints manage the roles of the other users: the claim is revalidated (strict identity),
+# a demoted super admin loses access at once instead of when the token expires
 def super_admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
-        claims = get_jwt_claims()
-        is_super_admin = claims.get(JwtClaims.IS_SUPER_ADMIN, False)
-        if not is_super_admin:
+        if not IdentityService.current(strict=True).is_super_admin:
             raise ApplicationError("Super-Admin only endpoint!", 403)
         else:
             return fn(*args, **kwargs)
@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from services.cache import TTLCache
+
+
+class LocalSharedCache:
+    """Stand-in for a shared cache, for tests & single worker deployments: entries live in this process only.
+    Values are stored serialized, like a real shared cache would."""
+
+    def __init__(self, max_size=10000):
+        self._cache = TTLCache(max_size=max_size)
+        self._max_counters = max_size
+        # key -> (count, expires at)
+        self._counters = {}
+        self._counters_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._cache.get(key)
+        return None if value is None else json.loads(value)
+
+    def get_many(self, keys):
+        """{key: value} of the keys found"""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, key, value, ttl_seconds):
+        self._cache.set(key, json.dumps(value), ttl_seconds)
+
+    def add(self, key, value, ttl_seconds):
+        """Sets the value only if key is not set. Returns True if it was set"""
+        return self._cache.set_if_absent(key, json.dumps(value), ttl_seconds)
+
+    def delete(self, key):
+        self._cache.invalidate(key)
+
+    def increment(self, key, ttl_seconds, previous_key=None):
+        """Adds 1 to the counter at key (created with a ttl of ttl_seconds) & reads the counter at previous_key.
+        Returns (count, previous count)"""
+        now = time.monotonic()
+        with self._counters_lock:
+            count, expires_at = self._counters.get(key, (0, 0))
+            if expires_at <= now:
+                count, expires_at = 0, now + ttl_seconds
+                if len(self._counters) >= self._max_counters:
+                    self.__prune_counters__(now)
+            self._counters[key] = (count + 1, expires_at)
+            previous_count, previous_expires_at = self._counters.get(previous_key, (0, 0))
+            return count + 1, previous_count if previous_expires_at > now else 0
+
+    def __prune_counters__(self, now):
+        self._counters = {key: entry for key, entry in self._counters.items() if entry[1] > now}
+        if len(self._counters) >= self._max_counters:
+            # full of live counters, forgetting them is the lesser evil
+            self._counters.clear()
+
+
+class RedisSharedCache:
+    """Shared by every worker & server. Values must be json serializable.
+    Errors are swallowed, the shared tier is an optimization: callers fall back to the database."""
+
+    def __init__(self, url, key_prefix="cache:", socket_timeout=0.05):
+        # redis is only required when this backend is used
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        self._key_prefix = key_prefix
+        self._errors = (redis.RedisError,)
+
+    def get(self, key):
+        try:
+            value = self._client.get(self._key_prefix + key)
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+            return None
+        return None if value is None else json.loads(value)
+
+    def get_many(self, keys):
+        """{key: value} of the keys found, with a single round trip"""
+        keys = list(keys)
+        try:
+            values = self._client.mget([self._key_prefix + key for key in keys])
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+            return {}
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value, ttl_seconds):
+        try:
+            self._client.set(self._key_prefix + key, json.dumps(value), ex=ttl_seconds)
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+
+    def add(self, key, value, ttl_seconds):
+        """Sets the value only if key is not set (SET NX). Returns True if it was set"""
+        try:
+            return bool(self._client.set(self._key_prefix + key, json.dumps(value), ex=ttl_seconds, nx=True))
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+            return False
+
+    def delete(self, key):
+        try:
+            self._client.delete(self._key_prefix + key)
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+
+    def increment(self, key, ttl_seconds, previous_key=None):
+        """Adds 1 to the counter at key (expiring ttl_seconds after the last increment) & reads the counter at
+        previous_key, with a single round trip. Returns (count, previous count), (0, 0) if redis is unavailable"""
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            pipeline.incr(self._key_prefix + key)
+            pipeline.expire(self._key_prefix + key, ttl_seconds)
+            if previous_key is not None:
+                pipeline.get(self._key_prefix + previous_key)
+            results = pipeline.execute()
+        except self._errors as e:
+            print(f"Shared cache unavailable: {e}")
+            return 0, 0
+        previous_count = results[2] if previous_key is not None else None
+        return results[0], int(previous_count) if previous_count is not None else 0
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import InvalidTokenError
+
+# asymmetric algorithms supported by the key ring (PyJWT 1.7 has no EdDSA)
+SUPPORTED_ALGORITHMS = ("RS256", "RS384", "RS512")
+
+
+def parse_manifest_time(value):
+    """ISO 8601 ("2026-10-18T00:00:00Z") to a naive utc datetime, None stays None"""
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class SigningKey:
+    """One key of the ring. Keys without a private key (private key destroyed after the rotation) only verify"""
+    __slots__ = ("kid", "private_key", "public_key", "activates_at", "retires_at")
+
+    def __init__(self, kid, private_key, public_key, activates_at, retires_at=None):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = public_key
+        self.activates_at = activates_at
+        self.retires_at = retires_at
+
+    def is_published(self, now):
+        """Published keys are in the JWKS & verify tokens. Keys are published before they activate, so that
+        verifiers already know them when the first tokens signed with them arrive"""
+        return self.retires_at is None or now < self.retires_at
+
+    def can_sign(self, now):
+        return self.private_key is not None and self.activates_at <= now and self.is_published(now)
+
+    def jwk(self, algorithm):
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.public_key))
+        jwk.update({"kid": self.kid, "use": "sig", "alg": algorithm})
+        return jwk
+
+
+class SigningKeyRing:
+    """Asymmetric keys signing the JWTs, selected by kid. The ring is described by a json manifest:
+        {"keys": [{"kid": "...", "privateKey": "<pem file>", "activatesAt": "2026-10-18T00:00:00Z",
+                   "retiresAt": "2026-11-18T00:00:00Z"}, ...]}
+    ("publicKey" instead of "privateKey" for verification only keys, file paths are relative to the manifest).
+    Tokens are signed with the active key activated last, every published key verifies. The manifest is re-read
+    when it changes (checked every reload_interval_seconds), the parsed keys are cached: signing never parses a
+    PEM. scripts/rotate_signing_key.py schedules the rotations."""
+    algorithm = "RS256"
+    manifest_path = None
+    reload_interval_seconds = 60
+    _keys = {}
+    _manifest_mtime = None
+    _next_reload_at = 0.0
+    # (path, mtime) -> parsed key
+    _parsed_keys = {}
+    # (published kids, jwks, etag)
+    _jwks = None
+    _lock = threading.Lock()
+    # key chosen by the headers callback of the token being created, used by the encode key callback
+    _selected = threading.local()
+
+    @classmethod
+    def configure(cls, manifest_path, algorithm="RS256", reload_interval_seconds=60):
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Unsupported signing algorithm {algorithm}, expected one of {SUPPORTED_ALGORITHMS}")
+        with cls._lock:
+            cls.manifest_path = manifest_path
+            cls.algorithm = algorithm
+            cls.reload_interval_seconds = reload_interval_seconds
+            cls._manifest_mtime = None
+            cls._jwks = None
+            # fails fast on a broken manifest
+            cls.__reload__()
+        if cls.signing_key() is None:
+            raise ValueError(f"No active signing key in {manifest_path}")
+
+    @classmethod
+    def signing_key(cls):
+        cls.__refresh__()
+        now = datetime.utcnow()
+        candidates = [key for key in cls._keys.values() if key.can_sign(now)]
+        return max(candidates, key=lambda key: key.activates_at) if candidates else None
+
+    @classmethod
+    def select_signing_key(cls):
+        """Headers of a new token: {"kid": ...} of the signing key"""
+        key = cls.signing_key()
+        if key is None:
+            raise RuntimeError("No active signing key")
+        cls._selected.key = key
+        return {"kid": key.kid}
+
+    @classmethod
+    def encode_key(cls):
+        """Private key of the key selected for the headers of the same token"""
+        key = getattr(cls._selected, "key", None)
+        if key is None:
+            cls.select_signing_key()
+            key = cls._selected.key
+        cls._selected.key = None
+        return key.private_key
+
+    @classmethod
+    def decode_key(cls, kid):
+        cls.__refresh__()
+        key = cls._keys.get(kid)
+        if key is None or not key.is_published(datetime.utcnow()):
+            raise InvalidTokenError("Unknown signing key")
+        return key.public_key
+
+    @classmethod
+    def jwks(cls):
+        """({"keys": [...]} of the published keys, etag)"""
+        cls.__refresh__()
+        now = datetime.utcnow()
+        published = sorted(kid for kid, key in cls._keys.items() if key.is_published(now))
+        cached = cls._jwks
+        if cached is not None and cached[0] == published:
+            return cached[1], cached[2]
+        jwks = {"keys": [cls._keys[kid].jwk(cls.algorithm) for kid in published]}
+        etag = hashlib.sha1(json.dumps(jwks, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+        cls._jwks = (published, jwks, etag)
+        return jwks, etag
+
+    @classmethod
+    def __refresh__(cls):
+        if time.monotonic() < cls._next_reload_at:
+            return
+        with cls._lock:
+            if time.monotonic() < cls._next_reload_at:
+                return
+            try:
+                cls.__reload__()
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # unreadable or malformed manifest (e.g. an entry without activatesAt): keep the last good ring
+                print(f"Signing key ring reload failed: {e}")
+                cls._next_reload_at = time.monotonic() + cls.reload_interval_seconds
+
+    @classmethod
+    def __reload__(cls):
+        mtime = os.stat(cls.manifest_path).st_mtime
+        if mtime != cls._manifest_mtime:
+            with open(cls.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            base_dir = os.path.dirname(os.path.abspath(cls.manifest_path))
+            keys = {}
+            for entry in manifest["keys"]:
+                private_key = None
+                if entry.get("privateKey") is not None:
+                    private_key = cls.__parse_key__(os.path.join(base_dir, entry["privateKey"]), private=True)
+                    public_key = private_key.public_key()
+                else:
+                    public_key = cls.__parse_key__(os.path.join(base_dir, entry["publicKey"]), private=False)
+                keys[entry["kid"]] = SigningKey(entry["kid"], private_key, public_key,
+                                                activates_at=parse_manifest_time(entry["activatesAt"]),
+                                                retires_at=parse_manifest_time(entry.get("retiresAt")))
+            cls._keys = keys
+            cls._manifest_mtime = mtime
+        cls._next_reload_at = time.monotonic() + cls.reload_interval_seconds
+
+    @classmethod
+    def __parse_key__(cls, path, private):
+        cache_key = (path, os.stat(path).st_mtime)
+        key = cls._parsed_keys.get(cache_key)
+        if key is None:
+            with open(path, "rb") as key_file:
+                data = key_file.read()
+            if private:
+                key = serialization.load_pem_private_key(data, password=None)
+            else:
+                key = serialization.load_pem_public_key(data)
+            if not isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+                raise ValueError(f"{path} is not an RSA key")
+            cls._parsed_keys[cache_key] = key
+        return key
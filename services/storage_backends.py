@@ -0,0 +1,191 @@
+import io
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError
+from application_error import ApplicationError
+
+
+class S3StorageBackend:
+    """S3 (or an S3 compatible store such as MinIO) following the CloudCube conventions:
+    every object name is prefixed with the cube name"""
+    # S3 limit of delete_objects
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, aws_access_key_id, aws_secret_access_key, bucket_name, cube_name, endpoint_url=None,
+                 region_name=None, max_pool_connections=50, max_attempts=5, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, max_concurrency=4):
+        self.bucket_name = bucket_name
+        self.cube_name = cube_name
+        self.__credentials = {"aws_access_key_id": aws_access_key_id,
+                              "aws_secret_access_key": aws_secret_access_key,
+                              "region_name": region_name}
+        self.__endpoint_url = endpoint_url
+        # the pool is shared by every thread of the worker (request threads, picture uploads & their transfers)
+        # adaptive: retries throttled requests with backoff & rate limits the client while S3 is throttling
+        self.__config = Config(max_pool_connections=max_pool_connections,
+                               retries={"mode": "adaptive", "max_attempts": max_attempts})
+        # pictures are far below the threshold & go in a single PUT, larger uploads are split in parallel parts
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=max_concurrency)
+        self.__lock = threading.Lock()
+        self.__client = None
+        self.__client_pid = None
+
+    @property
+    def client(self):
+        """One client per process. Clients are thread safe, but their connection pool must not be shared with a
+        forked process (gunicorn workers forked after the app was loaded with --preload)"""
+        pid = os.getpid()
+        if self.__client is None or self.__client_pid != pid:
+            with self.__lock:
+                if self.__client is None or self.__client_pid != pid:
+                    # the default session is not thread safe, each client gets its own
+                    session = boto3.session.Session(**self.__credentials)
+                    self.__client = session.client("s3", endpoint_url=self.__endpoint_url, config=self.__config)
+                    self.__client_pid = pid
+        return self.__client
+
+    def __key__(self, object_name):
+        # Cloudcube requires that we add <cubename> before objectname as a path else ops will fail
+        return f"{self.cube_name}/{object_name}"
+
+    def upload_file(self, source_file_path, object_name, content_type=None, cache_control=None):
+        try:
+            self.client.upload_file(source_file_path, self.bucket_name, self.__key__(object_name),
+                                    ExtraArgs=self.__extra_args__(content_type, cache_control),
+                                    Config=self.transfer_config)
+        except (ClientError, BotoCoreError, S3UploadFailedError) as e:
+            print(f"Upload of {object_name} failed: {e}")
+            raise ApplicationError("Unable to upload file. Please try again!")
+
+    def upload_fileobj(self, fileobj, object_name, content_type=None, cache_control=None):
+        try:
+            self.client.upload_fileobj(fileobj, self.bucket_name, self.__key__(object_name),
+                                       ExtraArgs=self.__extra_args__(content_type, cache_control),
+                                       Config=self.transfer_config)
+        except (ClientError, BotoCoreError, S3UploadFailedError) as e:
+            print(f"Upload of {object_name} failed: {e}")
+            raise ApplicationError("Unable to upload file. Please try again!")
+
+    @staticmethod
+    def __extra_args__(content_type, cache_control):
+        extra_args = {}
+        if content_type is not None:
+            extra_args["ContentType"] = content_type
+        if cache_control is not None:
+            extra_args["CacheControl"] = cache_control
+        return extra_args
+
+    def download_fileobj(self, object_name, max_bytes):
+        key = self.__key__(object_name)
+        try:
+            head = self.client.head_object(Bucket=self.bucket_name, Key=key)
+            if head["ContentLength"] > max_bytes:
+                raise ApplicationError("File too large!")
+            fileobj = io.BytesIO()
+            self.client.download_fileobj(self.bucket_name, key, fileobj, Config=self.transfer_config)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise ApplicationError("Uploaded file not found!", 404)
+            raise
+        fileobj.seek(0)
+        return fileobj
+
+    def delete_object(self, object_name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self.__key__(object_name))
+
+    def delete_objects(self, object_names):
+        """Deletes up to DELETE_BATCH_SIZE objects with one request. Returns {object name: error} of the failures"""
+        response = self.client.delete_objects(Bucket=self.bucket_name,
+                                              Delete={"Objects": [{"Key": self.__key__(object_name)}
+                                                                  for object_name in object_names],
+                                                      "Quiet": True})
+        prefix_length = len(self.__key__(""))
+        return {error["Key"][prefix_length:]: f"{error.get('Code')}: {error.get('Message')}"
+                for error in response.get("Errors", [])}
+
+    def list_objects(self, prefix):
+        """Yields (object name, last modified as naive UTC datetime) of the objects under prefix"""
+        prefix_length = len(self.__key__(""))
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.__key__(prefix)):
+            for item in page.get("Contents", []):
+                yield item["Key"][prefix_length:], item["LastModified"].astimezone(timezone.utc).replace(tzinfo=None)
+
+    def generate_presigned_post(self, object_name, max_bytes, expires_in):
+        return self.client.generate_presigned_post(Bucket=self.bucket_name,
+                                                   Key=self.__key__(object_name),
+                                                   Conditions=[["content-length-range", 1, max_bytes]],
+                                                   ExpiresIn=expires_in)
+
+
+class LocalStorageBackend:
+    """Stores the objects as files under root_dir, for tests, benchmarks & local development.
+    Serve root_dir as the base url to make the public objects reachable"""
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+
+    def __path__(self, object_name):
+        path = os.path.abspath(os.path.join(self.root_dir, object_name))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ApplicationError("Invalid object name!", 500)
+        return path
+
+    def upload_file(self, source_file_path, object_name, content_type=None, cache_control=None):
+        with open(source_file_path, "rb") as source_file:
+            self.upload_fileobj(source_file, object_name)
+
+    def upload_fileobj(self, fileobj, object_name, content_type=None, cache_control=None):
+        path = self.__path__(object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write & rename so that readers never see a partial object
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as target_file:
+            shutil.copyfileobj(fileobj, target_file)
+        os.replace(temp_path, path)
+
+    def download_fileobj(self, object_name, max_bytes):
+        path = self.__path__(object_name)
+        try:
+            if os.path.getsize(path) > max_bytes:
+                raise ApplicationError("File too large!")
+            with open(path, "rb") as source_file:
+                return io.BytesIO(source_file.read())
+        except FileNotFoundError:
+            raise ApplicationError("Uploaded file not found!", 404)
+
+    def delete_object(self, object_name):
+        try:
+            os.remove(self.__path__(object_name))
+        except FileNotFoundError:
+            # same as S3
+            pass
+
+    def delete_objects(self, object_names):
+        errors = {}
+        for object_name in object_names:
+            try:
+                self.delete_object(object_name)
+            except OSError as e:
+                errors[object_name] = str(e)
+        return errors
+
+    def list_objects(self, prefix):
+        for directory, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                object_name = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+                if object_name.startswith(prefix) and not object_name.endswith(".tmp"):
+                    yield object_name, datetime.utcfromtimestamp(os.path.getmtime(path))
+
+    def generate_presigned_post(self, object_name, max_bytes, expires_in):
+        raise ApplicationError("Direct uploads are not supported by the local storage backend!", 501)
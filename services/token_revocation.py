@@ -0,0 +1,104 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from database_manager import DatabaseManager as DM
+from constants import RevokedTokens
+from services.bloom_filter import BloomFilter
+from metrics import Metrics
+
+
+class TokenRevocationService:
+    """Revoked JWTs, checked on every authenticated request (token_in_blacklist_loader).
+    The revoked jtis are stored in mongo until the tokens expire. Every worker keeps a bloom filter of them, synced
+    incrementally every sync_interval_seconds: a token which is not in the filter (nearly every request) is not
+    revoked, without any query. Only filter hits are confirmed with the database."""
+    capacity = 100000
+    error_rate = 0.001
+    sync_interval_seconds = 5
+    # revocations are timestamped by the clock of the revoking worker, the syncs overlap to cover the clock skew
+    CLOCK_SKEW_SECONDS = 5
+    _filter = None
+    _synced_until = None
+    _next_sync_at = 0.0
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, capacity=100000, error_rate=0.001, sync_interval_seconds=5):
+        """The filter is built by the first check, i.e. after the workers are forked"""
+        with cls._lock:
+            cls.capacity = capacity
+            cls.error_rate = error_rate
+            cls.sync_interval_seconds = sync_interval_seconds
+            cls._filter = None
+            cls._next_sync_at = 0.0
+
+    @classmethod
+    def revoke(cls, jti, user_id, token_type, expires_at):
+        """expires_at: exp claim of the token (seconds since the epoch).
+        Returns False if the token was already revoked"""
+        try:
+            DM.db[RevokedTokens.COLLECTION_NAME].insert_one({
+                "_id": jti,
+                RevokedTokens.USER_ID: user_id,
+                RevokedTokens.TOKEN_TYPE: token_type,
+                RevokedTokens.REVOKED_AT: datetime.utcnow(),
+                RevokedTokens.EXPIRES_AT: datetime.utcfromtimestamp(expires_at)
+            })
+        except DuplicateKeyError:
+            return False
+        # the other workers pick it up on their next sync
+        revoked_filter = cls._filter
+        if revoked_filter is not None:
+            revoked_filter.add(jti)
+        Metrics.increment("tokenRevocation.revoked")
+        return True
+
+    @classmethod
+    def is_revoked(cls, jti):
+        cls.__sync__()
+        revoked_filter = cls._filter
+        if revoked_filter is not None and jti not in revoked_filter:
+            return False
+        # filter hit (or no filter, the database was unavailable while building it)
+        Metrics.increment("tokenRevocation.lookups")
+        return DM.db[RevokedTokens.COLLECTION_NAME].count_documents({"_id": jti}, limit=1) > 0
+
+    @classmethod
+    def __sync__(cls):
+        if time.monotonic() < cls._next_sync_at:
+            return
+        with cls._lock:
+            if time.monotonic() < cls._next_sync_at:
+                return
+            try:
+                if cls._filter is None or cls._filter.is_full:
+                    cls.__rebuild__()
+                else:
+                    since = cls._synced_until - timedelta(seconds=cls.CLOCK_SKEW_SECONDS)
+                    cls.__add_revoked__(cls._filter, {RevokedTokens.REVOKED_AT: {"$gte": since}})
+            except PyMongoError as e:
+                # keep the current filter, retried on the next sync
+                print(f"Token revocation filter sync failed: {e}")
+            cls._next_sync_at = time.monotonic() + cls.sync_interval_seconds
+
+    @classmethod
+    def __rebuild__(cls):
+        """New filter holding the tokens which are not expired yet. Expired tokens only cause false positives, the
+        filter is rebuilt once it reaches its capacity"""
+        now = datetime.utcnow()
+        collection = DM.db[RevokedTokens.COLLECTION_NAME]
+        query = {RevokedTokens.EXPIRES_AT: {"$gt": now}}
+        revoked_filter = BloomFilter(max(cls.capacity, 2 * collection.count_documents(query)), cls.error_rate)
+        cls.__add_revoked__(revoked_filter, query)
+        cls._filter = revoked_filter
+        Metrics.increment("tokenRevocation.rebuilds")
+
+    @classmethod
+    def __add_revoked__(cls, revoked_filter, query):
+        synced_until = datetime.utcnow()
+        for doc in DM.db[RevokedTokens.COLLECTION_NAME].find(query, projection={"_id": 1}):
+            # the syncs overlap, do not count the same token twice towards the capacity
+            if doc["_id"] not in revoked_filter:
+                revoked_filter.add(doc["_id"])
+        cls._synced_until = synced_until
@@ -1,15 +1,21 @@
 from database_manager import DatabaseManager as DM
-from services.security import password_context
+from services.password_hashing import PasswordHashingService
 from datetime import datetime, timedelta
 from application_error import ApplicationError
 import uuid
-from constants import User, PasswordResetTokens
+from constants import User, PasswordResetTokens, ClaimsManagement
 from services.email import send_email
+from services.claims_cache import ClaimsCacheService
+from services.user_state import UserStateService
+from services.token_revocation import TokenRevocationService
+from repositories.users import UsersRepository
 import secrets
 from flask_jwt_extended import (
-    create_access_token, create_refresh_token
+    create_access_token, create_refresh_token, decode_token
 )
+from jwt import ExpiredSignatureError, InvalidTokenError
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 
 class UserRegistrationService:
@@ -20,31 +26,39 @@ class UserRegistrationService:
             raise ApplicationError(message="Email address already used by another account!")
 
         # user does not exist, create
-        password_hash = password_context.hash(password)
+        password_hash = PasswordHashingService.hash(password)
         current_timestamp = datetime.utcnow()
         email_verification_token = str(uuid.uuid4())
-        user_id = DM.db[User.COLLECTION_NAME].insert_one({
-            User.EMAIL: email,
-            User.PASSWORD_HASH: password_hash,
-            User.CREATED_AT: current_timestamp,
-            User.LAST_MODIFIED_AT: current_timestamp,
-            User.EMAIL_VERIFIED: False,
-            User.VERIFICATION_TOKEN: email_verification_token
-        }).inserted_id
+        try:
+            user_id = DM.db[User.COLLECTION_NAME].insert_one({
+                User.EMAIL: email,
+                User.PASSWORD_HASH: password_hash,
+                User.CREATED_AT: current_timestamp,
+                User.LAST_MODIFIED_AT: current_timestamp,
+                User.EMAIL_VERIFIED: False,
+                User.VERIFICATION_TOKEN: email_verification_token,
+                User.CLAIMS: {ClaimsManagement.IS_ADMIN: False, ClaimsManagement.IS_SUPER_ADMIN: False}
+            }).inserted_id
+        except DuplicateKeyError:
+            # concurrent registration of the same email, caught by the unique index
+            raise ApplicationError(message="Email address already used by another account!")
 
         cls.__send_email_address_verification_mail__(email, email_verification_token)
         return user_id
 
     @classmethod
     def validate_email_address_verification_token(cls, email, verification_token):
-        user = cls.__get_existing_user_by_email__(email)
+        user = UsersRepository.get_verification_by_email(email)
         if user is None:
             raise ApplicationError(message="Invalid email id!")
-        if user[User.VERIFICATION_TOKEN] == verification_token:
+        if user.verification_token == verification_token:
             # token matches, update entry
             DM.db[User.COLLECTION_NAME].update_one({User.EMAIL: email},
                                                    {"$set": {User.EMAIL_VERIFIED: True,
                                                              User.LAST_MODIFIED_AT: datetime.utcnow()}})
+            # the verified flag is a part of the access token claims
+            UserStateService.forget()
+            ClaimsCacheService.invalidate(user.id)
             return True
         return False
 
@@ -53,47 +67,48 @@ class UserRegistrationService:
         # TODO: change body and subject
         send_email(to=email, subject="Verify MB user", body=f"Verification Token: {verification_token}")
 
-    @classmethod
-    def __get_existing_user_by_email__(cls, email):
-        return DM.db[User.COLLECTION_NAME].find_one({User.EMAIL: email})
-
     @classmethod
     def is_email_used(cls, email) -> bool:
         return DM.db[User.COLLECTION_NAME].count_documents(({User.EMAIL: email})) > 0
 
     @classmethod
     def is_email_address_verified(cls, user_id) -> bool:
-        doc = DM.db[User.COLLECTION_NAME].find_one({"_id": ObjectId(user_id)})
-        if doc is None:
+        user = UsersRepository.get_verification_by_id(user_id)
+        if user is None:
             return False
-        return doc.get(User.EMAIL_VERIFIED, False)
+        return user.is_verified
 
     @classmethod
     def resend_email_address_verification_email(cls, user_id):
-        existing_user_doc = DM.db[User.COLLECTION_NAME].find_one({"_id": ObjectId(user_id)})
-        if existing_user_doc is None:
+        existing_user = UsersRepository.get_verification_by_id(user_id)
+        if existing_user is None:
             raise ApplicationError("Invalid user!")
-        email_address = existing_user_doc.get(User.EMAIL, None)
-        if email_address is not None and existing_user_doc.get(User.EMAIL_VERIFIED, False) is False:
+        email_address = existing_user.email
+        if email_address is not None and existing_user.is_verified is False:
             UserRegistrationService.__send_email_address_verification_mail__(email_address,
-                                                                             existing_user_doc[User.VERIFICATION_TOKEN])
+                                                                             existing_user.verification_token)
 
 
 class UserLoginService:
     @classmethod
     def get_login_tokens(cls, email, supplied_password):
         """Gets the user matching email and password"""
-        userDoc = DM.db[User.COLLECTION_NAME].find_one({User.EMAIL: email})
-        if userDoc is None:
+        # the same (memoized) user state is used by the claims loader while creating the access token
+        user_state = UserStateService.get_by_email(email)
+        if user_state is None:
             raise ApplicationError("Invalid credentials!", 403)
 
         # now we match the password hash
-        if password_context.verify(supplied_password, userDoc[User.PASSWORD_HASH]):
+        is_valid, upgraded_password_hash = PasswordHashingService.verify_and_update(supplied_password,
+                                                                                   user_state.password_hash)
+        if is_valid:
+            if upgraded_password_hash is not None:
+                cls.__upgrade_password_hash__(user_state, upgraded_password_hash)
             # correct user
             # generate jwt and return
             # We use the _id as the identity value in the access token
             # mark the access token as fresh since we just verified the user's login email and password
-            user_id = str(userDoc["_id"])  # convert to str from ObjectId
+            user_id = user_state.user_id
             return {
                 "accessToken": create_access_token(user_id, fresh=True),
                 "refreshToken": create_refresh_token(user_id)
@@ -101,10 +116,54 @@ class UserLoginService:
         else:
             raise ApplicationError("Invalid credentials!", status_code=403)
 
+    @classmethod
+    def rotate_refresh_token(cls, user_id, refresh_token):
+        """refresh_token: claims of the verified refresh token. Each refresh token is used once: it is revoked &
+        replaced by the returned one"""
+        if not TokenRevocationService.revoke(refresh_token["jti"], user_id, refresh_token["type"],
+                                             refresh_token["exp"]):
+            # the same token was used by a concurrent request
+            raise ApplicationError("Refresh token already used!", 401)
+        return {
+            # Mark the token as un-fresh since we used the refresh token to regenerate this
+            "accessToken": create_access_token(identity=user_id, fresh=False),
+            "refreshToken": create_refresh_token(user_id),
+            "userId": user_id
+        }
+
+    @classmethod
+    def logout(cls, user_id, access_token, encoded_refresh_token=None):
+        """Revokes the access token (claims of the verified token) & the refresh token of the session, if given.
+        Nothing is revoked if the refresh token is invalid, the client can retry with the right one"""
+        refresh_token = None
+        if encoded_refresh_token is not None:
+            try:
+                refresh_token = decode_token(encoded_refresh_token)
+            except ExpiredSignatureError:
+                # cannot be used anymore
+                pass
+            except InvalidTokenError:
+                raise ApplicationError("Invalid refresh token!")
+            if refresh_token is not None and (refresh_token["type"] != "refresh"
+                                              or refresh_token["identity"] != user_id):
+                raise ApplicationError("Invalid refresh token!")
+        TokenRevocationService.revoke(access_token["jti"], user_id, access_token["type"], access_token["exp"])
+        if refresh_token is not None:
+            TokenRevocationService.revoke(refresh_token["jti"], user_id, refresh_token["type"], refresh_token["exp"])
+
+    @classmethod
+    def __upgrade_password_hash__(cls, user_state, upgraded_password_hash):
+        """Replaces a hash using a deprecated scheme (or outdated params) after a successful login.
+        The filter on the old hash ensures that a concurrent password change is never overwritten"""
+        DM.db[User.COLLECTION_NAME].update_one(filter={"_id": user_state.id,
+                                                       User.PASSWORD_HASH: user_state.password_hash},
+                                               update={"$set": {User.PASSWORD_HASH: upgraded_password_hash}})
+        UserStateService.forget()
+
     @classmethod
     def send_password_reset_email(cls, email):
-        user_doc = DM.db[User.COLLECTION_NAME].find_one({User.EMAIL: email})
-        if user_doc is None:
+        user_id = UsersRepository.get_id_by_email(email)
+        if user_id is None:
             # do nothing and return if the user doc is not available
             return
         # generate reset password token
@@ -112,7 +171,6 @@ class UserLoginService:
         # token valid for 30 mins from now
         valid_till = datetime.utcnow() + timedelta(minutes=30)
         # save to reset token collection
-        user_id = str(user_doc["_id"])
         DM.db[PasswordResetTokens.COLLECTION_NAME].insert_one({
             PasswordResetTokens.USERID: user_id,
             PasswordResetTokens.TOKEN: reset_password_token,
@@ -133,27 +191,29 @@ class UserLoginService:
             PasswordResetTokens.TOKEN: token,
             PasswordResetTokens.IS_CONSUMED: False,
             PasswordResetTokens.VALID_TILL: {"$gte": datetime.utcnow()}
-        })
+        }, projection={"_id": 1})
         if password_reset_doc is None:
             raise ApplicationError("Invalid password reset token. Please try again!")
         # TODO: use transactions (bit complicated but the recommended way)
-        new_password_hash = password_context.hash(new_password)
+        new_password_hash = PasswordHashingService.hash(new_password)
         DM.db[User.COLLECTION_NAME].update_one(filter={"_id": ObjectId(user_id)},
                                                update={"$set": {User.PASSWORD_HASH: new_password_hash,
                                                                 User.LAST_MODIFIED_AT: datetime.utcnow()}})
+        UserStateService.forget()
         DM.db[PasswordResetTokens.COLLECTION_NAME].update_one(filter={"_id": ObjectId(password_reset_doc["_id"])},
                                                               update={"$set": {PasswordResetTokens.IS_CONSUMED: True}})
 
     @classmethod
     def change_password(cls, user_id, existing_password, new_password):
-        print(user_id)
-        existing_user_doc = DM.db[User.COLLECTION_NAME].find_one({"_id": ObjectId(user_id)})
-        if existing_user_doc is None:
+        # memoized, shared with the strict identity check of the request
+        user_state = UserStateService.get_by_id(user_id)
+        if user_state is None:
             raise ApplicationError("Invalid user!")
-        if not password_context.verify(existing_password, existing_user_doc[User.PASSWORD_HASH]):
+        if not PasswordHashingService.verify(existing_password, user_state.password_hash):
             raise ApplicationError("Existing password incorrect!")
         # now we update the document with new password
-        new_password_hash = password_context.hash(new_password)
+        new_password_hash = PasswordHashingService.hash(new_password)
         DM.db[User.COLLECTION_NAME].update_one(filter={"_id": ObjectId(user_id)},
                                                update={"$set": {User.PASSWORD_HASH: new_password_hash,
                                                                 User.LAST_MODIFIED_AT: datetime.utcnow()}})
+        UserStateService.forget()
@@ -1,8 +1,12 @@
+import hashlib
 from database_manager import DatabaseManager as DM
 from constants import UserProfile
 from datetime import datetime
 from application_error import ApplicationError
-from services.aws_s3 import AwsS3
+from pymongo import ReturnDocument
+from services.picture_store import PictureStoreService
+from services.profile_cache import PublicProfileCacheService
+from repositories.user_profiles import UserProfilesRepository, ProfilePicture
 
 
 class UserProfileService:
@@ -13,7 +17,29 @@ class UserProfileService:
 
     @classmethod
     def get_user_profile(cls, user_id):
-        return DM.db[UserProfile.COLLECTION_NAME].find_one({UserProfile.USERID: user_id})
+        """Returns a repositories.user_profiles.FullProfile record"""
+        return UserProfilesRepository.get_full_profile(user_id)
+
+    @classmethod
+    def get_public_profile(cls, user_id):
+        """Returns a repositories.user_profiles.PublicProfile record"""
+        return UserProfilesRepository.get_public_profile(user_id)
+
+    @classmethod
+    def get_public_profiles(cls, user_ids):
+        """Returns {user id: PublicProfile record} of the users having a profile, with a single query"""
+        return {profile.user_id: profile for profile in UserProfilesRepository.get_public_profiles(user_ids)}
+
+    @classmethod
+    def get_profile_version(cls, user_id):
+        """Returns a repositories.user_profiles.ProfileVersion record, None if the profile does not exist"""
+        return UserProfilesRepository.get_version(user_id)
+
+    @classmethod
+    def etag(cls, last_modified_at, picture_object_name):
+        """Validator of the profile representations: changes with every profile write & picture upload"""
+        version = f"{last_modified_at.isoformat() if last_modified_at else ''}|{picture_object_name or ''}"
+        return hashlib.sha1(version.encode("utf-8")).hexdigest()[:20]
 
     @classmethod
     def upsert_user_profile(cls, user_id, full_name=None, city=None, country=None,
@@ -40,31 +66,30 @@ class UserProfileService:
         DM.db[UserProfile.COLLECTION_NAME].update_one(filter={UserProfile.USERID: user_id},
                                                       update={"$set": data},
                                                       upsert=True)
+        PublicProfileCacheService.invalidate(user_id)
 
     @classmethod
-    def update_profile_picture(cls, user_id, new_pic_object_name):
-        # algo: get original object, check if exists pic object name
-        # if yes, delete existing object and save this
-        # if no, then save this
-        profile = cls.get_user_profile(user_id)
-        existing_pic_object_name = None
-        if profile is not None:
-            existing_pic_object_name = profile.get(UserProfile.PICTURE_OBJECT_NAME)
-
-        # save new entry
+    def update_profile_picture(cls, user_id, new_pic_object_name, new_picture_variants=None, new_picture_widths=None):
+        """new_picture_variants: {size: {format: object name}}, new_pic_object_name is the default variant.
+        new_picture_widths: {size: width of the variants}.
+        The caller holds a reference to every new object (PictureStoreService.store), the references to the
+        replaced objects are released"""
         # There is a chance that an entry for this user_id does not exist (profile not created).
-        # Upsert to ensure that entry is created
-        DM.db[UserProfile.COLLECTION_NAME].update_one(filter={UserProfile.USERID: user_id},
-                                                      update={"$set":
-                                                                  {UserProfile.PICTURE_OBJECT_NAME: new_pic_object_name}
-                                                              },
-                                                      upsert=True)
-        # try to delete existing pic object (ignore failures)
-        try:
-            if existing_pic_object_name is not None:
-                AwsS3.delete_object(existing_pic_object_name)
-        except BaseException as e:
-            # catching all exceptions
-            # ignoring
-            print(f"Error while deleting object {existing_pic_object_name}: " + str(e))
-
+        # Upsert to ensure that entry is created.
+        # The previous picture is returned by the same atomic update, so concurrent uploads
+        # never release the same picture twice
+        existing_doc = DM.db[UserProfile.COLLECTION_NAME].find_one_and_update(
+            filter={UserProfile.USERID: user_id},
+            update={"$set": {UserProfile.PICTURE_OBJECT_NAME: new_pic_object_name,
+                             UserProfile.PICTURE_VARIANTS: new_picture_variants or {},
+                             UserProfile.PICTURE_WIDTHS: new_picture_widths or {},
+                             UserProfile.LAST_MODIFIED_AT: datetime.utcnow()}},
+            projection=ProfilePicture.PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE)
+        PublicProfileCacheService.invalidate(user_id)
+        if existing_doc is None:
+            return
+        existing_picture = ProfilePicture.from_document(existing_doc)
+        # release existing pic objects, the unreferenced ones are deleted by the garbage collector
+        PictureStoreService.release(existing_picture.object_names())
@@ -0,0 +1,94 @@
+from database_manager import DatabaseManager as DM
+from constants import User, ClaimsManagement
+from repositories.users import UsersRepository
+from flask import g, has_request_context
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+
+class UserStateService:
+    """Everything needed to issue tokens for a user (password hash, verified flag & roles), fetched with a
+    single query. The roles are denormalized into the users document (kept in sync by update_claims), the
+    result is memoized on flask.g so that a request never reads the same user document twice."""
+
+    @classmethod
+    def get_by_email(cls, email):
+        memo = cls.__request_memo__()
+        user_id = memo["emails"].get(email)
+        if user_id is not None:
+            return memo["users"][user_id]
+        return cls.__load__({User.EMAIL: email})
+
+    @classmethod
+    def get_by_id(cls, user_id):
+        user_id = str(user_id)
+        memo = cls.__request_memo__()
+        if user_id in memo["users"]:
+            return memo["users"][user_id]
+        if not ObjectId.is_valid(user_id):
+            return None
+        return cls.__load__({"_id": ObjectId(user_id)})
+
+    @classmethod
+    def forget(cls):
+        """Drops the request memo, must be called after modifying the user state within a request"""
+        if has_request_context():
+            g.pop("user_states", None)
+
+    @classmethod
+    def set_denormalized_claims(cls, user_id, is_admin, is_super_admin):
+        """Copies the claims management entry into the user document"""
+        if not ObjectId.is_valid(str(user_id)):
+            return
+        DM.db[User.COLLECTION_NAME].update_one(filter={"_id": ObjectId(str(user_id))},
+                                               update={"$set": {User.CLAIMS: {
+                                                   ClaimsManagement.IS_ADMIN: is_admin,
+                                                   ClaimsManagement.IS_SUPER_ADMIN: is_super_admin
+                                               }}})
+        cls.forget()
+
+    @classmethod
+    def set_denormalized_claims_many(cls, claims_by_user_id):
+        """Bulk version of set_denormalized_claims: {user id: (is_admin, is_super_admin)}, one round trip"""
+        operations = [UpdateOne(filter={"_id": ObjectId(str(user_id))},
+                                update={"$set": {User.CLAIMS: {
+                                    ClaimsManagement.IS_ADMIN: is_admin,
+                                    ClaimsManagement.IS_SUPER_ADMIN: is_super_admin
+                                }}})
+                      for user_id, (is_admin, is_super_admin) in claims_by_user_id.items()
+                      if ObjectId.is_valid(str(user_id))]
+        if operations:
+            DM.db[User.COLLECTION_NAME].bulk_write(operations, ordered=False)
+        cls.forget()
+
+    @classmethod
+    def __load__(cls, query):
+        """Returns a repositories.users.UserState record"""
+        state = UsersRepository.get_state(query)
+        if state is None:
+            return None
+        user_id = state.user_id
+        if state.claims is None:
+            # user created before the claims were denormalized, backfill once from claimsManagement
+            claims = DM.db[ClaimsManagement.COLLECTION_NAME].find_one({ClaimsManagement.USER_ID: user_id},
+                                                                      projection={ClaimsManagement.IS_ADMIN: 1,
+                                                                                  ClaimsManagement.IS_SUPER_ADMIN: 1})
+            claims = claims or {}
+            state.claims = {
+                ClaimsManagement.IS_ADMIN: claims.get(ClaimsManagement.IS_ADMIN, False),
+                ClaimsManagement.IS_SUPER_ADMIN: claims.get(ClaimsManagement.IS_SUPER_ADMIN, False)
+            }
+            cls.set_denormalized_claims(user_id, is_admin=state.is_admin, is_super_admin=state.is_super_admin)
+        memo = cls.__request_memo__()
+        memo["users"][user_id] = state
+        memo["emails"][state.email] = user_id
+        return state
+
+    @classmethod
+    def __request_memo__(cls):
+        if not has_request_context():
+            # called outside of a request (scripts, workers). Nothing to memoize against
+            return {"users": {}, "emails": {}}
+        if "user_states" not in g:
+            g.user_states = {"users": {}, "emails": {}}
+        return g.user_states
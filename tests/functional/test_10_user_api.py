@@ -33,6 +33,28 @@ def test_registerValidUser(test_client):
     assert response.status_code == 201
 
 
+def test_registerDuplicateUser(test_client, monkeypatch):
+    from services.user import UserRegistrationService
+    json = {"password": validPassword, "email": validEmail}
+    response = test_client.post("/register", json=json)
+    assert response.status_code == 400
+    # concurrent registration: the other request inserts the user after the check, the unique index rejects it
+    monkeypatch.setattr(UserRegistrationService, "is_email_used", classmethod(lambda cls, email: False))
+    response = test_client.post("/register", json=json)
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Email address already used by another account!"
+
+
+def test_verificationMailQueued(test_client):
+    from services.email_outbox import EmailDispatcher
+    # registration only queues the mail, the dispatcher delivers it
+    assert EmailDispatcher.dispatch_once() >= 1
+    delivered_to = [mail["to"] for mail in EmailDispatcher.transport.sent]
+    assert validEmail in delivered_to
+    # nothing left to deliver
+    assert EmailDispatcher.dispatch_once() == 0
+
+
 def test_invalidLogin(test_client):
     res = test_client.get("/login")
     assert res.status_code == 405
@@ -130,6 +152,13 @@ def test_tokenRefresh(test_client):
     assert newAccessToken != tokenDict["refreshToken"]
     # validate that the username returned by api is the username used in the login call
     assert res.get_json()["userId"] == decode_token(newAccessToken)["identity"]
+    # refresh tokens are rotated, the one used above is revoked
+    newRefreshToken = res.get_json()["refreshToken"]
+    assert decode_token(newRefreshToken)["type"] == "refresh"
+    res = test_client.post(url, headers={"Authorization": "Bearer " + tokenDict["refreshToken"]})
+    assert res.status_code == 401
+    res = test_client.post(url, headers={"Authorization": "Bearer " + newRefreshToken})
+    assert res.status_code == 200
 
 
 def test_changePassword(test_client):
@@ -184,3 +213,23 @@ def test_changePassword(test_client):
     res = test_client.post("/login", json={"email": validEmail, "password": newPassword})
     assert res.status_code == 403
 
+
+def test_logout(test_client):
+    url = "/user/logout"
+    res = test_client.post(url)
+    assert res.status_code == 401
+    tokenDict = loginUser(test_client, validEmail, validPassword)
+    headers = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    # the refresh token must be a refresh token of the same user
+    res = test_client.post(url, json={"refreshToken": tokenDict["accessToken"]}, headers=headers)
+    assert res.status_code == 400
+    res = test_client.post(url, json={"refreshToken": "not a token"}, headers=headers)
+    assert res.status_code == 400
+    # nothing was revoked by the failed calls, the client can retry with the right refresh token
+    res = test_client.post(url, json={"refreshToken": tokenDict["refreshToken"]}, headers=headers)
+    assert res.status_code == 200
+    # both tokens are revoked
+    res = test_client.get("/user/profile", headers={"Authorization": f'Bearer {tokenDict["accessToken"]}'})
+    assert res.status_code == 401
+    res = test_client.post("/user/refreshToken", headers={"Authorization": f'Bearer {tokenDict["refreshToken"]}'})
+    assert res.status_code == 401
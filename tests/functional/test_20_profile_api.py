@@ -179,3 +179,169 @@ def test_getPublicProfile(test_client):
     assert "age" not in res.get_json()
     assert "occupation" not in res.get_json()
 
+
+def test_publicProfileCaching(test_client):
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    authHeader = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    identity = test_client.get("/user/profile", headers=authHeader).get_json()["userId"]
+    url = f"/profileById/{identity}"
+    res = test_client.get(url)
+    assert res.status_code == 200
+    etag = res.headers["ETag"]
+    assert "max-age" in res.headers["Cache-Control"]
+    # revalidation of the current version
+    res = test_client.get(url, headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.data == b""
+
+    # profile updates invalidate the cached response
+    profileData = __validProfileData__()
+    profileData["city"] = "Chandigarh"
+    res = test_client.put("/user/profile", json=profileData, headers=authHeader)
+    assert res.status_code == 201
+    res = test_client.get(url, headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.get_json()["city"] == "Chandigarh"
+    assert res.headers["ETag"] != etag
+    # restore the profile for the other tests
+    res = test_client.put("/user/profile", json=__validProfileData__(), headers=authHeader)
+    assert res.status_code == 201
+
+    # entry cached by a previous version, without lastModifiedAt
+    from services.profile_cache import PublicProfileCacheService
+    PublicProfileCacheService.cache.set(identity, {"profile": {"userId": identity}, "etag": "old"})
+    res = test_client.get(url)
+    assert res.status_code == 200
+    assert res.headers["ETag"] == '"old"'
+    assert "Last-Modified" not in res.headers
+    PublicProfileCacheService.invalidate(identity)
+
+
+def test_getProfileConditional(test_client):
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    authHeader = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    res = test_client.get("/user/profile", headers=authHeader)
+    assert res.status_code == 200
+    etag = res.headers["ETag"]
+    lastModified = res.headers["Last-Modified"]
+    res = test_client.get("/user/profile", headers={**authHeader, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.data == b""
+    res = test_client.get("/user/profile", headers={**authHeader, "If-Modified-Since": lastModified})
+    assert res.status_code == 304
+    # a stale validator gets the full profile
+    res = test_client.get("/user/profile", headers={**authHeader, "If-None-Match": '"stale"'})
+    assert res.status_code == 200
+    assert res.get_json()["fullName"] == __validProfileData__()["fullName"]
+
+    res = test_client.put("/user/profile", json=__validProfileData__(), headers=authHeader)
+    assert res.status_code == 201
+    res = test_client.get("/user/profile", headers={**authHeader, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+
+def test_publicProfilesBatch(test_client):
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    authHeader = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    identity = test_client.get("/user/profile", headers=authHeader).get_json()["userId"]
+    url = "/profilesById"
+    # unknown ids are left out, duplicates are returned once
+    res = test_client.post(url, json={"userIds": ["abc", identity, identity]})
+    assert res.status_code == 200
+    profiles = res.get_json()
+    assert len(profiles) == 1
+    assert profiles[0] == test_client.get(f"/profileById/{identity}").get_json()
+    assert "age" not in profiles[0]
+
+    res = test_client.post(url, json={"userIds": []})
+    assert res.status_code == 400
+    res = test_client.post(url, json={"userIds": [str(i) for i in range(301)]})
+    assert res.status_code == 400
+
+
+def test_asyncPictureUpload(test_client, monkeypatch):
+    import io
+    from PIL import Image
+    from services.aws_s3 import AwsS3
+    from services.image_jobs import ImageJobService, ImageJobWorker
+    # PICTURE_UPLOAD_MODE=async, S3 replaced by a list of the uploaded object names
+    monkeypatch.setitem(test_client.application.config, "PICTURE_UPLOAD_MODE", "async")
+    uploaded = []
+    monkeypatch.setattr(AwsS3, "upload_fileobj",
+                        lambda fileobj, object_name, content_type=None, cache_control=None: uploaded.append(object_name))
+    url = "/user/profile/pictureUpload"
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    authHeader = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    picture = io.BytesIO()
+    Image.new("RGB", (600, 300), (200, 10, 10)).save(picture, format="PNG")
+
+    res = test_client.post(url, data={"file": (io.BytesIO(picture.getvalue()), "test.png")},
+                           content_type="multipart/form-data", headers=authHeader)
+    assert res.status_code == 202
+    statusUrl = res.get_json()["statusUrl"]
+    assert test_client.get(statusUrl, headers=authHeader).get_json()["status"] == "queued"
+    assert test_client.get(f"{url}/{'0' * 24}", headers=authHeader).status_code == 404
+    assert ImageJobWorker.process_next()
+    assert not ImageJobWorker.process_next()
+    status = test_client.get(statusUrl, headers=authHeader).get_json()
+    assert status["status"] == "done"
+    assert status["filename"] in uploaded
+    assert test_client.get("/user/profile", headers=authHeader).get_json()["displayPicUrl"] == status["url"]
+
+    # the header is valid, decoding fails in the worker: no retry
+    res = test_client.post(url, data={"file": (io.BytesIO(picture.getvalue()[:100]), "test.png")},
+                           content_type="multipart/form-data", headers=authHeader)
+    assert res.status_code == 202
+    statusUrl = res.get_json()["statusUrl"]
+    assert ImageJobWorker.process_next()
+    status = test_client.get(statusUrl, headers=authHeader).get_json()
+    assert status == {"jobId": statusUrl.split("/")[-1], "status": "failed", "message": "Invalid image file!"}
+
+    # S3 unavailable: retried, failed after the last attempt
+    def failing_upload(fileobj, object_name, content_type=None, cache_control=None):
+        raise OSError("S3 unavailable")
+
+    monkeypatch.setattr(AwsS3, "upload_fileobj", failing_upload)
+    # another picture, the first one is stored already (deduplicated, no upload)
+    picture = io.BytesIO()
+    Image.new("RGB", (600, 300), (10, 200, 10)).save(picture, format="PNG")
+    res = test_client.post(url, data={"file": (io.BytesIO(picture.getvalue()), "retry.png")},
+                           content_type="multipart/form-data", headers=authHeader)
+    statusUrl = res.get_json()["statusUrl"]
+    for _ in range(ImageJobService.MAX_ATTEMPTS - 1):
+        assert ImageJobWorker.process_next()
+        assert test_client.get(statusUrl, headers=authHeader).get_json()["status"] == "queued"
+    assert ImageJobWorker.process_next()
+    status = test_client.get(statusUrl, headers=authHeader).get_json()
+    assert status["status"] == "failed"
+    assert status["message"] == "Unable to process the picture. Please try again!"
+
+
+def test_directUploadConfirmQueued(test_client, monkeypatch):
+    import io
+    from PIL import Image
+    from repositories.users import UsersRepository
+    from services.aws_s3 import AwsS3
+    from services.image_jobs import ImageJobWorker
+    # PICTURE_UPLOAD_MODE=sync: confirmed direct uploads are queued anyway, never downloaded by the web workers
+    monkeypatch.setitem(test_client.application.config, "PICTURE_UPLOAD_MODE", "sync")
+    picture = io.BytesIO()
+    Image.new("RGB", (600, 300), (10, 10, 200)).save(picture, format="PNG")
+    downloaded = []
+    monkeypatch.setattr(AwsS3, "download_fileobj",
+                        lambda object_name, max_bytes: downloaded.append(object_name) or io.BytesIO(picture.getvalue()))
+    monkeypatch.setattr(AwsS3, "upload_fileobj",
+                        lambda fileobj, object_name, content_type=None, cache_control=None: None)
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    authHeader = {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+    stagingKey = f"staging/profile/{UsersRepository.get_id_by_email(emailRegistered)}/abc"
+
+    res = test_client.post("/user/profile/pictureUpload/direct/confirm", json={"stagingKey": stagingKey},
+                           headers=authHeader)
+    assert res.status_code == 202
+    assert downloaded == []
+    statusUrl = res.get_json()["statusUrl"]
+    assert ImageJobWorker.process_next()
+    assert downloaded == [stagingKey]
+    assert test_client.get(statusUrl, headers=authHeader).get_json()["status"] == "done"
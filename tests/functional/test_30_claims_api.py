@@ -0,0 +1,162 @@
+# Basic assumption: this test will be run after user tests. That will ensure that the account is registered
+import json
+import time
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from constants import ClaimsManagement
+from database_manager import DatabaseManager as DM
+from repositories.users import UsersRepository
+from services.claims import ClaimsManagementService
+from tests.functional.common_functions import loginUser, validPassword, emailRegistered
+
+superAdminEmail = "superadmin@xyz.com"
+# user ids of the claims entries created by test_claimsListPaging: (user id, isAdmin)
+seededEntries = [(str(ObjectId()), i % 2 == 0) for i in range(5)]
+
+
+def __superAdminHeaders__(test_client):
+    # registered once, made super-admin like scripts/grant_claims.py does
+    response = test_client.post("/register", json={"email": superAdminEmail, "password": validPassword})
+    if response.status_code == 201:
+        ClaimsManagementService.update_claims(user_id=UsersRepository.get_id_by_email(superAdminEmail),
+                                              is_admin=True, is_super_admin=True,
+                                              updated_by_user_id="tests")
+    tokenDict = loginUser(test_client, superAdminEmail, validPassword)
+    return {"Authorization": f'Bearer {tokenDict["accessToken"]}'}
+
+
+def __allPages__(test_client, headers, query):
+    """Every page of the listing: list of (items, nextCursor)"""
+    pages = []
+    cursor = None
+    while True:
+        url = "/management/allClaims?" + query + (f"&cursor={cursor}" if cursor is not None else "")
+        res = test_client.get(url, headers=headers)
+        assert res.status_code == 200
+        page = res.get_json()
+        pages.append((page["items"], page["nextCursor"]))
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return pages
+
+
+def test_claimsListSuperAdminOnly(test_client):
+    url = "/management/allClaims"
+    res = test_client.get(url)
+    assert res.status_code == 401
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    res = test_client.get(url, headers={"Authorization": f'Bearer {tokenDict["accessToken"]}'})
+    assert res.status_code == 403
+
+
+def test_claimsListPaging(test_client):
+    headers = __superAdminHeaders__(test_client)
+    for user_id, is_admin in seededEntries:
+        ClaimsManagementService.update_claims(user_id=user_id, is_admin=is_admin, is_super_admin=False,
+                                              updated_by_user_id="tests")
+    res = test_client.get("/management/allClaims", headers=headers)
+    assert res.status_code == 200
+    allEntries = res.get_json()["items"]
+    assert res.get_json()["nextCursor"] is None
+    assert {user_id for user_id, _ in seededEntries} <= {entry["userId"] for entry in allEntries}
+    pages = __allPages__(test_client, headers, "limit=2")
+    assert [len(items) for items, _ in pages[:-1]] == [2] * (len(pages) - 1)
+    # same entries in the same order, no duplicates across pages
+    assert [entry for items, _ in pages for entry in items] == allEntries
+    # a last page which is exactly full has no next cursor
+    pages = __allPages__(test_client, headers, f"limit={len(allEntries)}")
+    assert len(pages) == 1 and len(pages[0][0]) == len(allEntries)
+
+
+def test_claimsListFilters(test_client):
+    headers = __superAdminHeaders__(test_client)
+    res = test_client.get("/management/allClaims?isAdmin=true&isSuperAdmin=false", headers=headers)
+    assert res.status_code == 200
+    userIds = {entry["userId"] for entry in res.get_json()["items"]}
+    assert userIds == {user_id for user_id, is_admin in seededEntries if is_admin}
+    items = [entry for items, _ in __allPages__(test_client, headers, "isAdmin=false&limit=1") for entry in items]
+    assert {entry["userId"] for entry in items} == {user_id for user_id, is_admin in seededEntries if not is_admin}
+    future = int(time.time() * 1000) + 60000
+    res = test_client.get(f"/management/allClaims?modifiedSince={future}", headers=headers)
+    assert res.get_json() == {"items": [], "nextCursor": None}
+
+
+def test_claimsListInvalidQuery(test_client):
+    headers = __superAdminHeaders__(test_client)
+    for query in ("cursor=not-a-cursor", "limit=0", "limit=1001", "isAdmin=maybe", "format=xml"):
+        res = test_client.get(f"/management/allClaims?{query}", headers=headers)
+        assert res.status_code == 400, query
+        assert res.get_json()["message"] is not None
+
+
+def test_claimsExportNdjson(test_client):
+    headers = __superAdminHeaders__(test_client)
+    res = test_client.get("/management/allClaims", headers=headers)
+    allEntries = res.get_json()["items"]
+    res = test_client.get("/management/allClaims?format=ndjson&limit=1", headers=headers)
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    # every entry, limit is ignored
+    lines = res.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == allEntries
+    res = test_client.get("/management/allClaims?format=ndjson&isAdmin=true&isSuperAdmin=false", headers=headers)
+    assert len(res.get_data(as_text=True).splitlines()) == sum(is_admin for _, is_admin in seededEntries)
+
+
+def test_bulkUpdateClaims(test_client):
+    headers = __superAdminHeaders__(test_client)
+    url = "/management/updateClaims/bulk"
+    userIds = [str(ObjectId()) for _ in range(3)]
+    items = [{"userId": user_id, "isAdmin": True, "isSuperAdmin": False} for user_id in userIds]
+    res = test_client.put(url, json=items, headers=headers)
+    assert res.status_code == 200
+    # one result per item, in request order
+    assert res.get_json()["results"] == [{"userId": user_id, "status": "ok", "message": None} for user_id in userIds]
+    for user_id in userIds:
+        claims = ClaimsManagementService.get_user_claims(user_id)
+        assert claims["isAdmin"] and not claims["isSuperAdmin"]
+
+
+def test_bulkUpdateClaimsPartialFailure(test_client, monkeypatch):
+    headers = __superAdminHeaders__(test_client)
+    collection_class = type(DM.db[ClaimsManagement.COLLECTION_NAME])
+    bulk_write = collection_class.bulk_write
+
+    def failing_bulk_write(self, operations, ordered=True, **kwargs):
+        if self.name != ClaimsManagement.COLLECTION_NAME:
+            return bulk_write(self, operations, ordered=ordered, **kwargs)
+        # the second entry fails, the others are written (unordered bulk write)
+        bulk_write(self, operations[:1] + operations[2:], ordered=ordered, **kwargs)
+        raise BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "Write failed on the server"}]})
+
+    monkeypatch.setattr(collection_class, "bulk_write", failing_bulk_write)
+    userIds = [str(ObjectId()) for _ in range(3)]
+    items = [{"userId": user_id, "isAdmin": True, "isSuperAdmin": False} for user_id in userIds]
+    res = test_client.put("/management/updateClaims/bulk", json=items, headers=headers)
+    assert res.status_code == 200
+    assert [result["status"] for result in res.get_json()["results"]] == ["ok", "error", "ok"]
+    assert res.get_json()["results"][1]["message"] == "Write failed on the server"
+    monkeypatch.undo()
+    assert [ClaimsManagementService.get_user_claims(user_id)["isAdmin"] for user_id in userIds] == [True, False, True]
+
+
+def test_bulkUpdateClaimsRejected(test_client):
+    headers = __superAdminHeaders__(test_client)
+    url = "/management/updateClaims/bulk"
+    userId = str(ObjectId())
+    valid = {"userId": userId, "isAdmin": True, "isSuperAdmin": False}
+    # nothing is written if any item is invalid
+    res = test_client.put(url, json=[valid, {"userId": str(ObjectId()), "isAdmin": "maybe"}], headers=headers)
+    assert res.status_code == 400
+    assert set(res.get_json()["errors"]["1"]) == {"isAdmin", "isSuperAdmin"}
+    # each user once per request
+    res = test_client.put(url, json=[valid, dict(valid, isAdmin=False)], headers=headers)
+    assert res.status_code == 400
+    for payload in ([], valid, [valid] * 501):
+        res = test_client.put(url, json=payload, headers=headers)
+        assert res.status_code == 400
+    assert ClaimsManagementService.get_user_claims(userId)["lastModifiedAt"] is None
+    # super-admins only
+    tokenDict = loginUser(test_client, emailRegistered, validPassword)
+    res = test_client.put(url, json=[valid], headers={"Authorization": f'Bearer {tokenDict["accessToken"]}'})
+    assert res.status_code == 403
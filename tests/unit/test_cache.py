@@ -0,0 +1,133 @@
+from services.cache import TTLCache
+from services.broadcast import LocalInvalidationBroadcast
+from services.profile_cache import PublicProfileCacheService
+from services.shared_cache import LocalSharedCache
+from services.bloom_filter import BloomFilter
+import time
+
+
+def test_lruEviction():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # touch "a" so that "b" becomes the least recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttlExpiry():
+    cache = TTLCache(max_size=10, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_getOrLoadSkipsStoreWhenInvalidatedWhileLoading():
+    cache = TTLCache()
+
+    def loader():
+        # a writer invalidates the key while we are reading from the db
+        cache.invalidate("a")
+        return "stale"
+
+    assert cache.get_or_load("a", loader) == "stale"
+    assert cache.get("a") is None
+    assert cache.get_or_load("a", lambda: "fresh") == "fresh"
+    assert cache.get("a") == "fresh"
+
+
+def test_localBroadcastInvalidates():
+    cache = TTLCache()
+    broadcast = LocalInvalidationBroadcast()
+    broadcast.subscribe("claims", cache.invalidate)
+    cache.set("user1", {"isAdmin": True})
+    broadcast.publish("claims", "user1")
+    assert cache.get("user1") is None
+
+
+def test_publicProfileCacheTiers():
+    shared_cache = LocalSharedCache()
+    PublicProfileCacheService.configure(max_size=10, ttl_seconds=60, broadcast=LocalInvalidationBroadcast(),
+                                        shared_cache=shared_cache)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"profile": {"userId": "u1", "city": "Mohali"}, "etag": "abc"}
+
+    entry = PublicProfileCacheService.get("u1", loader)
+    assert entry["profile"]["city"] == "Mohali"
+    assert PublicProfileCacheService.get("u1", loader) == entry
+    # another worker (empty in-process tier) is served by the shared tier
+    PublicProfileCacheService.cache.clear()
+    assert PublicProfileCacheService.get("u1", loader) == entry
+    assert len(loads) == 1
+    # both tiers are invalidated
+    PublicProfileCacheService.invalidate("u1")
+    PublicProfileCacheService.get("u1", loader)
+    assert len(loads) == 2
+
+
+def test_publicProfileCacheGetMany():
+    PublicProfileCacheService.configure(max_size=10, ttl_seconds=60, broadcast=LocalInvalidationBroadcast())
+    PublicProfileCacheService.get("u1", lambda: {"profile": {"userId": "u1"}, "etag": "1"})
+    requested = []
+
+    def loader(user_ids):
+        requested.append(user_ids)
+        return {user_id: {"profile": None} for user_id in user_ids}
+
+    entries = PublicProfileCacheService.get_many(["u1", "u2", "u3"], loader)
+    # only the misses are loaded, with a single call
+    assert requested == [["u2", "u3"]]
+    assert entries["u1"]["profile"] == {"userId": "u1"}
+    assert entries["u2"] == {"profile": None}
+    PublicProfileCacheService.get_many(["u1", "u2", "u3"], loader)
+    assert len(requested) == 1
+
+
+def test_localSharedCacheTtlPerEntry():
+    shared_cache = LocalSharedCache()
+    shared_cache.set("long", 1, 60)
+    shared_cache.set("short", 2, 0.01)
+    time.sleep(0.02)
+    assert shared_cache.get("short") is None
+    assert shared_cache.get("long") == 1
+    assert not shared_cache.add("long", 3, 60)
+    assert shared_cache.add("short", 3, 60)
+    assert shared_cache.get("short") == 3
+
+
+def test_publicProfileSharedTierSkipsStaleWrites():
+    shared_cache = LocalSharedCache()
+    PublicProfileCacheService.configure(max_size=10, ttl_seconds=60, broadcast=LocalInvalidationBroadcast(),
+                                        shared_cache=shared_cache)
+
+    def stale_loader():
+        # the profile is updated (& invalidated) while another worker is reading it from the db
+        PublicProfileCacheService.invalidate("u1")
+        return {"profile": {"userId": "u1", "city": "Mohali"}, "etag": "old"}
+
+    assert PublicProfileCacheService.get("u1", stale_loader)["etag"] == "old"
+    assert shared_cache.get(PublicProfileCacheService.SHARED_KEY_PREFIX + "u1") == PublicProfileCacheService.TOMBSTONE
+    # another worker is not served the stale entry
+    PublicProfileCacheService.cache.clear()
+    fresh = {"profile": {"userId": "u1", "city": "Pune"}, "etag": "new"}
+    assert PublicProfileCacheService.get("u1", lambda: fresh) == fresh
+    assert PublicProfileCacheService.get_many(["u1"], lambda user_ids: {"u1": fresh}) == {"u1": fresh}
+
+
+def test_bloomFilterMembership():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"jti-{i}" for i in range(1000)]
+    for key in keys:
+        bloom_filter.add(key)
+    # no false negatives
+    assert all(key in bloom_filter for key in keys)
+    assert bloom_filter.is_full
+    false_positives = sum(f"other-{i}" in bloom_filter for i in range(10000))
+    assert false_positives < 300
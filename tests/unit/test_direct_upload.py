@@ -0,0 +1,69 @@
+import base64
+import io
+import json
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+from PIL import Image
+from application_error import ApplicationError
+from services.aws_s3 import AwsS3
+from services.direct_upload import DirectUploadService
+
+
+@pytest.fixture
+def s3_bucket():
+    # moto stands in for S3 (boto3 calls & HTTP requests to the presigned urls)
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="bucketname")
+        AwsS3.configure_client(aws_access_key_id="test", aws_secret_access_key="test", bucket_name="bucketname",
+                               base_url="https://bucketname.s3.amazonaws.com/cubename", cube_name="cubename",
+                               region_name="us-east-1")
+        DirectUploadService.configure(max_bytes=64 * 1024)
+        yield
+    AwsS3.backend = None
+
+
+def __picture_bytes__():
+    output = io.BytesIO()
+    Image.new("RGB", (100, 100)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def __post_upload__(upload, data):
+    return requests.post(upload["url"], data=upload["fields"], files={"file": ("picture.png", data)})
+
+
+def test_presignedUploadRoundTrip(s3_bucket):
+    upload = DirectUploadService.create_upload("user1")
+    assert upload["stagingKey"].startswith("staging/profile/user1/")
+    response = __post_upload__(upload, __picture_bytes__())
+    assert response.status_code == 204
+    # the app only downloads it when processing the confirmed upload
+    stream = AwsS3.download_fileobj(upload["stagingKey"], max_bytes=DirectUploadService.max_bytes)
+    assert Image.open(stream).size == (100, 100)
+
+
+def test_presignedUploadSizeLimit(s3_bucket):
+    upload = DirectUploadService.create_upload("user1")
+    # enforced by S3 (moto does not check it)
+    policy = json.loads(base64.b64decode(upload["fields"]["policy"]))
+    assert ["content-length-range", 1, DirectUploadService.max_bytes] in policy["conditions"]
+    # ... & checked again before downloading
+    __post_upload__(upload, b"0" * (DirectUploadService.max_bytes + 1))
+    with pytest.raises(ApplicationError) as e:
+        AwsS3.download_fileobj(upload["stagingKey"], max_bytes=DirectUploadService.max_bytes)
+    assert e.value.status_code == 400
+
+
+def test_downloadMissingUpload(s3_bucket):
+    with pytest.raises(ApplicationError) as e:
+        AwsS3.download_fileobj("staging/profile/user1/missing", max_bytes=DirectUploadService.max_bytes)
+    assert e.value.status_code == 404
+
+
+def test_validateStagingKey():
+    DirectUploadService.validate_staging_key("user1", "staging/profile/user1/abc")
+    for staging_key in ["staging/profile/user2/abc", "staging/profile/user1/abc/def", "public/profile/user1/abc"]:
+        with pytest.raises(ApplicationError):
+            DirectUploadService.validate_staging_key("user1", staging_key)
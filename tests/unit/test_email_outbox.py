@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+import pytest
+from database_manager import DatabaseManager as DM
+from constants import EmailOutbox
+from services.email_outbox import EmailOutboxService
+
+
+@pytest.fixture
+def outbox(test_client):
+    # test_client: the test database
+    DM.db[EmailOutbox.COLLECTION_NAME].delete_many({})
+    yield DM.db[EmailOutbox.COLLECTION_NAME]
+    DM.db[EmailOutbox.COLLECTION_NAME].delete_many({})
+
+
+def test_claimBatch(outbox):
+    for index in range(3):
+        EmailOutboxService.enqueue(f"user{index}@xyz.com", "subject", "body")
+    batch = EmailOutboxService.claim_batch(2)
+    assert [mail[EmailOutbox.TO] for mail in batch] == ["user0@xyz.com", "user1@xyz.com"]
+    assert {mail[EmailOutbox.STATUS] for mail in batch} == {EmailOutbox.STATUS_SENDING}
+    assert {mail[EmailOutbox.ATTEMPTS] for mail in batch} == {1}
+    # one lease token per call
+    assert len({mail[EmailOutbox.LOCKED_BY] for mail in batch}) == 1
+    assert [mail[EmailOutbox.TO] for mail in EmailOutboxService.claim_batch(5)] == ["user2@xyz.com"]
+    assert EmailOutboxService.claim_batch(5) == []
+    # lease expired (dispatcher crashed while sending): claimed again, with a new token
+    outbox.update_one({"_id": batch[0]["_id"]},
+                      {"$set": {EmailOutbox.LOCKED_UNTIL: datetime.utcnow() - timedelta(seconds=1)}})
+    reclaimed = EmailOutboxService.claim_batch(5)
+    assert [mail["_id"] for mail in reclaimed] == [batch[0]["_id"]]
+    assert reclaimed[0][EmailOutbox.ATTEMPTS] == 2
+    assert reclaimed[0][EmailOutbox.LOCKED_BY] != batch[0][EmailOutbox.LOCKED_BY]
+    EmailOutboxService.mark_sent(reclaimed[0]["_id"])
+    assert EmailOutbox.LOCKED_BY not in outbox.find_one({"_id": reclaimed[0]["_id"]})
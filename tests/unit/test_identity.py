@@ -0,0 +1,31 @@
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, verify_jwt_in_request
+from services.identity import IdentityService
+from services.claims_cache import ClaimsCacheService
+from constants import JwtClaims
+
+
+def test_strictIdentityRevalidatesClaims():
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "unit-test"
+    JWTManager(app)
+    user_id = "identity-test-user"
+    token_claims = {JwtClaims.IS_EMAIL_ADDRESS_VERIFIED: True, JwtClaims.IS_ADMIN: True,
+                    JwtClaims.IS_SUPER_ADMIN: True}
+    with app.app_context():
+        token = create_access_token(identity=user_id, user_claims=token_claims)
+    # the user was demoted after the token was issued
+    ClaimsCacheService.cache.set(user_id, {**token_claims, JwtClaims.IS_SUPER_ADMIN: False})
+    try:
+        with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            verify_jwt_in_request()
+            identity = IdentityService.current()
+            assert identity.user_id == user_id
+            assert identity.is_verified and identity.is_admin and identity.is_super_admin
+            # built once per request
+            assert IdentityService.current() is identity
+            strict_identity = IdentityService.current(strict=True)
+            assert strict_identity.is_admin and not strict_identity.is_super_admin
+            assert IdentityService.current() is strict_identity
+    finally:
+        ClaimsCacheService.cache.invalidate(user_id)
@@ -0,0 +1,49 @@
+import io
+from PIL import Image
+from services.aws_s3 import AwsS3
+from services.image_processing import render_picture_variants
+from services.profile_picture import ProfilePictureService
+
+
+def __make_picture__(width, height, mode="RGB", format="PNG"):
+    output = io.BytesIO()
+    Image.new(mode, (width, height)).save(output, format=format)
+    output.seek(0)
+    return output
+
+
+def test_renderPictureVariants():
+    variants = render_picture_variants(__make_picture__(1200, 600), sizes=[48, 400, 128], formats=["webp", "jpeg"])
+    # largest size first, every size in every format
+    assert [(v.size, v.format) for v in variants] == [(400, "webp"), (400, "jpeg"), (128, "webp"), (128, "jpeg"),
+                                                      (48, "webp"), (48, "jpeg")]
+    for variant in variants:
+        image = Image.open(variant.data)
+        assert image.format == variant.format.upper()
+        # aspect ratio is preserved within the bounding box
+        assert image.size == (variant.size, variant.size // 2)
+        assert variant.width == image.width
+
+
+def test_renderPictureVariantsRemovesAlpha():
+    variants = render_picture_variants(__make_picture__(100, 100, mode="RGBA"), sizes=[48], formats=["jpeg"])
+    assert Image.open(variants[0].data).mode == "RGB"
+    assert variants[0].content_type == "image/jpeg"
+    assert variants[0].extension == "jpg"
+
+
+def test_srcsetUsesVariantWidths(monkeypatch):
+    monkeypatch.setattr(AwsS3, "base_url", "https://cdn")
+    picture_variants = {"400": {"jpeg": "a.jpg"}, "128": {"jpeg": "b.jpg"}, "48": {"jpeg": "c.jpg"}}
+    # portrait picture: the widths are smaller than the bounding boxes
+    variants = render_picture_variants(__make_picture__(300, 600), sizes=[400, 128, 48], formats=["jpeg"])
+    widths = {str(v.size): v.width for v in variants}
+    assert widths == {"400": 200, "128": 64, "48": 24}
+    assert ProfilePictureService.srcset(picture_variants, widths) == \
+        {"jpeg": "https://cdn/c.jpg 24w, https://cdn/b.jpg 64w, https://cdn/a.jpg 200w"}
+    # small picture, not upscaled: identical widths are listed once
+    variants = render_picture_variants(__make_picture__(40, 40), sizes=[400, 128, 48], formats=["jpeg"])
+    widths = {str(v.size): v.width for v in variants}
+    assert ProfilePictureService.srcset(picture_variants, widths) == {"jpeg": "https://cdn/c.jpg 40w"}
+    # pictures stored before the widths: the bounding boxes
+    assert ProfilePictureService.srcset({"48": {"jpeg": "c.jpg"}}) == {"jpeg": "https://cdn/c.jpg 48w"}
@@ -0,0 +1,36 @@
+import pytest
+from services.password_hashing import PasswordHashingService
+from application_error import ApplicationError
+from services.security import build_password_context
+
+__CHEAP_PARAMS__ = {"time_cost": 1, "memory_cost": 8, "parallelism": 1}
+
+
+@pytest.fixture
+def hashing_pool():
+    PasswordHashingService.configure(workers=1, max_pending=1, params=__CHEAP_PARAMS__)
+    yield PasswordHashingService
+    # back to the inline test configuration
+    PasswordHashingService.configure(workers=0, max_pending=0, params=__CHEAP_PARAMS__)
+
+
+def test_hashAndVerifyInPool(hashing_pool):
+    password_hash = hashing_pool.hash("1234")
+    assert hashing_pool.verify("1234", password_hash)
+    assert not hashing_pool.verify("12345", password_hash)
+
+
+def test_saturatedPoolFailsFast(hashing_pool):
+    hashing_pool.max_pending = 0
+    with pytest.raises(ApplicationError) as e:
+        hashing_pool.hash("1234")
+    assert e.value.status_code == 503
+
+
+def test_deprecatedHashIsUpgraded(hashing_pool):
+    legacy_hash = build_password_context("sha256_crypt", {"default_rounds": 1000}).hash("1234")
+    is_valid, new_hash = hashing_pool.verify_and_update("1234", legacy_hash)
+    assert is_valid
+    assert new_hash.startswith("$argon2")
+    # current hashes do not need an update
+    assert hashing_pool.verify_and_update("1234", new_hash) == (True, None)
@@ -0,0 +1,61 @@
+import io
+import pytest
+from database_manager import DatabaseManager as DM
+from constants import PictureObjects, OrphanedObjects
+from services.aws_s3 import AwsS3
+from services.object_gc import ObjectGarbageCollector
+from services.picture_store import PictureStoreService
+
+
+@pytest.fixture
+def uploads(test_client, monkeypatch):
+    # test_client: the test database. Uploaded object names, instead of S3
+    uploaded = []
+    monkeypatch.setattr(AwsS3, "upload_fileobj",
+                        lambda fileobj, object_name, content_type=None, cache_control=None: uploaded.append(object_name))
+    yield uploaded
+    DM.db[PictureObjects.COLLECTION_NAME].delete_many({})
+    DM.db[OrphanedObjects.COLLECTION_NAME].delete_many({})
+
+
+def test_storeDeduplicatesUploadedObjects(uploads):
+    object_name = PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg")
+    assert PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg") == object_name
+    assert uploads == [object_name]
+    entry = DM.db[PictureObjects.COLLECTION_NAME].find_one({"_id": object_name})
+    assert entry[PictureObjects.REF_COUNT] == 2
+    assert entry[PictureObjects.UPLOADED]
+
+
+def test_storeUploadsAgainWhileFirstUploadInProgress(uploads):
+    object_name = PictureStoreService.object_name(b"picture", "jpg")
+    # another request added the entry & has not finished uploading (it may fail)
+    DM.db[PictureObjects.COLLECTION_NAME].insert_one({"_id": object_name, PictureObjects.REF_COUNT: 1,
+                                                      PictureObjects.UPLOADED: False})
+    PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg")
+    assert uploads == [object_name]
+    assert DM.db[PictureObjects.COLLECTION_NAME].find_one({"_id": object_name})[PictureObjects.UPLOADED]
+
+
+def test_storeDuringCollectionUsesAnotherName(uploads, monkeypatch):
+    object_name = PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg")
+    ObjectGarbageCollector.record_orphans([object_name], delay_seconds=0)
+    PictureStoreService.release([object_name])
+    stored = []
+
+    def delete_objects(object_names):
+        # the same picture is stored again while the collector deletes the object: does not wait for the collector
+        stored.append(PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg"))
+        return {}
+
+    monkeypatch.setattr(AwsS3, "delete_objects", delete_objects)
+    assert ObjectGarbageCollector.collect_once() == 1
+    other_name = PictureStoreService.object_name(b"picture", "jpg", generation=1)
+    assert stored == [other_name]
+    assert uploads == [object_name, other_name]
+    assert DM.db[PictureObjects.COLLECTION_NAME].find_one({"_id": object_name}) is None
+    entry = DM.db[PictureObjects.COLLECTION_NAME].find_one({"_id": other_name})
+    assert entry[PictureObjects.REF_COUNT] == 1
+    assert entry[PictureObjects.UPLOADED]
+    # once collected, the picture is stored under its first name again
+    assert PictureStoreService.store(io.BytesIO(b"picture"), "jpg", "image/jpeg") == object_name
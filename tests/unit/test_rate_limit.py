@@ -0,0 +1,34 @@
+import pytest
+from flask import Flask
+from application_error import RateLimitExceeded
+from services.rate_limit import RateLimitService, RateLimit, parse_rate_limits
+from services.shared_cache import LocalSharedCache
+
+
+def test_parseRateLimits():
+    limits = parse_rate_limits("UserLogin.ip=20/60, UserLogin.account=10/300")
+    assert limits[("UserLogin", "ip")].limit == 20
+    assert limits[("UserLogin", "account")].window_seconds == 300
+    assert parse_rate_limits(None) == {}
+
+
+def test_slidingWindowLimit():
+    previous = (RateLimitService.counters, RateLimitService.limits, RateLimitService.trusted_proxies,
+                RateLimitService.enabled)
+    RateLimitService.configure(counters=LocalSharedCache(), limits={("UserLogin", "account"): RateLimit(3, 3600)},
+                               trusted_proxies=1)
+    try:
+        for _ in range(3):
+            RateLimitService.check("UserLogin", "account", "a@b.com")
+        with pytest.raises(RateLimitExceeded) as e:
+            RateLimitService.check("UserLogin", "account", "a@b.com")
+        assert e.value.status_code == 429
+        assert 1 <= e.value.retry_after_seconds <= 3600
+        # other accounts are not affected
+        RateLimitService.check("UserLogin", "account", "c@d.com")
+        with Flask(__name__).test_request_context(headers={"X-Forwarded-For": "10.0.0.1, 203.0.113.7"}):
+            # the entry appended by the trusted proxy, not the one sent by the client
+            assert RateLimitService.client_ip() == "203.0.113.7"
+    finally:
+        RateLimitService.counters, RateLimitService.limits, RateLimitService.trusted_proxies, \
+            RateLimitService.enabled = previous
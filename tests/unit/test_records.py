@@ -0,0 +1,42 @@
+from repositories.user_profiles import PublicProfile, ProfilePicture
+from repositories.users import UserState
+from bson.objectid import ObjectId
+
+
+def test_projectionOnlyContainsDeclaredFields():
+    assert PublicProfile.PROJECTION == {"userId": 1, "fullName": 1, "country": 1, "city": 1,
+                                        "pictureObjectName": 1, "pictureVariants": 1, "pictureWidths": 1,
+                                        "lastModifiedAt": 1, "_id": 0}
+    # _id is declared by UserState, it must not be excluded
+    assert "_id" in UserState.PROJECTION
+    assert UserState.PROJECTION["_id"] == 1
+    assert "verificationToken" not in UserState.PROJECTION
+
+
+def test_fromDocumentAppliesDefaults():
+    profile = PublicProfile.from_document({"userId": "abc", "fullName": "Test User"})
+    assert profile.full_name == "Test User"
+    assert profile.city == ""
+    assert profile.picture_object_name is None
+    # records are slotted, no per instance dict
+    assert not hasattr(profile, "__dict__")
+
+
+def test_userStateClaims():
+    user_id = ObjectId()
+    state = UserState.from_document({"_id": user_id, "claims": {"isAdmin": True}})
+    assert state.user_id == str(user_id)
+    assert state.is_admin is True
+    assert state.is_super_admin is False
+
+
+def test_pictureObjectNames():
+    # one entry per reference, identical variants share an object
+    picture = ProfilePicture.from_document({"pictureObjectName": "public/pictures/a.jpg",
+                                            "pictureVariants": {"400": {"jpeg": "public/pictures/a.jpg"},
+                                                                "48": {"jpeg": "public/pictures/a.jpg"}}})
+    assert picture.object_names() == ["public/pictures/a.jpg", "public/pictures/a.jpg"]
+    # pictures stored before the variants
+    assert ProfilePicture.from_document({"pictureObjectName": "public/profile/u-1.jpg"}).object_names() == \
+        ["public/profile/u-1.jpg"]
+    assert ProfilePicture.from_document({}).object_names() == []
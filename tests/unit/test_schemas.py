@@ -0,0 +1,36 @@
+import pytest
+from marshmallow import ValidationError
+from schemas.registry import SchemaRegistry, CompiledValidator
+from schemas.user import UserRegistrationInputSchema, UserLoginInputSchema
+from schemas.user_profile import UserProfileInputSchema
+
+
+def test_schemaRegistryReusesInstances():
+    assert SchemaRegistry.get(UserLoginInputSchema) is SchemaRegistry.get(UserLoginInputSchema)
+    assert SchemaRegistry.get(UserLoginInputSchema, many=True).many
+
+
+@pytest.mark.parametrize("payload", [
+    {"email": "a@b.com", "password": "12345"},
+    {"email": "a@b.com", "password": "123"},
+    {"email": "not an email", "password": "12345"},
+    {"email": "a@b.com"},
+    {"email": "a@b.com", "password": "12345", "extra": 1},
+    {"email": "a@b.com", "password": 12345},
+    ["a@b.com"],
+])
+def test_fastValidationMatchesSchema(payload):
+    try:
+        expected = UserRegistrationInputSchema().load(payload)
+    except ValidationError as e:
+        with pytest.raises(ValidationError) as fast_error:
+            SchemaRegistry.load(UserRegistrationInputSchema, payload, fast=True)
+        assert fast_error.value.messages == e.messages
+    else:
+        assert SchemaRegistry.load(UserRegistrationInputSchema, payload, fast=True) == expected
+
+
+def test_onlyFlatStringSchemasCompile():
+    CompiledValidator(UserLoginInputSchema())
+    with pytest.raises(ValueError):
+        CompiledValidator(UserProfileInputSchema())
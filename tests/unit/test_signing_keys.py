@@ -0,0 +1,47 @@
+import json
+import os
+import time
+import jwt
+import pytest
+from datetime import datetime, timedelta
+from scripts.rotate_signing_key import rotate
+from services.signing_keys import SigningKeyRing
+
+
+def test_keyRingRotation(tmp_path):
+    manifest_path = str(tmp_path / "keyring.json")
+    now = datetime.utcnow()
+    rotate(manifest_path, activate_in_hours=0, retire_after_hours=24, key_size=1024, now=now - timedelta(hours=1))
+    # scheduled rotation: published now, signs tomorrow
+    rotate(manifest_path, activate_in_hours=24, retire_after_hours=24, key_size=1024, now=now)
+    SigningKeyRing.configure(manifest_path, reload_interval_seconds=0)
+    current_key = SigningKeyRing.signing_key()
+    jwks, etag = SigningKeyRing.jwks()
+    assert len(jwks["keys"]) == 2
+    assert {jwk["kty"] for jwk in jwks["keys"]} == {"RSA"}
+    assert current_key.kid in {jwk["kid"] for jwk in jwks["keys"]}
+    assert SigningKeyRing.jwks() == (jwks, etag)
+
+    headers = SigningKeyRing.select_signing_key()
+    token = jwt.encode({"sub": "user"}, SigningKeyRing.encode_key(), algorithm="RS256", headers=headers)
+    kid = jwt.get_unverified_header(token)["kid"]
+    assert kid == current_key.kid
+    assert jwt.decode(token, SigningKeyRing.decode_key(kid), algorithms=["RS256"])["sub"] == "user"
+    with pytest.raises(jwt.InvalidTokenError):
+        SigningKeyRing.decode_key("unknown")
+
+
+def test_keyRingKeepsLastGoodKeys(tmp_path):
+    manifest_path = str(tmp_path / "keyring.json")
+    rotate(manifest_path, activate_in_hours=0, retire_after_hours=24, key_size=1024,
+           now=datetime.utcnow() - timedelta(hours=1))
+    SigningKeyRing.configure(manifest_path, reload_interval_seconds=0)
+    current_key = SigningKeyRing.signing_key()
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    del manifest["keys"][0]["activatesAt"]
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.utime(manifest_path, (time.time() + 10, time.time() + 10))
+    assert SigningKeyRing.signing_key() is current_key
+    assert SigningKeyRing.decode_key(current_key.kid) is current_key.public_key
@@ -0,0 +1,79 @@
+import io
+import boto3
+import pytest
+from moto import mock_aws
+from application_error import ApplicationError
+from metrics import Metrics
+from services.aws_s3 import AwsS3
+from services.storage_backends import LocalStorageBackend, S3StorageBackend
+
+
+@pytest.fixture
+def local_storage(tmp_path):
+    AwsS3.configure_backend(LocalStorageBackend(str(tmp_path)), base_url="http://localhost/objects")
+    Metrics.reset()
+    yield tmp_path
+    AwsS3.backend = None
+
+
+def test_localStorageRoundTrip(local_storage):
+    AwsS3.upload_fileobj(io.BytesIO(b"picture"), "public/pictures/a.jpg", content_type="image/jpeg")
+    assert (local_storage / "public" / "pictures" / "a.jpg").read_bytes() == b"picture"
+    assert AwsS3.download_fileobj("public/pictures/a.jpg", max_bytes=100).read() == b"picture"
+    with pytest.raises(ApplicationError):
+        AwsS3.download_fileobj("public/pictures/a.jpg", max_bytes=3)
+    AwsS3.delete_object("public/pictures/a.jpg")
+    # deleting a missing object is not an error, like S3
+    AwsS3.delete_object("public/pictures/a.jpg")
+    with pytest.raises(ApplicationError) as e:
+        AwsS3.download_fileobj("public/pictures/a.jpg", max_bytes=100)
+    assert e.value.status_code == 404
+    assert AwsS3.get_object_url("public/pictures/a.jpg") == "http://localhost/objects/public/pictures/a.jpg"
+
+
+def test_localStorageRejectsEscapingNames(local_storage):
+    with pytest.raises(ApplicationError):
+        AwsS3.upload_fileobj(io.BytesIO(b"picture"), "../outside.jpg")
+
+
+def test_operationsAreTimed(local_storage):
+    AwsS3.upload_fileobj(io.BytesIO(b"picture"), "public/pictures/a.jpg")
+    with pytest.raises(ApplicationError):
+        AwsS3.download_fileobj("public/pictures/missing.jpg", max_bytes=100)
+    snapshot = Metrics.snapshot()
+    assert snapshot["timers"]["storage.upload_fileobj"]["count"] == 1
+    assert snapshot["timers"]["storage.download_fileobj"]["count"] == 1
+    assert snapshot["counters"]["storage.download_fileobj.errors"] == 1
+
+
+def test_s3ClientPerProcess(monkeypatch):
+    backend = S3StorageBackend(aws_access_key_id="test", aws_secret_access_key="test", bucket_name="bucketname",
+                               cube_name="cubename", region_name="us-east-1", max_pool_connections=20)
+    client = backend.client
+    assert backend.client is client
+    assert client.meta.config.max_pool_connections == 20
+    assert client.meta.config.retries["mode"] == "adaptive"
+    # forked worker
+    monkeypatch.setattr("os.getpid", lambda: -1)
+    assert backend.client is not client
+
+
+def test_s3BatchDeleteAndListing():
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="bucketname")
+        AwsS3.configure_client(aws_access_key_id="test", aws_secret_access_key="test", bucket_name="bucketname",
+                               base_url="https://bucketname.s3.amazonaws.com/cubename", cube_name="cubename",
+                               region_name="us-east-1")
+        object_names = [f"public/pictures/{i}.jpg" for i in range(1005)]
+        for object_name in object_names:
+            AwsS3.upload_fileobj(io.BytesIO(b"picture"), object_name)
+        AwsS3.upload_fileobj(io.BytesIO(b"upload"), "staging/profile/user1/abc")
+        listed = dict(AwsS3.list_objects("public/"))
+        assert set(listed.keys()) == set(object_names)
+        assert listed[object_names[0]].tzinfo is None
+        Metrics.reset()
+        # 2 requests: S3 accepts up to 1000 keys per delete_objects
+        assert AwsS3.delete_objects(object_names) == {}
+        assert Metrics.snapshot()["timers"]["storage.delete_objects"]["count"] == 2
+        assert [name for name, _ in AwsS3.list_objects("")] == ["staging/profile/user1/abc"]
+    AwsS3.backend = None